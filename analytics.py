@@ -0,0 +1,314 @@
+"""Download analytics for episode audio (``--enable-analytics`` / ENABLE_ANALYTICS=1).
+
+The media route only appends a raw tuple to an in-memory deque
+(:meth:`DownloadRecorder.record`, no locking, no I/O, no parsing); a
+background thread drains it every ANALYTICS_FLUSH_INTERVAL seconds and
+applies the batch to SQLite (``data/analytics.db``, ANALYTICS_DB) in one
+transaction, so recording costs a request nothing measurable.
+
+Counting follows the IAB Podcast Measurement guidelines in simplified form:
+
+* requests are grouped into sessions per episode and client (hash of IP +
+  User-Agent; raw addresses are never stored) over a 24 hour window;
+* a session's bytes are the union of the byte ranges it requested, so
+  players that re-request or overlap ranges are not counted twice;
+* a session counts as one download once it has covered ANALYTICS_MIN_BYTES
+  (about one minute of audio) or the whole file if that is smaller;
+* requests from well-known bots and crawlers are ignored.
+
+Results are rolled up per day (UTC day of the session start) and episode
+in ``daily_downloads``; sessions older than two windows are pruned.
+"""
+from __future__ import annotations
+
+import atexit
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_DB_PATH = Path(os.getenv("ANALYTICS_DB", BASE_DIR / "data" / "analytics.db"))
+FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "5"))
+# Events kept in memory between flushes; the oldest are dropped beyond this
+BUFFER_SIZE = int(os.getenv("ANALYTICS_BUFFER_SIZE", "100000"))
+SESSION_WINDOW = 24 * 3600
+# ~1 minute of 128 kbps audio
+MIN_BYTES = int(os.getenv("ANALYTICS_MIN_BYTES", "960000"))
+MAX_ROLLUP_ROWS = 10000
+
+BOT_UA_RE = re.compile(r"bot|crawl|spider|slurp|facebookexternalhit|preview|monitor|uptime|curl|wget|python-requests", re.I)
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/")
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS download_sessions (
+    id         INTEGER PRIMARY KEY,
+    show_id    TEXT NOT NULL,
+    episode_id TEXT NOT NULL,
+    client     TEXT NOT NULL,           -- hash of IP + User-Agent
+    first_ts   REAL NOT NULL,
+    last_ts    REAL NOT NULL,
+    size       INTEGER NOT NULL,        -- file size at the first request
+    ranges     TEXT NOT NULL,           -- merged [start, end) byte ranges requested, JSON
+    bytes      INTEGER NOT NULL,        -- total length of ranges
+    counted    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS download_sessions_by_client ON download_sessions (show_id, episode_id, client, first_ts);
+CREATE INDEX IF NOT EXISTS download_sessions_by_last ON download_sessions (last_ts);
+CREATE TABLE IF NOT EXISTS daily_downloads (
+    day        TEXT NOT NULL,           -- YYYY-MM-DD (UTC)
+    show_id    TEXT NOT NULL,
+    episode_id TEXT NOT NULL,
+    downloads  INTEGER NOT NULL DEFAULT 0,  -- deduplicated sessions
+    requests   INTEGER NOT NULL DEFAULT 0,  -- media requests, including ranges
+    bytes      INTEGER NOT NULL DEFAULT 0,  -- distinct bytes requested
+    PRIMARY KEY (day, show_id, episode_id)
+);
+"""
+
+
+def client_key(ip: str, user_agent: str) -> str:
+    return hashlib.sha1(f"{ip}\0{user_agent}".encode("utf-8", "replace")).hexdigest()[:20]
+
+
+def requested_range(status: int, content_range: Optional[str], content_length: Optional[str],
+                    range_header: Optional[str], size: int) -> Optional[tuple]:
+    """``(start, end)`` of the bytes answered by a media response, ``None`` if no body.
+
+    Uses ``Content-Range``/``Content-Length`` when the app sent the file; a
+    *content_length* of ``None`` means a proxy sends it (MEDIA_OFFLOAD), and
+    then the request's ``Range`` header is resolved against *size*.
+    """
+    if status == 206:
+        m = _CONTENT_RANGE_RE.match(content_range or "")
+        return (int(m.group(1)), int(m.group(2)) + 1) if m else None
+    if status != 200:
+        return None
+    if content_length is not None:
+        return (0, int(content_length)) if int(content_length) > 0 else None
+    m = _RANGE_RE.match((range_header or "").strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return (0, size) if size else None
+    if not m.group(1):
+        start, end = max(0, size - int(m.group(2))), size
+    else:
+        start = int(m.group(1))
+        end = min(size, int(m.group(2)) + 1) if m.group(2) else size
+    return (start, end) if start < end else None
+
+
+def merge_ranges(ranges: List[list], new: tuple) -> List[list]:
+    """Insert ``[start, end)`` into sorted, non-overlapping *ranges*."""
+    start, end = new
+    merged = []
+    for s, e in ranges:
+        if e < start or s > end:
+            merged.append([s, e])
+        else:
+            start, end = min(s, start), max(e, end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+
+class DownloadRecorder:
+    """In-memory buffer of media requests plus the thread that flushes it."""
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH, shows_dir: Path = BASE_DIR / "shows",
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.db_path = Path(db_path)
+        self.shows_dir = Path(shows_dir)
+        self.flush_interval = flush_interval
+        self._events: deque = deque(maxlen=BUFFER_SIZE)
+        self._flush_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # -- request path -------------------------------------------------
+    def record(self, show_id: str, ep_id: str, filename: str, ip: str, user_agent: str, status: int,
+               content_range: Optional[str], content_length: Optional[str], range_header: Optional[str]) -> None:
+        """Buffer one media response; everything else happens in the flush thread.
+
+        Pass ``content_length=None`` when the body is sent by a proxy.
+        """
+        self._events.append((time.time(), show_id, ep_id, filename, ip, user_agent, status,
+                             content_range, content_length, range_header))
+
+    # -- background flushing -------------------------------------------
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="analytics-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as exc:  # keep the thread alive, retry next interval
+                logger.error("Analytics flush failed: %s", exc)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def flush(self) -> int:
+        """Apply every buffered event to the database; returns how many were applied.
+
+        Events are grouped by episode and client first, so the many range
+        requests of one playback cost one session read and write per batch.
+        """
+        with self._flush_lock:
+            batch = []
+            while self._events:
+                batch.append(self._events.popleft())
+            if not batch:
+                return 0
+            hits: Dict[tuple, list] = {}
+            for event in batch:
+                parsed = self._parse(*event)
+                if parsed is not None:
+                    hits.setdefault(parsed[0], []).append(parsed[1])
+            rollups: Dict[tuple, list] = {}
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, requests in hits.items():
+                    self._apply(conn, key, requests, rollups)
+                conn.executemany(
+                    "INSERT INTO daily_downloads (day, show_id, episode_id, downloads, requests, bytes)"
+                    " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (day, show_id, episode_id) DO UPDATE SET"
+                    " downloads = downloads + excluded.downloads, requests = requests + excluded.requests,"
+                    " bytes = bytes + excluded.bytes",
+                    [(*key, *counts) for key, counts in rollups.items()],
+                )
+                conn.execute("DELETE FROM download_sessions WHERE last_ts < ?", (time.time() - 2 * SESSION_WINDOW,))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return len(batch)
+
+    def _parse(self, ts: float, show_id: str, ep_id: str, filename: str, ip: str, user_agent: str, status: int,
+               content_range, content_length, range_header) -> Optional[tuple]:
+        """``((show_id, ep_id, client), (ts, span, size))`` of a countable event, else ``None``."""
+        if BOT_UA_RE.search(user_agent or ""):
+            return None
+        complete = (content_range or "").rpartition("/")[2]
+        if complete.isdigit():
+            size = int(complete)
+        else:
+            try:
+                size = (self.shows_dir / show_id / "episodes" / ep_id / filename).stat().st_size
+            except OSError:
+                size = int(content_length or 0)
+        span = requested_range(status, content_range, content_length, range_header, size)
+        if span is None:
+            return None
+        return (show_id, ep_id, client_key(ip or "", user_agent or "")), (ts, span, size)
+
+    def _apply(self, conn: sqlite3.Connection, key: tuple, requests: list, rollups: Dict[tuple, list]) -> None:
+        """Merge one client's requests for one episode into its session(s) and the day's counters."""
+        session = None
+        for ts, span, size in requests:
+            if session is None or ts - session["first_ts"] >= SESSION_WINDOW:
+                if session is not None:
+                    self._save_session(conn, key, session)
+                session = self._load_session(conn, key, ts) or {
+                    "id": None, "first_ts": ts, "size": size, "ranges": [], "bytes": 0, "counted": 0,
+                }
+            before = session["bytes"]
+            session["ranges"] = merge_ranges(session["ranges"], span)
+            session["bytes"] = sum(e - s for s, e in session["ranges"])
+            session["last_ts"] = ts
+            newly_counted = not session["counted"] and session["bytes"] >= min(MIN_BYTES, session["size"] or MIN_BYTES)
+            if newly_counted:
+                session["counted"] = 1
+            day = datetime.datetime.fromtimestamp(session["first_ts"], tz=datetime.timezone.utc).strftime("%Y-%m-%d")
+            counts = rollups.setdefault((day, key[0], key[1]), [0, 0, 0])
+            counts[0] += int(newly_counted)
+            counts[1] += 1
+            counts[2] += session["bytes"] - before
+        self._save_session(conn, key, session)
+
+    @staticmethod
+    def _load_session(conn: sqlite3.Connection, key: tuple, ts: float) -> Optional[dict]:
+        row = conn.execute(
+            "SELECT id, first_ts, size, ranges, bytes, counted FROM download_sessions"
+            " WHERE show_id = ? AND episode_id = ? AND client = ? AND first_ts > ? ORDER BY first_ts DESC LIMIT 1",
+            (*key, ts - SESSION_WINDOW),
+        ).fetchone()
+        if row is None:
+            return None
+        session = dict(row)
+        session["ranges"] = json.loads(session["ranges"])
+        return session
+
+    @staticmethod
+    def _save_session(conn: sqlite3.Connection, key: tuple, session: dict) -> None:
+        ranges = json.dumps(session["ranges"], separators=(",", ":"))
+        if session["id"] is None:
+            conn.execute(
+                "INSERT INTO download_sessions (show_id, episode_id, client, first_ts, last_ts, size, ranges, bytes, counted)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, session["first_ts"], session["last_ts"], session["size"], ranges, session["bytes"], session["counted"]),
+            )
+        else:
+            conn.execute(
+                "UPDATE download_sessions SET last_ts = ?, ranges = ?, bytes = ?, counted = ? WHERE id = ?",
+                (session["last_ts"], ranges, session["bytes"], session["counted"], session["id"]),
+            )
+
+    # -- queries ------------------------------------------------------
+    def daily(self, show_id: Optional[str] = None, ep_id: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None) -> List[dict]:
+        """Daily rollups, newest day first; *since*/*until* are inclusive ``YYYY-MM-DD``."""
+        self.flush()
+        sql = "SELECT * FROM daily_downloads WHERE 1 = 1"
+        args: list = []
+        for column, op, value in (("show_id", "=", show_id), ("episode_id", "=", ep_id),
+                                  ("day", ">=", since), ("day", "<=", until)):
+            if value:
+                sql += f" AND {column} {op} ?"
+                args.append(value)
+        sql += " ORDER BY day DESC, show_id, episode_id LIMIT ?"
+        args.append(MAX_ROLLUP_ROWS)
+        with self._flush_lock:
+            return [dict(r) for r in self._db().execute(sql, args).fetchall()]
+
+
+_default: Optional[DownloadRecorder] = None
+_default_lock = threading.Lock()
+
+
+def start_recorder() -> DownloadRecorder:
+    """Create the process-wide recorder (``ANALYTICS_DB``) and start its flush thread.
+
+    Called once at startup; request handlers keep the returned object and
+    call :meth:`DownloadRecorder.record` on it directly, without locking.
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = DownloadRecorder()
+            _default.start()
+        return _default
@@ -5,8 +5,11 @@ Run with:
 
 By default listens on port 5000.
 """
+from datetime import datetime, timezone
 from pathlib import Path
+from urllib.parse import quote
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, send_file, abort, session
+from markupsafe import escape
 import logging
 import json
 import math
@@ -14,6 +17,7 @@ import shutil
 import threading
 import subprocess
 import hashlib
+import mimetypes
 import time
 import traceback
 from utils import (
@@ -28,6 +32,36 @@ from utils import (
     has_id3v2_tags,
     embed_id3_metadata_mp3,
 )
+from feed_cache import (
+    ALL_SHOWS,
+    ENCODINGS as FEED_ENCODINGS,
+    ArchivePageIndex,
+    FeedCache,
+    FeedEntry,
+    FragmentCache,
+    file_fingerprint,
+    show_fingerprint,
+    summaries_fingerprint,
+    variant_etag,
+)
+from feed_render import FEED_FORMAT_VERSION, NETWORK_FEED_PATH, FeedPageNotFound, archive_page_fingerprints, iter_network_feed, iter_show_feed, media_file_url, paged_feed_enabled
+from fingerprint import media_fingerprint
+from scanner import AUDIO_EXTS, COVER_EXTS, scan_dir
+from thumbnails import THUMB_FORMATS, THUMB_SIZES, is_thumbnailable, negotiate_format, placeholder, thumbnail
+from analytics import start_recorder
+from catalog import SNIPPET_END, SNIPPET_START, get_catalog
+from json_cache import load_json
+from media_send import file_response
+from metadata_store import (
+    delete_episode_meta,
+    has_episode_meta,
+    read_episode_meta,
+    remove_lock_file,
+    update_episode_meta,
+    update_json,
+    write_episode_meta,
+    write_json,
+)
 
 # Initialize Flask app
 app = Flask(__name__, static_folder="static", template_folder="templates")
@@ -69,6 +103,90 @@ UPLOADS_DIR.mkdir(exist_ok=True)
 # Chunk size - 10MB is below Cloudflare limit (100MB)
 CHUNK_SIZE = 10 * 1024 * 1024  # 10MB in bytes
 
+# Media downloads can be handed to the front proxy after the checks in Flask:
+# "" (Flask sends the file itself), "x-accel" (nginx X-Accel-Redirect) or
+# "x-sendfile" (Apache mod_xsendfile / lighttpd X-Sendfile)
+MEDIA_OFFLOAD = os.getenv("MEDIA_OFFLOAD", "").strip().lower()
+# nginx "internal" location that aliases SHOWS_DIR (only used by x-accel)
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/_media/")
+if MEDIA_OFFLOAD not in ("", "x-accel", "x-sendfile"):
+    app.logger.error("Unknown MEDIA_OFFLOAD=%r, media is served by Flask", MEDIA_OFFLOAD)
+    MEDIA_OFFLOAD = ""
+# Without a proxy, full and byte-range bodies are written with os.sendfile
+# (media_send.py); MEDIA_SENDFILE=0 falls back to Flask's send_file
+MEDIA_SENDFILE = os.getenv("MEDIA_SENDFILE", "1") != "0"
+# Audio and covers are linked as /media/<content fingerprint>/...; such a URL
+# never changes its content, so browsers and CDNs may keep it for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Old /shows/... URLs redirect to the current fingerprinted URL; the redirect
+# itself changes with the file, so it is cached only briefly
+MEDIA_REDIRECT_MAX_AGE = int(os.getenv("MEDIA_REDIRECT_MAX_AGE", "300"))
+# Episode download analytics (analytics.py): ENABLE_ANALYTICS=1 or
+# `python app.py --enable-analytics`
+ENABLE_ANALYTICS = os.getenv("ENABLE_ANALYTICS", "0") == "1"
+# Trusted proxies in front of the app whose X-Forwarded-For is used as the
+# client address for analytics (0 = the socket peer)
+ANALYTICS_PROXY_HOPS = int(os.getenv("ANALYTICS_PROXY_HOPS", "0"))
+
+# Rendered RSS feeds: how long (seconds) a cached feed is served before its
+# inputs are re-checked in the background
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "30"))
+feed_cache = FeedCache(ttl=FEED_CACHE_TTL, version=FEED_FORMAT_VERSION)
+# Archive pages of paged feeds.  Deliberately bounded and not "immutable":
+# page membership is counted from the oldest episode, so deleting or
+# re-dating an episode shifts later pages; the per-page ETag revalidates them
+FEED_ARCHIVE_MAX_AGE = int(os.getenv("FEED_ARCHIVE_MAX_AGE", "86400"))
+# Shows with at least this many episodes are streamed instead of cached whole (0 = never)
+FEED_STREAM_MIN_EPISODES = int(os.getenv("FEED_STREAM_MIN_EPISODES", "2000"))
+# Merged feed of all shows (NETWORK_FEED_PATH): newest N episodes network-wide
+NETWORK_FEED_LIMIT = int(os.getenv("NETWORK_FEED_LIMIT", "100"))
+NETWORK_FEED_TITLE = os.getenv("NETWORK_FEED_TITLE", "Все подкасты")
+NETWORK_FEED_DESCRIPTION = os.getenv("NETWORK_FEED_DESCRIPTION", "")
+# Episodes rendered server-side on the show page; the rest is loaded on scroll
+EPISODES_PAGE_SIZE = int(os.getenv("EPISODES_PAGE_SIZE", "30"))
+# Per-episode <item> fragments, so a rebuild only re-renders changed episodes
+feed_fragments = FragmentCache(max_entries=int(os.getenv("FEED_FRAGMENT_CACHE_SIZE", "50000")))
+# Validators of archive feed pages, computed once per show change for all pages
+archive_pages = ArchivePageIndex(ttl=FEED_CACHE_TTL)
+
+# SQLite index of shows/episodes used by listings (see catalog.py); built from
+# disk on first start, afterwards kept in sync by show_changed()
+catalog = get_catalog()
+try:
+    catalog.ensure_ready()
+except Exception as exc:
+    app.logger.error("Catalog initialisation failed: %s", exc, exc_info=True)
+
+# Download analytics recorder, created once here (or by --enable-analytics in
+# __main__) so the media route only reads this global; None while disabled
+download_recorder = start_recorder() if ENABLE_ANALYTICS else None
+
+
+def show_changed(show_id: str, ep_id: str | None = None, action: str = "update", detail: str | None = None) -> None:
+    """Call after writing a show's (or one episode's) files.
+
+    Refreshes the catalog rows, marks the show's cached feeds stale and
+    appends *action* (create | update | delete | media) to the change journal
+    read by ``/api/changes``.
+    """
+    feed_cache.invalidate(show_id)
+    archive_pages.invalidate(show_id)
+    try:
+        if ep_id is None:
+            catalog.sync_show(show_id)
+        else:
+            catalog.sync_episode(show_id, ep_id)
+    except Exception as exc:
+        app.logger.error("Catalog sync failed for %s/%s: %s", show_id, ep_id or "", exc)
+    record_change(show_id, ep_id, action, detail)
+
+
+def record_change(show_id: str, ep_id: str | None, action: str, detail: str | None = None) -> None:
+    try:
+        catalog.record_change(show_id, ep_id, action, detail)
+    except Exception as exc:
+        app.logger.error("Change journal write failed for %s/%s: %s", show_id, ep_id or "", exc)
+
 # --- Simple genre → Apple/Spotify category mapping ---
 # Base mapping hard-coded for most common cases. Keys are raw strings (any case).
 _BASE_GENRE_CATEGORY_MAP: dict[str, tuple[str, str | None]] = {
@@ -102,8 +220,7 @@ for k, v in _BASE_GENRE_CATEGORY_MAP.items():
 # 2) JSON mapping (overrides / extends)
 if MAPPING_JSON_PATH.exists():
     try:
-        with MAPPING_JSON_PATH.open("r", encoding="utf-8") as fh:
-            _json_map = json.load(fh)
+        _json_map = load_json(MAPPING_JSON_PATH)
         for k, v in _json_map.items():
             cat = v.get("category")
             sub = v.get("subcategory")
@@ -124,26 +241,185 @@ def map_genre_to_category(genre: str) -> tuple[str | None, str | None]:
 # How long to keep temp uploads (in seconds)
 TEMP_UPLOAD_TTL = 24 * 60 * 60  # 24 hours
 
+def negotiate_feed_encoding() -> str | None:
+    """Pick the pre-compressed feed variant that best fits Accept-Encoding.
+
+    Returns ``None`` for the uncompressed (identity) body.
+    """
+    best = request.accept_encodings.best_match((*FEED_ENCODINGS, "identity"))
+    return None if best in (None, "identity") else best
+
+
+def send_cached_feed(entry: FeedEntry, mimetype: str, cache_control: str = 'public, max-age=0'):
+    """Build a conditional response for a cached feed in the negotiated encoding."""
+    from flask import Response
+
+    encoding = negotiate_feed_encoding()
+    body = entry.variants.get(encoding) if encoding else None
+    if body is None:
+        encoding, body = None, entry.body
+    response = Response(body, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(variant_etag(entry.etag, encoding))
+    response.last_modified = entry.fingerprint.last_modified
+    response.headers.setdefault('Cache-Control', cache_control)
+    # make_conditional turns matching If-None-Match / If-Modified-Since
+    # requests into bodiless 304s
+    return response.make_conditional(request)
+
+
 @app.route("/feed.xml")
 def feed():
     """Serve the generated RSS feed."""
     feed_path = BASE_DIR / "feed.xml"
     if not feed_path.exists():
         abort(404, "feed.xml not found. Run publisher.py first.")
-    return send_from_directory(str(BASE_DIR), "feed.xml", mimetype="application/rss+xml")
+    entry = feed_cache.get(
+        ("/feed.xml",),
+        lambda: file_fingerprint(feed_path),
+        lambda fp: feed_path.read_bytes(),
+    )
+    return send_cached_feed(entry, "application/rss+xml")
+
+
+def resolve_media_path(base_dir: Path, filename: str) -> Path:
+    """Resolve *filename* inside *base_dir* (a show or episode directory).
+
+    Aborts with 403 if the result escapes *base_dir* or SHOWS_DIR (``..``,
+    symlinks) and with 404 if it is not an existing regular file.
+    """
+    shows_root = SHOWS_DIR.resolve()
+    base = base_dir.resolve()
+    target = (base / filename).resolve()
+    if not (base.is_relative_to(shows_root) and target.is_relative_to(base)):
+        abort(403)
+    if not target.is_file():
+        abort(404)
+    return target
+
+
+def send_media(path: Path, mimetype: str | None = None):
+    """Send a file returned by :func:`resolve_media_path`.
+
+    With MEDIA_OFFLOAD set, only headers are returned and the proxy streams
+    the file (including Range requests and validators), so no worker is held
+    for the duration of the download.
+    """
+    from flask import Response
+
+    if MEDIA_OFFLOAD:
+        response = Response(mimetype=mimetype or mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+        if MEDIA_OFFLOAD == "x-accel":
+            rel = path.relative_to(SHOWS_DIR.resolve()).as_posix()
+            response.headers["X-Accel-Redirect"] = MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + quote(rel)
+        else:
+            response.headers["X-Sendfile"] = str(path)
+        response.headers["Accept-Ranges"] = "bytes"
+        return response
+
+    if MEDIA_SENDFILE:
+        return file_response(request.environ, path, mimetype)
+
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    # Explicitly add Accept-Ranges header so validators that only perform a
+    # HEAD request without a Range header can still detect byte-range support.
+    response.headers.setdefault("Accept-Ranges", "bytes")
+    return response
+
+
+def _media_url(show_id: str, filename: str) -> str:
+    """Fingerprinted URL of *filename* inside the show directory (plain URL if unreadable)."""
+    try:
+        return media_file_url(show_id, filename, media_fingerprint(SHOWS_DIR / show_id / filename))
+    except OSError:
+        return url_for('show_file', show_id=show_id, filename=filename)
+
+
+def _is_fingerprinted(path: Path) -> bool:
+    """Audio and covers are linked by fingerprint; other files keep their plain URLs."""
+    return path.suffix.lower() in AUDIO_EXTS + COVER_EXTS
+
+
+def _media_redirect(url: str):
+    response = redirect(url)
+    response.headers['Cache-Control'] = f'public, max-age={MEDIA_REDIRECT_MAX_AGE}'
+    return response
+
+
+@app.route("/media/<fingerprint>/<show_id>/<path:filename>")
+def media_file(fingerprint: str, show_id: str, filename: str):
+    """Serve a show or episode file under its content fingerprint.
+
+    The response is immutable; if the file was replaced since the URL was
+    issued, redirect to the URL of the current content instead.
+    """
+    path = resolve_media_path(SHOWS_DIR / show_id, filename)
+    current = media_fingerprint(path)
+    if fingerprint != current:
+        return _media_redirect(media_file_url(show_id, filename, current))
+    response = send_media(path, 'audio/mpeg' if path.suffix.lower() == '.mp3' else None)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    if download_recorder is not None and request.method == 'GET' and path.suffix.lower() in AUDIO_EXTS:
+        _record_download(show_id, filename, response)
+    return response
+
+
+def _record_download(show_id: str, filename: str, response) -> None:
+    """Buffer a download of episode audio for analytics (no I/O on this path)."""
+    parts = filename.split('/')
+    if len(parts) != 3 or parts[0] != 'episodes':
+        return
+    route = request.access_route
+    ip = route[-min(ANALYTICS_PROXY_HOPS, len(route))] if ANALYTICS_PROXY_HOPS and route else request.remote_addr
+    download_recorder.record(
+        show_id, parts[1], parts[2], ip or '', request.user_agent.string, response.status_code,
+        response.headers.get('Content-Range'),
+        None if MEDIA_OFFLOAD else response.headers.get('Content-Length'),
+        request.headers.get('Range'),
+    )
+
+
+@app.route("/thumbs/<fingerprint>/<int:size>/<show_id>/<path:filename>")
+def thumb_file(fingerprint: str, size: int, show_id: str, filename: str):
+    """Cover thumbnail in the best format the client accepts (AVIF, WebP or JPEG).
+
+    Immutable like :func:`media_file`; the format depends on ``Accept``, so
+    responses carry ``Vary: Accept``.
+    """
+    if size not in THUMB_SIZES:
+        abort(404)
+    path = resolve_media_path(SHOWS_DIR / show_id, filename)
+    if not is_thumbnailable(path.name):
+        abort(404)
+    current = media_fingerprint(path)
+    if fingerprint != current:
+        return _media_redirect(url_for('thumb_file', fingerprint=current, size=size, show_id=show_id, filename=filename))
+    fmt = negotiate_format(request.accept_mimetypes)
+    try:
+        thumb = thumbnail(path, current, size, fmt)
+    except Exception as exc:
+        app.logger.error("Cannot render %d px thumbnail of %s: %s", size, path, exc)
+        return _media_redirect(media_file_url(show_id, filename, current))
+    response = file_response(request.environ, thumb, THUMB_FORMATS[fmt][0])
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.headers['Vary'] = 'Accept'
+    return response
 
 
 @app.route("/shows/<show_id>/episodes/<ep_id>/<path:filename>")
 def episode_file(show_id: str, ep_id: str, filename: str):
     """Serve episode media files with correct mime type."""
-    ep_dir = SHOWS_DIR / show_id / "episodes" / ep_id
+    path = resolve_media_path(SHOWS_DIR / show_id / "episodes" / ep_id, filename)
+    if _is_fingerprinted(path):
+        # Old (?v=<mtime>) and plain links keep working
+        return _media_redirect(media_file_url(show_id, f"episodes/{ep_id}/{filename}", media_fingerprint(path)))
     # Определяем mime-type по расширению
     mimetype = None
     if filename.lower().endswith('.mp3'):
         mimetype = 'audio/mpeg'
-    response = send_from_directory(ep_dir, filename, mimetype=mimetype, conditional=True)
-    response.headers.setdefault("Accept-Ranges", "bytes")
-    return response
+    return send_media(path, mimetype)
 
 
 @app.route("/shows/<show_id>/episodes/<ep_id>/browse")
@@ -154,10 +430,9 @@ def browse_episode_files(show_id: str, ep_id: str):
         abort(404, "Episode directory not found")
 
     file_links = []
-    for file in sorted(ep_dir.iterdir()):
-        if file.is_file():
-            link = url_for('episode_file', show_id=show_id, ep_id=ep_id, filename=file.name)
-            file_links.append((file.name, link))
+    for name in scan_dir(ep_dir).files:
+        link = url_for('episode_file', show_id=show_id, ep_id=ep_id, filename=name)
+        file_links.append((name, link))
 
     # Build minimal HTML response
     html_parts = [
@@ -181,32 +456,19 @@ def assets(filename: str):
 def index():
     shows = []
     languages = set()
-    for show_dir in sorted((SHOWS_DIR).iterdir()):
-        if not show_dir.is_dir():
-            continue
-        config_path = show_dir / "config.json"
-        if not config_path.exists():
-            continue
-        with config_path.open("r", encoding="utf-8") as f:
-            cfg = json.load(f)
-        # Найти первую картинку любого поддерживаемого формата с любым именем
-        cover = None
-        image_exts = ("png", "jpg", "jpeg", "webp", "gif", "bmp", "svg", "ico")
-        for file in show_dir.iterdir():
-            if file.is_file() and not file.name.startswith('.') and file.suffix.lower().lstrip('.') in image_exts:
-                cover = f"/shows/{show_dir.name}/{file.name}"
-                break
-        if not cover:
-            cover = "/assets/default_cover.png"
-        lang = cfg.get("language", "")
+    # Сводки шоу из каталога: ни config.json, ни каталоги шоу здесь не читаются
+    for row in catalog.list_show_summaries():
+        lang = row["language"]
         if lang:
             languages.add(lang)
         shows.append({
-            "id": show_dir.name,
-            "title": cfg.get("title", show_dir.name),
-            "description": cfg.get("description", ""),
-            "image": cover,
-            "language": lang
+            "id": row["id"],
+            "title": row["title"],
+            "description": row["description"],
+            "image": _show_cover_url(row),
+            "thumbs": _cover_thumbs(row["id"], row["cover"]),
+            "language": lang,
+            "episode_count": row["episode_count"],
         })
     return render_template("show_list.html", shows=shows, languages=sorted(languages))
 
@@ -244,11 +506,11 @@ def new_show():
                 "type": request.form.get("type", "episodic") or "episodic",
                 "image": "cover.png" if image else "",
             }
-            with (show_dir / "config.json").open("w", encoding="utf-8") as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            write_json(show_dir / "config.json", config)
             if image:
                 ext = image.filename.split('.')[-1].lower()
                 image.save(str(show_dir / f"cover.{ext}"))
+            show_changed(show_id, action="create")
             flash("Шоу успешно создано! Теперь добавьте эпизоды.", "success")
             return redirect(url_for("show_page", show_id=show_id))
     # Подстраховка для шаблона new_show.html (чтобы всегда были поля)
@@ -264,53 +526,50 @@ def inline_edit_show(show_id):
     data = request.get_json(force=True)
     allowed = {"title", "description"}
     updated = None
-    with config_path.open("r+", encoding="utf-8") as f:
-        cfg = json.load(f)
-        for field in allowed:
-            if field in data:
-                value = str(data[field]).strip()
-                if field == "title" and len(value) > 75:
-                    return jsonify({"error": "Title too long (максимум 75 символов)"}), 400
-                if field == "description" and len(value) > 600:
-                    return jsonify({"error": "Description too long (максимум 600 символов)"}), 400
-                if field == "description":
-                    value = sanitize_html_for_rss(plain_text_to_html(value.strip()))
-                cfg[field] = value
-                updated = field
-        if not updated:
-            return jsonify({"error": "No valid field"}), 400
-        f.seek(0)
-        json.dump(cfg, f, ensure_ascii=False, indent=2)
-        f.truncate()
+    changes = {}
+    for field in allowed:
+        if field in data:
+            value = str(data[field]).strip()
+            if field == "title" and len(value) > 75:
+                return jsonify({"error": "Title too long (максимум 75 символов)"}), 400
+            if field == "description" and len(value) > 600:
+                return jsonify({"error": "Description too long (максимум 600 символов)"}), 400
+            if field == "description":
+                value = sanitize_html_for_rss(plain_text_to_html(value.strip()))
+            changes[field] = value
+            updated = field
+    if not updated:
+        return jsonify({"error": "No valid field"}), 400
+    with update_json(config_path) as cfg:
+        cfg.update(changes)
+    show_changed(show_id)
     return jsonify({updated: cfg[updated]})
 
 @app.route("/shows/<show_id>/episodes/<ep_id>/inline-edit", methods=["PATCH"])
 def inline_edit_episode(show_id, ep_id):
     ep_dir = SHOWS_DIR / show_id / "episodes" / ep_id
-    meta_path = ep_dir / "metadata.json"
-    if not meta_path.exists():
+    if not has_episode_meta(ep_dir):
         return jsonify({"error": "Episode not found"}), 404
     data = request.get_json(force=True)
     allowed = {"title", "description"}
     updated = None
-    with meta_path.open("r+", encoding="utf-8") as f:
-        meta = json.load(f)
-        for field in allowed:
-            if field in data:
-                value = str(data[field]).strip()
-                if field == "title" and len(value) > 120:
-                    return jsonify({"error": "Title too long (максимум 120 символов)"}), 400
-                if field == "description" and len(value) > 4000:
-                    return jsonify({"error": "Description too long (максимум 4000 символов)"}), 400
-                if field == "description":
-                    value = sanitize_html_for_rss(plain_text_to_html(value.strip()))
-                meta[field] = value
-                updated = field
-        if not updated:
-            return jsonify({"error": "No valid field"}), 400
-        f.seek(0)
-        json.dump(meta, f, ensure_ascii=False, indent=2)
-        f.truncate()
+    changes = {}
+    for field in allowed:
+        if field in data:
+            value = str(data[field]).strip()
+            if field == "title" and len(value) > 120:
+                return jsonify({"error": "Title too long (максимум 120 символов)"}), 400
+            if field == "description" and len(value) > 4000:
+                return jsonify({"error": "Description too long (максимум 4000 символов)"}), 400
+            if field == "description":
+                value = sanitize_html_for_rss(plain_text_to_html(value.strip()))
+            changes[field] = value
+            updated = field
+    if not updated:
+        return jsonify({"error": "No valid field"}), 400
+    with update_episode_meta(ep_dir) as meta:
+        meta.update(changes)
+    show_changed(show_id, ep_id)
     return jsonify({updated: meta[updated]})
 
 @app.route("/shows/<show_id>/", methods=["GET", "POST"])
@@ -323,8 +582,7 @@ def show_page(show_id):
     if request.method == "POST":
         # This part handles the form submission for updating show metadata
         fields = ["title", "author", "owner_email", "owner_name", "explicit", "summary", "description", "category", "category_main", "category_sub", "type", "copyright", "subtitle", "ttl"]
-        with config_path.open("r+", encoding="utf-8") as f:
-            cfg = json.load(f)
+        with update_json(config_path) as cfg:
             for field in fields:
                 if field in request.form:
                     val = request.form.get(field, "")
@@ -339,91 +597,162 @@ def show_page(show_id):
                     cfg["ttl"] = int(request.form.get("ttl"))
                 except (ValueError, TypeError):
                     cfg["ttl"] = 60 # Default value
-            f.seek(0)
-            json.dump(cfg, f, ensure_ascii=False, indent=2)
-            f.truncate()
+        show_changed(show_id)
         flash("Метаданные RSS успешно сохранены!", "success")
         return redirect(url_for("show_page", show_id=show_id))
 
-    # This part handles displaying the page
-    with config_path.open("r", encoding="utf-8") as f:
-        cfg = json.load(f)
+    # This part handles displaying the page (данные берутся из каталога)
+    show_row = catalog.get_show(show_id)
+    if show_row is None:
+        # Шоу появилось на диске в обход веб-интерфейса — добавляем в каталог
+        catalog.sync_show_tree(show_id)
+        show_row = catalog.get_show(show_id)
+        if show_row is None:
+            abort(404)
+    cfg = dict(show_row["config"])  # объект из каталога общий, не меняем его
 
     # Сначала найдем обложку шоу, она может понадобиться для эпизодов
-    cover_image_url = None
-    image_exts = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp", ".svg", ".ico")
-    for file in show_dir.iterdir():
-        if file.is_file() and file.suffix.lower() in image_exts:
-            mtime = int(file.stat().st_mtime)
-            cover_image_url = url_for('show_file', show_id=show_id, filename=file.name, file_type='cover') + f'?v={mtime}'
-            break
-    if not cover_image_url:
-        cover_image_url = '/assets/default_cover.png'
-
-    episodes_dir = show_dir / "episodes"
-    episodes = []
-    if episodes_dir.exists():
-        for ep_dir in sorted(episodes_dir.iterdir(), key=lambda p: p.stat().st_mtime, reverse=True):
-            if not (ep_dir.is_dir() and (ep_dir / "metadata.json").exists()):
-                continue
-
-            with (ep_dir / "metadata.json").open("r", encoding="utf-8") as f:
-                meta = json.load(f)
+    cover_image_url = _show_cover_url(show_row)
+    cover_thumbs = _cover_thumbs(show_id, show_row["cover"])
 
-            # Найти картинку эпизода
-            episode_image = None
-            for file in ep_dir.iterdir():
-                if file.is_file() and file.suffix.lower() in image_exts:
-                    mtime = int(file.stat().st_mtime)
-                    episode_image = f"/shows/{show_id}/episodes/{ep_dir.name}/{file.name}?v={mtime}"
-                    break
-            
-            # Если у эпизода нет своей картинки, используем обложку шоу
-            if not episode_image:
-                episode_image = cover_image_url if cover_image_url else '/assets/default_cover.png'
-            # Если обложки всё ещё нет, используем заглушку (но cover_image_url уже подстрахован выше)
-
-            episodes.append({
-                'id': ep_dir.name,
-                'title': meta.get('title', 'Без названия'),
-                'description': meta.get('description', ''),
-                'image': episode_image
-            })
+    # Первая страница эпизодов (новые по mtime каталога эпизода первыми),
+    # остальные страницы догружаются при прокрутке через /api/shows/<id>/episodes
+    page, next_cursor = catalog.page_episodes(show_id, sort="mtime", limit=EPISODES_PAGE_SIZE)
+    episodes = [_episode_list_item(show_id, ep, cover_image_url, cover_thumbs) for ep in page]
 
-    shows_list = []
-    image_exts = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp", ".svg", ".ico")
-    for sdir in sorted(SHOWS_DIR.iterdir()):
-        if sdir.is_dir() and (sdir / "config.json").exists():
-            with (sdir / "config.json").open("r", encoding="utf-8") as f:
-                scfg = json.load(f)
-            show_image = None
-            for file in sdir.iterdir():
-                if file.is_file() and file.suffix.lower() in image_exts:
-                    show_image = url_for('show_file', show_id=sdir.name, filename=file.name, file_type='cover')
-                    break
-            if not show_image:
-                show_image = '/assets/default_cover.png'
-            shows_list.append({"id": sdir.name, "title": scfg.get("title", sdir.name), "image": show_image})
+    shows_list = [
+        {"id": row["id"], "title": row["title"], "image": _show_cover_url(row), "thumbs": _cover_thumbs(row["id"], row["cover"])}
+        for row in catalog.list_show_summaries()
+    ]
 
     # Подстраховка для legacy-шоу: всегда передавать category_main и category_sub
     if "category_main" not in cfg:
         cfg["category_main"] = ""
     if "category_sub" not in cfg:
         cfg["category_sub"] = ""
-    return render_template("show.html", show=cfg, episodes=episodes, cover=cover_image_url, show_id=show_id, shows_list=shows_list)
+    return render_template("show.html", show=cfg, episodes=episodes, next_cursor=next_cursor, cover=cover_image_url, cover_thumbs=cover_thumbs, show_id=show_id, shows_list=shows_list)
+
+
+def _show_cover_url(show_row: dict) -> str:
+    """Fingerprinted cover URL of a catalog show row or show summary."""
+    if show_row["cover"]:
+        return _media_url(show_row["id"], show_row["cover"])
+    return '/assets/default_cover.png'
+
+
+def _cover_thumbs(show_id: str, filename: str | None) -> dict | None:
+    """Thumbnail URLs by size and the blur placeholder of a cover inside the
+    show directory (see templates/_cover.html); ``None`` if it has none."""
+    if not filename or not is_thumbnailable(filename):
+        return None
+    path = SHOWS_DIR / show_id / filename
+    try:
+        fingerprint = media_fingerprint(path)
+        return {
+            "urls": {
+                size: url_for('thumb_file', fingerprint=fingerprint, size=size, show_id=show_id, filename=filename)
+                for size in THUMB_SIZES
+            },
+            "placeholder": placeholder(path, fingerprint),
+        }
+    except Exception as exc:
+        app.logger.warning("No thumbnails for %s: %s", path, exc)
+        return None
+
+
+def _episode_list_item(show_id: str, ep: dict, cover_image_url: str, cover_thumbs: dict | None = None) -> dict:
+    """Данные карточки эпизода на странице шоу (строка каталога → шаблон/API)."""
+    meta = ep["metadata"]
+    # Картинка эпизода; если своей нет, используем обложку шоу
+    episode_image, thumbs = cover_image_url, cover_thumbs
+    if ep["image"]:
+        episode_image = _media_url(show_id, f"episodes/{ep['id']}/{ep['image']}")
+        thumbs = _cover_thumbs(show_id, f"episodes/{ep['id']}/{ep['image']}")
+    return {
+        'id': ep['id'],
+        'title': meta.get('title', 'Без названия'),
+        'description': meta.get('description', ''),
+        'image': episode_image,
+        'thumbs': thumbs,
+        'pubdate': meta.get('pubdate'),
+        'conversion_status': meta.get('conversion_status', 'unknown'),
+    }
+
+
+@app.route("/api/shows/<show_id>/episodes")
+def show_episodes_api(show_id):
+    """Cursor-paginated episode list of a show.
+
+    Query parameters: ``sort`` (mtime | pubdate | title, default mtime),
+    ``order`` (desc | asc, default desc), ``limit`` (default EPISODES_PAGE_SIZE,
+    max 200), ``cursor`` (``next_cursor`` of the previous page), ``q`` (title
+    substring), ``status`` (conversion_status) and ``format=html`` to also get
+    the rendered episode cards for show.html.
+    """
+    show_row = catalog.get_show(show_id)
+    if show_row is None:
+        return jsonify({"error": "Show not found"}), 404
+    try:
+        limit = int(request.args.get("limit", EPISODES_PAGE_SIZE))
+        page, next_cursor = catalog.page_episodes(
+            show_id,
+            sort=request.args.get("sort", "mtime"),
+            descending=request.args.get("order", "desc") != "asc",
+            limit=limit,
+            cursor=request.args.get("cursor") or None,
+            query=request.args.get("q") or None,
+            status=request.args.get("status") or None,
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    cover_image_url = _show_cover_url(show_row)
+    cover_thumbs = _cover_thumbs(show_id, show_row["cover"])
+    episodes = [_episode_list_item(show_id, ep, cover_image_url, cover_thumbs) for ep in page]
+    result = {"episodes": episodes, "next_cursor": next_cursor}
+    if request.args.get("format") == "html":
+        result["html"] = render_template("_episode_cards.html", episodes=episodes, show_id=show_id)
+    return jsonify(result)
+
+
+@app.route("/api/analytics/downloads")
+def analytics_downloads_api():
+    """Daily download rollups per episode (see analytics.py).
+
+    Query parameters: ``show_id``, ``episode_id``, ``since`` and ``until``
+    (inclusive ``YYYY-MM-DD``, UTC).  404 while analytics are disabled.
+    """
+    if download_recorder is None:
+        return jsonify({"error": "Analytics are disabled (ENABLE_ANALYTICS=1 or --enable-analytics)"}), 404
+    since, until = request.args.get("since") or None, request.args.get("until") or None
+    try:
+        for value in (since, until):
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "since/until must be YYYY-MM-DD"}), 400
+    rows = download_recorder.daily(
+        show_id=request.args.get("show_id") or None,
+        ep_id=request.args.get("episode_id") or None,
+        since=since,
+        until=until,
+    )
+    return jsonify({
+        "days": rows,
+        "downloads": sum(r["downloads"] for r in rows),
+        "bytes": sum(r["bytes"] for r in rows),
+    })
 
 
 @app.route("/api/episode_info/<show_id>/<episode_id>")
 def get_episode_info_api(show_id, episode_id):
-    # (Переписано) Быстро отдает готовые данные из metadata.json
-    episode_dir = SHOWS_DIR / show_id / 'episodes' / episode_id
-    metadata_path = episode_dir / "metadata.json"
-
-    if not metadata_path.exists():
+    # (Переписано) Быстро отдает готовые данные metadata.json из каталога
+    ep = catalog.get_episode(show_id, episode_id)
+    if ep is None and has_episode_meta(SHOWS_DIR / show_id / 'episodes' / episode_id):
+        catalog.sync_episode(show_id, episode_id)
+        ep = catalog.get_episode(show_id, episode_id)
+    if ep is None or ep["metadata"] is None:
         return jsonify({"error": "Metadata not found"}), 404
-
-    with metadata_path.open("r", encoding="utf-8") as f:
-        meta = json.load(f)
+    meta = ep["metadata"]
 
     # Мы просто возвращаем все метаданные. Фронтенд сам решит, что показывать.
     # Убедимся, что обязательные поля для плеера есть, даже если пустые.
@@ -454,8 +783,7 @@ def edit_show(show_id):
         abort(404)
 
     if request.method == "POST":
-        with config_path.open("r+", encoding="utf-8") as f:
-            cfg = json.load(f)
+        with update_json(config_path) as cfg:
             # Обновляем поля из формы
             fields = ["title", "author", "owner_email", "owner_name", "explicit", "summary", "description", "category", "category_main", "category_sub", "type", "copyright", "subtitle", "ttl"]
             for field in fields:
@@ -472,6 +800,13 @@ def edit_show(show_id):
                     cfg["ttl"] = int(request.form.get("ttl"))
                 except (ValueError, TypeError):
                     cfg["ttl"] = 60 # Default value
+            if "paged_feed" in request.form:
+                cfg["paged_feed"] = "yes" if request.form.get("paged_feed") == "yes" else "no"
+            if "feed_page_size" in request.form and request.form.get("feed_page_size"):
+                try:
+                    cfg["feed_page_size"] = max(1, int(request.form.get("feed_page_size")))
+                except (ValueError, TypeError):
+                    cfg["feed_page_size"] = 100 # Default value
             # Обработка загрузки новой обложки
             image = request.files.get("image")
             if image and image.filename:
@@ -502,15 +837,12 @@ def edit_show(show_id):
                 except Exception as exc:
                     app.logger.error("Failed to resize show cover on edit: %s", exc)
                 cfg["image"] = new_name
-            f.seek(0)
-            json.dump(cfg, f, ensure_ascii=False, indent=2)
-            f.truncate()
+        show_changed(show_id)
         flash("Изменения шоу успешно сохранены!", "success")
         return redirect(url_for("show_page", show_id=show_id))
 
     from utils import html_to_plain_text
-    with config_path.open("r", encoding="utf-8") as f:
-        cfg = json.load(f)
+    cfg = load_json(config_path, copy=True)
     # Преобразуем HTML обратно в plain text для textarea
     cfg["description"] = html_to_plain_text(cfg.get("description", ""))
     cfg["summary"] = html_to_plain_text(cfg.get("summary", ""))
@@ -519,6 +851,8 @@ def edit_show(show_id):
         cfg["category_main"] = ""
     if "category_sub" not in cfg:
         cfg["category_sub"] = ""
+    # config.json may hold true/1/"on" as well as "yes"; the form always writes back "yes"/"no"
+    cfg["paged_feed"] = "yes" if paged_feed_enabled(cfg) else "no"
     return render_template("edit_show.html", show=cfg, show_id=show_id)
 
 
@@ -532,308 +866,130 @@ def delete_show(show_id):
         return redirect(url_for("index"))
     try:
         shutil.rmtree(show_dir)
+        feed_cache.discard(show_id)
+        archive_pages.discard(show_id)
+        feed_fragments.discard(show_id)
+        catalog.delete_show(show_id)
+        record_change(show_id, None, "delete")
         flash("Шоу удалено!", "success")
     except Exception as e:
         flash(f"Ошибка при удалении шоу: {e}", "error")
     return redirect(url_for("index"))
 
+@app.route(NETWORK_FEED_PATH)
+def network_feed_xml():
+    """Newest NETWORK_FEED_LIMIT episodes of all shows in one RSS feed.
+
+    Built from the catalog's per-show pubdate index by a k-way merge and
+    cached like the per-show feeds; any show change marks it stale.
+    """
+    base_url = f"https://{request.host}"
+    entry = feed_cache.get(
+        (ALL_SHOWS, base_url),
+        lambda: summaries_fingerprint(catalog.list_show_summaries()),
+        lambda fp: iter_network_feed(
+            catalog, SHOWS_DIR, base_url, fp.last_modified, NETWORK_FEED_LIMIT,
+            NETWORK_FEED_TITLE, NETWORK_FEED_DESCRIPTION, feed_fragments,
+        ),
+    )
+    return send_cached_feed(entry, "application/rss+xml; charset=utf-8")
+
+
 @app.route("/shows/<show_id>/feed.xml")
 def show_feed_xml(show_id):
-    import html
-    import mimetypes
-    from pathlib import Path
-    import datetime
-    import hashlib
-    import time
-    from email.utils import formatdate
-    from flask import Response, request, url_for, abort
+    return serve_show_feed(show_id)
+
+
+@app.route("/shows/<show_id>/feed/page/<int:page>.xml")
+def show_feed_page_xml(show_id, page):
+    """Archive page of a paged show feed (RFC 5005), 1 = oldest episodes."""
+    return serve_show_feed(show_id, page)
+
+
+def _archive_page_fingerprint(show_id, show_dir, base_url, page):
+    fp = archive_pages.get(
+        (show_id, base_url),
+        page,
+        lambda: show_fingerprint(show_dir),
+        lambda: archive_page_fingerprints(show_id, show_dir, base_url, feed_fragments),
+    )
+    if fp is None:
+        raise FeedPageNotFound(f"{show_id}: no archive page {page}")
+    return fp
+
+
+def serve_show_feed(show_id, page=None):
+    from flask import Response
 
     # Force HTTPS in feed URLs because Cloudflare terminates TLS at the edge.
     # Using request.url_root could yield "http" since Cloudflare connects to the origin over HTTP.
     base_url = f"https://{request.host}"
 
-    # Load show config
     show_dir = SHOWS_DIR / show_id
     config_path = show_dir / "config.json"
     if not config_path.exists():
         abort(404)
-    with open(config_path, 'r', encoding='utf-8') as f:
-        cfg = json.load(f)
-
-    # Helper functions
-    def normalize_explicit(val):
-        """Return iTunes-valid explicit flag.
-        Apple accepts: "explicit", "clean" or legacy "yes"/"no".
-        PSP-1 prefers "explicit" / "clean". We map truthy values → "explicit", else → "clean".
-        """
-        v = str(val).strip().lower()
-        if v in ("yes", "true", "explicit", "да", "y", "1"):
-            return "true"
-        return "false"
-
-    def cdata_or_escape(text):
-        if not text:
-            return ''
-        if any(x in text for x in ['&', '<', '>']):
-            return f'<![CDATA[{text}]]>'
-        return html.escape(text)
-
-    items = []
-    # Determine show-level cover image URL (used as fallback for episode images)
-    show_cover_url = None
-    image_exts = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp")
-    img_candidate = cfg.get('image')
-    if img_candidate and (show_dir / img_candidate).exists():
-        show_cover_url = f"{base_url}{url_for('show_file', show_id=show_id, filename=img_candidate)}"
-    if not show_cover_url:
-        for f in show_dir.iterdir():
-            if f.is_file() and f.suffix.lower() in image_exts:
-                show_cover_url = f"{base_url}{url_for('show_file', show_id=show_id, filename=f.name)}"
-                break
-
-    episodes_dir = show_dir / "episodes"
-    if episodes_dir.exists():
-        sorted_ep_dirs = sorted([d for d in episodes_dir.iterdir() if d.is_dir()], key=lambda d: d.name, reverse=True)
-
-        for ep_dir in sorted_ep_dirs:
-            meta_path = ep_dir / "metadata.json"
-            if not meta_path.exists():
-                continue
-
-            with open(meta_path, 'r', encoding='utf-8') as f:
-                meta = json.load(f)
-
-            # Use audio file from metadata if available
-            audio_filename = meta.get("filename")
-            if not audio_filename:
-                continue # Skip if no audio file is listed in metadata
 
-            audio_file = ep_dir / audio_filename
-            if not audio_file.exists():
-                continue # Skip if audio file from metadata doesn't exist
-
-            # Prepare item fields, prioritizing metadata
-            title = meta.get("title", ep_dir.name)
-            raw_description = meta.get("description", cfg.get('description', ''))
-            description = sanitize_html_for_rss(raw_description)
-            pubdate_str = meta.get("pubdate")
-            try:
-                dt_obj = datetime.datetime.fromisoformat(pubdate_str)
-                pubdate = dt_obj.strftime("%a, %d %b %Y %H:%M:%S GMT")
-            except (ValueError, TypeError, AttributeError):
-                pubdate = datetime.datetime.fromtimestamp(ep_dir.stat().st_mtime).strftime("%a, %d %b %Y %H:%M:%S GMT")
-
-            duration_str = meta.get('duration', '')
-            enclosure_length = meta.get('size_bytes', 0)
-            # Determine cache-busting version from latest modification time of relevant files
-            version_ts = int(audio_file.stat().st_mtime)
-            try:
-                # Include metadata.json modification time
-                version_ts = max(version_ts, int(meta_path.stat().st_mtime))
-                # Include episode image mtime if present
-                # Also include any image files in episode directory (covers may change without metadata update)
-                image_exts = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp")
-                for f in ep_dir.iterdir():
-                    if f.is_file() and f.suffix.lower() in image_exts and f.name != audio_file.name:
-                        version_ts = max(version_ts, int(f.stat().st_mtime))
-            except Exception:
-                pass  # Fall back to audio file mtime
-            audio_url = f"{base_url}{url_for('show_file', show_id=show_id, filename=f'episodes/{ep_dir.name}/{audio_file.name}')}?v={version_ts}"
-            episode_link = f"{base_url}{url_for('edit_episode', show_id=show_id, ep_id=ep_dir.name)}"
-            
-            ep_image_url = None
-            img_path_candidate = None
-            if meta.get("episode_image"):
-                img_name = Path(meta["episode_image"]).name
-                img_path_candidate = ep_dir / img_name
-                if img_path_candidate.exists():
-                    ep_image_url = f"{base_url}{url_for('show_file', show_id=show_id, filename=f'episodes/{ep_dir.name}/{img_name}')}"
-            # If metadata stale or missing, auto-discover any image file in episode dir
-            if not ep_image_url:
-                for f in ep_dir.iterdir():
-                    if f.is_file() and f.suffix.lower() in (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp"):
-                        ep_image_url = f"{base_url}{url_for('show_file', show_id=show_id, filename=f'episodes/{ep_dir.name}/{f.name}')}"
-                        break
-            # Fallback to show-level cover if episode image still not found
-            if not ep_image_url:
-                ep_image_url = show_cover_url
-
-            ep_summary = sanitize_html_for_rss(meta.get("summary", description))
-            # Transcript URL (recommended PSP-1 element)
-            transcript_url = meta.get("transcript")
-            if not transcript_url:
-                # Fallback to the public episode page if no dedicated transcript is available
-                transcript_url = episode_link
-            transcript_type = "text/html"
-            mime, _ = mimetypes.guess_type(str(audio_file))
-            guid_val = f"{show_id}_{ep_dir.name}"
-
-            # Append item XML
-            items.append(f'''
-        <item>
-            <title>{cdata_or_escape(title)}</title>
-            <link>{episode_link}</link>
-            <description>{cdata_or_escape(description)}</description>
-            <enclosure url=\"{audio_url}\" type=\"{mime or 'audio/mpeg'}\" length=\"{enclosure_length or 0}\"/>
-            <guid isPermaLink=\"false\">{guid_val}</guid>
-            <pubDate>{pubdate}</pubDate>
-            {f'<itunes:image href="{ep_image_url}" />' if ep_image_url else ''}
-            {f'<itunes:summary>{cdata_or_escape(ep_summary)}</itunes:summary>' if ep_summary else ''}
-            {f'<podcast:transcript url="{html.escape(transcript_url)}" type="{transcript_type}" />' if transcript_url else ''}
-            {f'<itunes:duration>{duration_str}</itunes:duration>' if duration_str else ''}
-            <itunes:explicit>{normalize_explicit(meta.get("explicit"))}</itunes:explicit>
-        </item>''')
-
-    # Find show cover – first look at explicit config, otherwise discover automatically
-    cover_url = None
-    img_name = cfg.get('image')
-    image_exts = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp')
-
-    if img_name:
-        img_path = show_dir / img_name
-        if not img_path.exists():
-            img_name = None  # fall back to auto-discovery
-
-    # Auto-discover any image file in the show directory if not defined
-    if not img_name:
-        for f in show_dir.iterdir():
-            if f.is_file() and f.suffix.lower() in image_exts:
-                img_name = f.name
-                break
-        # Persist discovery so we do not have to search again next time
-        if img_name:
-            try:
-                with (show_dir / 'config.json').open('r+', encoding='utf-8') as fc:
-                    auto_cfg = json.load(fc)
-                    auto_cfg['image'] = img_name
-                    fc.seek(0)
-                    json.dump(auto_cfg, fc, ensure_ascii=False, indent=2)
-                    fc.truncate()
-            except Exception:
-                pass  # not critical
-
-    if img_name:
-        cover_url = f"{base_url}{url_for('show_file', show_id=show_id, filename=img_name)}"
-
-    # Assemble channel-level info
-    channel_link = f"{base_url}{url_for('show_page', show_id=show_id)}"
-    # Sanitize show-level description separately
-    show_description = sanitize_html_for_rss(cfg.get('description', ''))
-    atom_url = f"{base_url}{url_for('show_feed_xml', show_id=show_id)}"
-    itunes_author = cfg.get('author')
-    itunes_explicit = normalize_explicit(cfg.get('explicit'))
-    itunes_owner_name = cfg.get('owner_name')
-    itunes_owner_email = cfg.get('owner_email')
-    itunes_summary = sanitize_html_for_rss(cfg.get('summary', cfg.get('description', '')))
-    itunes_owner = f'<itunes:owner><itunes:name>{cdata_or_escape(itunes_owner_name)}</itunes:name><itunes:email>{itunes_owner_email}</itunes:email></itunes:owner>' if itunes_owner_name and itunes_owner_email else ''
-    now_gmt = datetime.datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")
-    copyright_val = cfg.get('copyright', f" 2025 {itunes_author or cfg.get('title')}")
-    itunes_subtitle = cfg.get('subtitle', '')
-
-    # PSP-1 requires at least one element from the "podcast" namespace; we include <podcast:locked>
-    podcast_locked = ''
-    if itunes_owner_email:
-        podcast_locked = f'<podcast:locked owner="{html.escape(itunes_owner_email)}">no</podcast:locked>'
-    
-    # Categories
-    cat_main = cfg.get('category_main', '')
-    cat_sub = cfg.get('category_sub', '')
-    itunes_cat = ''
-    if cat_main:
-        itunes_cat = f'<itunes:category text="{html.escape(cat_main)}">'
-        if cat_sub:
-            itunes_cat += f'<itunes:category text="{html.escape(cat_sub)}"/>'
-        itunes_cat += '</itunes:category>'
-    
-    # Image block
-    image_block = ''
-    if cover_url:
-        image_block = f"<image>\n      <url>{html.escape(cover_url)}</url>\n      <title>{html.escape(cfg.get('title'))}</title>\n      <link>{html.escape(base_url + url_for('show_page', show_id=show_id))}</link>\n    </image>\n    <itunes:image href=\"{html.escape(cover_url)}\" />"
-
-    # Recommended PSP-1 channel-level GUID
-    podcast_guid_tag = f"<podcast:guid>{html.escape(cfg.get('guid', show_id))}</podcast:guid>"
-
-    # Final RSS assembly
-    rss = f'''<?xml version="1.0" encoding="UTF-8"?>
-<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:podcast="https://podcastindex.org/namespace/1.0">
-<channel>
-    <title>{cdata_or_escape(cfg.get('title', show_id))}</title>
-    <link>{channel_link}</link>
-    <atom:link href="{atom_url}" rel="self" type="application/rss+xml"/>
-    <description>{cdata_or_escape(show_description)}</description>
-    <language>{cfg.get('language', 'en-US')}</language>
-    <copyright>{cdata_or_escape(copyright_val)}</copyright>
-    <lastBuildDate>{now_gmt}</lastBuildDate>
-    <itunes:author>{cdata_or_escape(itunes_author)}</itunes:author>
-    <itunes:summary>{cdata_or_escape(itunes_summary)}</itunes:summary>
-    {itunes_owner}
-    <itunes:explicit>{itunes_explicit}</itunes:explicit>
-    {itunes_cat}
-    {image_block}
-    {podcast_guid_tag}
-    {''.join(items)}
-    {podcast_locked}
-</channel>
-</rss>'''
-
-    # Calculate ETag and Last-Modified headers
-    last_modified_time = 0
-    content_hash = hashlib.sha256()
-    content_hash.update(rss.encode('utf-8'))
-    
-    # Find the most recent modification time among all files
-    for meta_path in config_path, *[d / "metadata.json" for d in sorted_ep_dirs]:
+    if page is None:
+        key = (show_id, base_url)
+        cache_control = 'public, max-age=0'
+        feed_fingerprint = lambda: show_fingerprint(show_dir)
+    else:
+        # Archive pages hold a fixed set of old episodes: their validators come
+        # from those episodes only, so new episodes do not change them
+        key = (show_id, base_url, page)
+        cache_control = f'public, max-age={FEED_ARCHIVE_MAX_AGE}'
+        feed_fingerprint = lambda: _archive_page_fingerprint(show_id, show_dir, base_url, page)
+
+    # Validators depend only on the fingerprint of the inputs, so a
+    # conditional request on a cold cache is answered before rendering.
+    cold_fp = []  # fingerprint computed below, reused once by the cold build
+    if feed_cache.peek(key) is None:
         try:
-            mtime = meta_path.stat().st_mtime
-            if mtime > last_modified_time:
-                last_modified_time = mtime
-        except (FileNotFoundError, OSError):
-            pass
-    
-    # Add config and audio file modification times to ETag calculation
-    content_hash.update(str(last_modified_time).encode('utf-8'))
-    etag = f'"{content_hash.hexdigest()[:16]}"'
-    
-    # Return the feed with caching headers
-    response = Response(rss, content_type="application/rss+xml; charset=utf-8")
-    response.headers['ETag'] = etag
-    response.headers['Last-Modified'] = formatdate(last_modified_time, localtime=False, usegmt=True)
-    response.headers.setdefault('Cache-Control', 'public, max-age=0')
-    if request.headers.get('If-None-Match') == etag:
-        return Response(status=304)
-    return response
+            fp = feed_fingerprint()
+        except FeedPageNotFound:
+            abort(404)
+        cold_fp.append(fp)
+        encoding = negotiate_feed_encoding()
+        etag = variant_etag(feed_cache.etag_for(key, fp), encoding)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+            response.last_modified = fp.last_modified
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+        # Very large shows do not make the first client wait for the whole
+        # document: the cold build is streamed chunk by chunk into the
+        # (compressed) response and cached once complete, for later polls.
+        if FEED_STREAM_MIN_EPISODES and fp.episodes >= FEED_STREAM_MIN_EPISODES:
+            try:
+                chunks = iter_show_feed(show_id, show_dir, base_url, fp.last_modified, feed_fragments, page)
+            except FeedPageNotFound:
+                abort(404)
+            response = Response(feed_cache.stream(key, fp, chunks, encoding), mimetype="application/rss+xml; charset=utf-8")
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            response.set_etag(etag)
+            response.last_modified = fp.last_modified
+            response.headers['Cache-Control'] = cache_control
+            return response.make_conditional(request)
+
+    # Rendered feeds are cached per show and host; stale copies keep being
+    # served while a single background rebuild runs (see feed_cache.py).
+    try:
+        entry = feed_cache.get(
+            key,
+            lambda: cold_fp.pop() if cold_fp else feed_fingerprint(),
+            lambda fp: iter_show_feed(show_id, show_dir, base_url, fp.last_modified, feed_fragments, page),
+        )
+    except FeedPageNotFound:
+        abort(404)
+
+    return send_cached_feed(entry, "application/rss+xml; charset=utf-8", cache_control)
 
-    audio_file = None
-    for f in ep_dir.iterdir():
-        if f.suffix.lower() in [".mp3", ".wav", ".ogg", ".m4a", ".flac", ".aac"]:
-            audio_file = f
-            break
-    audio_url = None
-    if audio_file:
-        audio_url = f"/shows/{show_id}/episodes/{ep_id}/{audio_file.name}"
-    # Картинка эпизода
-    image_url = meta.get("episode_image")
-    if image_url and image_url.startswith("/"):
-        image_url = f"https://podcast.ecowool.online{image_url}"
-    # duration
-    duration = meta.get("duration")
-    if isinstance(duration, (int, float)):
-        h = int(duration // 3600)
-        m = int((duration % 3600) // 60)
-        s = int(duration % 60)
-        duration = f"{h}:{m:02}:{s:02}" if h > 0 else f"{m}:{s:02}"
-    elif isinstance(duration, str):
-        duration = duration
-    episode = {
-        "title": meta.get("title", ep_id),
-        "description": meta.get("description", ""),
-        "pubdate": meta.get("pubdate"),
-        "audio_url": audio_url,
-        "image_url": image_url,
-        "duration": duration,
-        "explicit": meta.get("explicit"),
-    }
-    return render_template("episode.html", show_id=show_id, episode_id=ep_id, episode=episode)
 
 @app.route("/shows/<show_id>/<path:filename>")
 def show_file(show_id, filename):
@@ -843,23 +999,11 @@ def show_file(show_id, filename):
     We resolve the requested path relative to the show's root directory and
     additionally guard against directory-traversal attempts.
     """
-    show_dir = (SHOWS_DIR / show_id).resolve()
-    target_path = (show_dir / filename).resolve()
-
-    # Disallow path traversal outside the show directory
-    if not str(target_path).startswith(str(show_dir)):
-        abort(403)
-
-    if not target_path.exists() or not target_path.is_file():
-        abort(404)
-
-    # ``send_from_directory`` requires directory & filename separately.
-    # Pass conditional=True so Flask/Werkzeug handles Range requests.
-    response = send_from_directory(str(target_path.parent), target_path.name, conditional=True)
-    # Explicitly add Accept-Ranges header so validators that only perform a
-    # HEAD request without a Range header can still detect byte-range support.
-    response.headers.setdefault("Accept-Ranges", "bytes")
-    return response
+    path = resolve_media_path(SHOWS_DIR / show_id, filename)
+    if _is_fingerprinted(path):
+        return _media_redirect(media_file_url(show_id, filename, media_fingerprint(path)))
+    # Range requests are handled by media_send/Werkzeug or the proxy
+    return send_media(path)
 
 
 @app.route("/favicon.ico")
@@ -911,15 +1055,19 @@ def process_audio_background(audio_path_str, show_id, ep_id):
         app.logger.info(f"--- BG PROCESS START for {audio_path_str} ---")
         audio_path = Path(audio_path_str)
         ep_dir = SHOWS_DIR / show_id / "episodes" / ep_id
-        meta_path = ep_dir / "metadata.json"
 
         meta = {}
+        # Только поля, которые вычисляет фоновая обработка: в конце они вливаются
+        # в актуальный metadata.json под блокировкой, не затирая правки, сделанные
+        # за время транскодирования (inline-edit, edit_episode, другие воркеры)
+        updates = {}
         final_audio_path = None
 
         try:
-            app.logger.info(f"[BG] Loading metadata from {meta_path}")
-            with meta_path.open("r", encoding="utf-8") as f:
-                meta = json.load(f)
+            app.logger.info(f"[BG] Loading metadata for {show_id}/{ep_id}")
+            meta = read_episode_meta(ep_dir, copy=True)
+            if meta is None:
+                raise FileNotFoundError(f"No metadata for episode {show_id}/{ep_id}")
 
             needs_transcoding, reason = check_transcoding_needed(audio_path)
             app.logger.info(f"[BG] Checking transcoding for {audio_path.name}: needs_transcoding={needs_transcoding}, reason='{reason}'")
@@ -928,8 +1076,7 @@ def process_audio_background(audio_path_str, show_id, ep_id):
             import datetime as _dt
             metadata_dict = {}
             try:
-                with (SHOWS_DIR / show_id / "config.json").open("r", encoding="utf-8") as _fcfg:
-                    show_cfg = json.load(_fcfg)
+                show_cfg = load_json(SHOWS_DIR / show_id / "config.json")
             except Exception:
                 show_cfg = {}
 
@@ -983,8 +1130,7 @@ def process_audio_background(audio_path_str, show_id, ep_id):
                 metadata_dict = {}
                 # Load show configuration for album/artist fields
                 try:
-                    with (SHOWS_DIR / show_id / "config.json").open("r", encoding="utf-8") as _fcfg:
-                        show_cfg = json.load(_fcfg)
+                    show_cfg = load_json(SHOWS_DIR / show_id / "config.json")
                 except Exception:
                     show_cfg = {}
 
@@ -1020,7 +1166,7 @@ def process_audio_background(audio_path_str, show_id, ep_id):
                 if new_path_str:
                     final_audio_path = Path(new_path_str)
                     app.logger.info(f"[BG] Transcoding successful. New file: {final_audio_path}")
-                    meta['audio'] = f"/shows/{show_id}/episodes/{ep_id}/{final_audio_path.name}"
+                    updates['audio'] = f"/shows/{show_id}/episodes/{ep_id}/{final_audio_path.name}"
                 else:
                     raise Exception("transcode_audio_to_mp3 returned None")
 
@@ -1028,9 +1174,8 @@ def process_audio_background(audio_path_str, show_id, ep_id):
             if final_audio_path and final_audio_path.exists():
                 app.logger.info(f"[BG] Getting audio info for {final_audio_path}")
                 audio_info = get_audio_info(final_audio_path)
-                meta.update(audio_info) # Добавляем всю инфу в метаданные
-                meta['conversion_status'] = 'success'
-                if 'conversion_error' in meta: del meta['conversion_error']
+                updates.update(audio_info) # Добавляем всю инфу в метаданные
+                updates['conversion_status'] = 'success'
                 app.logger.info(f"[BG] Audio info obtained and updated in metadata.")
             elif not final_audio_path:
                  raise Exception("Transcoding failed and no final audio path was set.")
@@ -1039,17 +1184,23 @@ def process_audio_background(audio_path_str, show_id, ep_id):
 
         except Exception as e:
             app.logger.error(f"[BG] Exception in background task for {ep_id}: {e}", exc_info=True)
-            meta['conversion_status'] = 'failed'
-            meta['conversion_error'] = str(e)
+            updates['conversion_status'] = 'failed'
+            updates['conversion_error'] = str(e)
 
         finally:
-            if meta:
+            if updates:
                 try:
-                    with meta_path.open("w", encoding="utf-8") as f:
-                        json.dump(meta, f, ensure_ascii=False, indent=2)
-                    app.logger.info(f"[BG] Metadata saved for episode {ep_id} with final status: {meta.get('conversion_status')}")
+                    with update_episode_meta(ep_dir) as current:
+                        current.update(updates)
+                        if updates.get('conversion_status') == 'success':
+                            current.pop('conversion_error', None)
+                    app.logger.info(f"[BG] Metadata saved for episode {ep_id} with final status: {updates.get('conversion_status')}")
+                    show_changed(show_id, ep_id, "media", f"audio {updates.get('conversion_status')}")
+                except FileNotFoundError:
+                    # Эпизод (или шоу) удалили во время обработки — не воссоздаём его
+                    app.logger.warning(f"[BG] Episode {show_id}/{ep_id} has no metadata anymore (deleted?); final status not saved")
                 except Exception as e:
-                    app.logger.error(f"[BG] CRITICAL: Could not write final metadata to {meta_path}. Error: {e}")
+                    app.logger.error(f"[BG] CRITICAL: Could not write final metadata for {show_id}/{ep_id}. Error: {e}")
             app.logger.info(f"--- BG PROCESS END for {audio_path_str} ---")
 
 
@@ -1118,8 +1269,7 @@ def new_episode(show_id):
             if 'conversion_error' in meta: del meta['conversion_error']
             
             # СНАЧАЛА сохраняем метаданные, ПОТОМ запускаем поток
-            with (ep_dir / "metadata.json").open("w", encoding="utf-8") as f:
-                json.dump(meta, f, ensure_ascii=False, indent=2)
+            write_episode_meta(ep_dir, meta)
             
             # Теперь запускаем фоновую обработку
             thread = threading.Thread(target=process_audio_background, args=(str(audio_path), show_id, ep_id))
@@ -1146,8 +1296,7 @@ def new_episode(show_id):
                         if 'conversion_error' in meta: del meta['conversion_error']
                         
                         # СНАЧАЛА сохраняем метаданные, ПОТОМ запускаем поток
-                        with (ep_dir / "metadata.json").open("w", encoding="utf-8") as f:
-                            json.dump(meta, f, ensure_ascii=False, indent=2)
+                        write_episode_meta(ep_dir, meta)
                         
                         # Теперь запускаем фоновую обработку
                         thread = threading.Thread(target=process_audio_background, args=(str(audio_path), show_id, ep_id))
@@ -1167,6 +1316,7 @@ def new_episode(show_id):
             return render_template("new_episode.html", show_id=show_id, msg=msg)
 
         # Этот блок был перемещен выше, чтобы исправить race condition
+        show_changed(show_id, ep_id, "create")
         flash("Эпизод успешно создан!", "success")
         return redirect(url_for("show_page", show_id=show_id))
     return render_template("new_episode.html", show_id=show_id, msg=msg)
@@ -1175,12 +1325,13 @@ def new_episode(show_id):
 def delete_episode(show_id, ep_id):
     show_dir = SHOWS_DIR / show_id
     ep_dir = show_dir / "episodes" / ep_id
-    meta_path = ep_dir / "metadata.json"
     msg = None
-    if not meta_path.exists():
+    if not has_episode_meta(ep_dir):
         abort(404)
     if request.method == "POST":
         shutil.rmtree(ep_dir)
+        delete_episode_meta(ep_dir)
+        show_changed(show_id, ep_id, "delete")
         flash("Эпизод удалён!", "success")
         return redirect(url_for("show_page", show_id=show_id))
 
@@ -1188,9 +1339,8 @@ def delete_episode(show_id, ep_id):
 def edit_episode(show_id, ep_id):
     show_dir = SHOWS_DIR / show_id
     ep_dir = show_dir / "episodes" / ep_id
-    meta_path = ep_dir / "metadata.json"
     msg = None
-    if not meta_path.exists():
+    if not has_episode_meta(ep_dir):
         abort(404)
     if request.method == "POST":
         title = request.form.get("title", "").strip()
@@ -1202,10 +1352,8 @@ def edit_episode(show_id, ep_id):
         duration = request.form.get("duration", "")
         episode_image = request.files.get("episode_image")
         audio = request.files.get("audio")
-        with meta_path.open("r", encoding="utf-8") as f:
-            meta = json.load(f)
         from utils import sanitize_html_for_rss, plain_text_to_html
-        meta.update({
+        changes = {
             "title": title,
             "language": request.form.get("language", "en-US").strip(),
             "description": sanitize_html_for_rss(plain_text_to_html(description)),
@@ -1214,7 +1362,7 @@ def edit_episode(show_id, ep_id):
             "category_sub": category_sub,
             "summary": sanitize_html_for_rss(plain_text_to_html(summary)),
             "duration": duration,
-        })
+        }
         if episode_image and episode_image.filename:
             img_name = secure_filename(episode_image.filename)
             remove_old_episode_covers(ep_dir, img_name)
@@ -1226,32 +1374,34 @@ def edit_episode(show_id, ep_id):
                     img_name = processed_path.name
             except Exception as exc:
                 app.logger.error("Failed to resize episode cover image for %s/%s: %s", show_id, ep_id, exc)
-            meta["episode_image"] = f"/shows/{show_id}/episodes/{ep_id}/{img_name}"
+            changes["episode_image"] = f"/shows/{show_id}/episodes/{ep_id}/{img_name}"
+        audio_path = None
         if audio and audio.filename:
             audio_name = secure_filename(audio.filename)
             audio_path = ep_dir / audio_name
             audio.save(str(audio_path))
-            meta["audio"] = f"/shows/{show_id}/episodes/{ep_id}/{audio_name}"
+            changes["audio"] = f"/shows/{show_id}/episodes/{ep_id}/{audio_name}"
 
             # Если загружен новый файл, который не MP3, помечаем для конвертации.
             # Для любого нового аудиофайла запускаем проверку/конвертацию
-            meta['conversion_status'] = 'processing'
-            if 'conversion_error' in meta: del meta['conversion_error']
+            changes['conversion_status'] = 'processing'
 
-            # СНАЧАЛА сохраняем метаданные, ПОТОМ запускаем поток
-            with (ep_dir / "metadata.json").open("w", encoding="utf-8") as f:
-                json.dump(meta, f, ensure_ascii=False, indent=2)
+        # СНАЧАЛА сохраняем метаданные (поверх актуальной версии файла), ПОТОМ запускаем поток
+        with update_episode_meta(ep_dir) as meta:
+            meta.update(changes)
+            if audio_path is not None:
+                meta.pop('conversion_error', None)
 
+        if audio_path is not None:
             # Теперь запускаем фоновую обработку
             thread = threading.Thread(target=process_audio_background, args=(str(audio_path), show_id, ep_id))
             thread.start()
-        else: # если аудиофайл не менялся, просто сохраняем метаданные
-             with (ep_dir / "metadata.json").open("w", encoding="utf-8") as f:
-                json.dump(meta, f, ensure_ascii=False, indent=2)
+            show_changed(show_id, ep_id, "media", "audio")
+        else:
+            show_changed(show_id, ep_id)
         flash("Эпизод обновлён!", "success")
         return redirect(url_for("show_page", show_id=show_id))
-    with meta_path.open("r", encoding="utf-8") as f:
-        meta = json.load(f)
+    meta = read_episode_meta(ep_dir, copy=True)
     # Преобразуем HTML обратно в plain text для textarea
     meta["description"] = html_to_plain_text(meta.get("description", ""))
     meta["summary"] = html_to_plain_text(meta.get("summary", ""))
@@ -1308,7 +1458,8 @@ def upload_show_cover(show_id):
         app.logger.error("Failed to resize cover for show %s: %s", show_id, exc)
         return jsonify({"error": "Failed to process image"}), 500
 
-    url = f"/shows/{show_id}/{img_name}?v={int(file_path.stat().st_mtime)}"
+    show_changed(show_id, action="media", detail="cover")
+    url = _media_url(show_id, img_name)
     return jsonify({"image_url": url})
 
 @app.route("/shows/<show_id>/episodes/<ep_id>/cover-upload", methods=["POST"])
@@ -1335,23 +1486,14 @@ def upload_episode_cover(show_id, ep_id):
 
     # Обновляем config.json эпизода, чтобы поле "image" содержало имя файла
     config_path = ep_dir / "config.json"
-    if config_path.exists():
-        try:
-            with config_path.open("r", encoding="utf-8") as cf:
-                cfg = json.load(cf)
-        except Exception:
-            cfg = {}
-    else:
-        cfg = {}
-
-    cfg["image"] = img_name
     try:
-        with config_path.open("w", encoding="utf-8") as cf:
-            json.dump(cfg, cf, ensure_ascii=False, indent=2)
+        with update_json(config_path, default={}) as cfg:
+            cfg["image"] = img_name
     except Exception as exc:
         app.logger.error("Failed to update episode config %s: %s", config_path, exc)
 
-    url = f"/shows/{show_id}/episodes/{ep_id}/{img_name}?v={int(file_path.stat().st_mtime)}"
+    show_changed(show_id, ep_id, "media", "cover")
+    url = _media_url(show_id, f"episodes/{ep_id}/{img_name}")
     return jsonify({"image_url": url})
 
 @app.route("/shows/<show_id>/episodes/<ep_id>/audio-upload", methods=["POST"])
@@ -1386,19 +1528,9 @@ def upload_episode_audio(show_id, ep_id):
                 return jsonify({"error": "Failed to move file"}), 500
             # Обновляем config.json эпизода, чтобы поле "audio" содержало имя файла
             config_path = ep_dir / "config.json"
-            if config_path.exists():
-                try:
-                    with config_path.open("r", encoding="utf-8") as cf:
-                        cfg = json.load(cf)
-                except Exception:
-                    cfg = {}
-            else:
-                cfg = {}
-
-            cfg["audio"] = new_filename
             try:
-                with config_path.open("w", encoding="utf-8") as cf:
-                    json.dump(cfg, cf, ensure_ascii=False, indent=2)
+                with update_json(config_path, default={}) as cfg:
+                    cfg["audio"] = new_filename
             except Exception as exc:
                 app.logger.error("Failed to update episode config %s: %s", config_path, exc)
 
@@ -1410,27 +1542,21 @@ def upload_episode_audio(show_id, ep_id):
             except Exception as exc:
                 app.logger.warning("Cannot remove temp upload dir %s: %s", upload_dir_parent, exc)
 
-            url = f"/shows/{show_id}/episodes/{ep_id}/{new_filename}?v={int(dest_path.stat().st_mtime)}"
+            url = _media_url(show_id, f"episodes/{ep_id}/{new_filename}")
             # Update metadata.json and launch background processing
-            meta_path = ep_dir / "metadata.json"
-            meta = {}
-            if meta_path.exists():
-                try:
-                    with meta_path.open("r", encoding="utf-8") as mf:
-                        meta = json.load(mf)
-                except Exception:
-                    meta = {}
-            meta.update({
-                "audio": url.split("?v=")[0],
-                "conversion_status": "processing",
-            })
             try:
-                with meta_path.open("w", encoding="utf-8") as mf:
-                    json.dump(meta, mf, ensure_ascii=False, indent=2)
+                with update_episode_meta(ep_dir) as meta:
+                    meta.update({
+                        "audio": f"/shows/{show_id}/episodes/{ep_id}/{new_filename}",
+                        "conversion_status": "processing",
+                    })
+            except FileNotFoundError:
+                app.logger.warning("Episode %s has no metadata; audio %s not recorded in it", ep_dir, new_filename)
             except Exception as exc:
                 app.logger.error("Failed to update metadata for %s: %s", ep_dir, exc)
             # Kick off transcoding / ID3 tagging in background
             threading.Thread(target=process_audio_background, args=(str(dest_path), show_id, ep_id)).start()
+            show_changed(show_id, ep_id, "media", "audio")
             return jsonify({"audio_url": url})
     
     # Fallback to multipart/form-data
@@ -1451,26 +1577,20 @@ def upload_episode_audio(show_id, ep_id):
     file_path = ep_dir / filename
     file.save(str(file_path))
 
-    url = f"/shows/{show_id}/episodes/{ep_id}/{filename}?v={int(file_path.stat().st_mtime)}"
+    url = _media_url(show_id, f"episodes/{ep_id}/{filename}")
     # Update metadata.json and launch background processing
-    meta_path = ep_dir / "metadata.json"
-    meta = {}
-    if meta_path.exists():
-        try:
-            with meta_path.open("r", encoding="utf-8") as mf:
-                meta = json.load(mf)
-        except Exception:
-            meta = {}
-    meta.update({
-        "audio": url.split("?v=")[0],
-        "conversion_status": "processing",
-    })
     try:
-        with meta_path.open("w", encoding="utf-8") as mf:
-            json.dump(meta, mf, ensure_ascii=False, indent=2)
+        with update_episode_meta(ep_dir) as meta:
+            meta.update({
+                "audio": f"/shows/{show_id}/episodes/{ep_id}/{filename}",
+                "conversion_status": "processing",
+            })
+    except FileNotFoundError:
+        app.logger.warning("Episode %s has no metadata; audio %s not recorded in it", ep_dir, filename)
     except Exception as exc:
         app.logger.error("Failed to update metadata for %s: %s", ep_dir, exc)
     threading.Thread(target=process_audio_background, args=(str(file_path), show_id, ep_id)).start()
+    show_changed(show_id, ep_id, "media", "audio")
 
     return jsonify({"audio_url": url})
 
@@ -1527,28 +1647,19 @@ def upload_chunk():
             file.save(str(chunk_file))
             
             # Update metadata
+            # Чанки одной загрузки приходят параллельно (и в разные воркеры):
+            # обновляем список под блокировкой, иначе часть чанков теряется.
+            # Отсутствующий файл начинается с пустого словаря.
             meta_file = upload_dir / "metadata.json"
-            meta = {}
-            if meta_file.exists():
-                with meta_file.open('r') as f:
-                    try:
-                        meta = json.load(f)
-                    except json.JSONDecodeError:
-                        app.logger.warning(f"Invalid metadata file for upload {upload_id}, creating new")
-                        meta = {}
-            
-            # Track progress
-            chunks_received = meta.get('chunks_received', [])
-            if chunk_index not in chunks_received:
-                chunks_received.append(chunk_index)
-            meta['chunks_received'] = sorted(set(chunks_received))  # Deduplicate and sort
-            meta['filename'] = secure_filename(filename)
-            meta['total_chunks'] = total_chunks
-            meta['last_update'] = time.time()
-            
-            # Write metadata
-            with meta_file.open('w') as f:
-                json.dump(meta, f)
+            with update_json(meta_file, default={}) as meta:
+                # Track progress
+                chunks_received = meta.get('chunks_received', [])
+                if chunk_index not in chunks_received:
+                    chunks_received.append(chunk_index)
+                meta['chunks_received'] = sorted(set(chunks_received))  # Deduplicate and sort
+                meta['filename'] = secure_filename(filename)
+                meta['total_chunks'] = total_chunks
+                meta['last_update'] = time.time()
             
             # Check if upload is complete
             is_complete = len(meta['chunks_received']) == total_chunks
@@ -1600,8 +1711,7 @@ def complete_upload():
             return jsonify({'error': 'Upload metadata not found', 'details': 'The upload metadata is missing or corrupted'}), 404
         
         try:
-            with meta_file.open('r') as f:
-                meta = json.load(f)
+            meta = load_json(meta_file)
         except (IOError, json.JSONDecodeError) as e:
             app.logger.error(f"Complete upload failed: Could not read metadata for upload {upload_id}: {str(e)}")
             return jsonify({'error': 'Metadata read error', 'details': str(e)}), 500
@@ -1658,6 +1768,8 @@ def complete_upload():
             file_size = -1
         
         app.logger.info(f"Upload {upload_id} completed successfully: {filename}, size: {file_size} bytes, hash: {file_hash[:8]}...")
+        # Все чанки получены, metadata.json загрузки больше не обновляется
+        remove_lock_file(meta_file)
         
         # Return path/id for further processing
         return jsonify({
@@ -1707,8 +1819,7 @@ def upload_status():
         
         # Чтение метаданных с обработкой возможных ошибок
         try:
-            with meta_file.open('r') as f:
-                meta = json.load(f)
+            meta = load_json(meta_file)
         except (IOError, json.JSONDecodeError) as e:
             app.logger.error(f"Upload status check failed: Error reading metadata for {upload_id}: {str(e)}")
             return jsonify({
@@ -1751,6 +1862,12 @@ def upload_status():
         return jsonify({'error': 'Server error', 'details': str(e)}), 500
 
 
+def _remove_upload_dir(upload_dir: Path) -> None:
+    """Delete a chunked-upload directory and the lock file of its metadata.json."""
+    shutil.rmtree(upload_dir)
+    remove_lock_file(upload_dir / "metadata.json")
+
+
 @app.route('/api/upload/cleanup', methods=['POST'])
 def cleanup_old_uploads():
     """Admin endpoint to clean up old uploads"""
@@ -1808,7 +1925,7 @@ def cleanup_old_uploads():
                     
                     if age > TEMP_UPLOAD_TTL:
                         try:
-                            shutil.rmtree(upload_dir)
+                            _remove_upload_dir(upload_dir)
                             app.logger.info(f"Deleted old directory without metadata: {dir_name} (age: {int(age)} seconds)")
                             cleaned += 1
                             result['action'] = 'deleted'
@@ -1829,8 +1946,7 @@ def cleanup_old_uploads():
                 else:
                     # Есть метаданные, проверяем дату последнего обновления
                     try:
-                        with meta_file.open('r') as f:
-                            meta = json.load(f)
+                        meta = load_json(meta_file)
                         
                         # Получаем время последнего обновления
                         last_update = meta.get('last_update', 0)
@@ -1848,7 +1964,7 @@ def cleanup_old_uploads():
                         
                         if age > TEMP_UPLOAD_TTL:
                             try:
-                                shutil.rmtree(upload_dir)
+                                _remove_upload_dir(upload_dir)
                                 app.logger.info(f"Deleted expired upload: {dir_name} ({filename}) (age: {int(age)} seconds)")
                                 cleaned += 1
                                 result['action'] = 'deleted'
@@ -1874,7 +1990,7 @@ def cleanup_old_uploads():
                         
                         if age > TEMP_UPLOAD_TTL:
                             try:
-                                shutil.rmtree(upload_dir)
+                                _remove_upload_dir(upload_dir)
                                 app.logger.info(f"Deleted directory with corrupted metadata: {dir_name} (age: {int(age)} seconds)")
                                 cleaned += 1
                                 result['action'] = 'deleted'
@@ -1935,9 +2051,8 @@ def settings():
     current_settings = default_settings.copy()
     if SETTINGS_FILE.exists():
         try:
-            with open(SETTINGS_FILE, 'r') as f:
-                stored_settings = json.load(f)
-                current_settings.update(stored_settings)
+            stored_settings = load_json(SETTINGS_FILE)
+            current_settings.update(stored_settings)
         except (json.JSONDecodeError, IOError) as e:
             app.logger.error(f"Error loading settings: {e}")
     
@@ -1952,8 +2067,7 @@ def settings():
                     current_settings["chunked_upload_default"] = bool(new_settings["chunked_upload_default"])
                 
                 # Save settings
-                with open(SETTINGS_FILE, 'w') as f:
-                    json.dump(current_settings, f, indent=2)
+                write_json(SETTINGS_FILE, current_settings)
                 
                 return jsonify({"success": True})
             except Exception as e:
@@ -1978,9 +2092,8 @@ def api_settings():
     current_settings = default_settings.copy()
     if SETTINGS_FILE.exists():
         try:
-            with open(SETTINGS_FILE, 'r') as f:
-                stored_settings = json.load(f)
-                current_settings.update(stored_settings)
+            stored_settings = load_json(SETTINGS_FILE)
+            current_settings.update(stored_settings)
         except (json.JSONDecodeError, IOError) as e:
             app.logger.error(f"Error loading settings: {e}")
     
@@ -1991,36 +2104,97 @@ def api_settings():
 def shows_api():
     """API endpoint to get list of shows"""
     shows = []
-    for show_dir in sorted(SHOWS_DIR.iterdir()):
-        if not show_dir.is_dir():
-            continue
-        show_id = show_dir.name
-        show_path = SHOWS_DIR / show_id
-        if not show_path.is_dir():
-            continue
-            
-        config_path = show_path / "config.json"
-        if not config_path.exists():
-            continue
-            
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                
-            show_data = {
-                'id': show_id,
-                'title': config.get('title', ''),
-                'description': config.get('description', ''),
-                'language': config.get('language', 'en'),
-                'image': config.get('image')
-            }
-            shows.append(show_data)
-        except Exception as e:
-            app.logger.error(f"Error loading show {show_id}: {e}")
-            
+    for row in catalog.list_show_summaries():
+        shows.append({
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'language': row['language'] or 'en',
+            'image': row['image'],
+            'cover': _show_cover_url(row),
+            'episode_count': row['episode_count'],
+            'updated': datetime.fromtimestamp(row['updated_ns'] / 1e9, timezone.utc).isoformat(),
+        })
     return jsonify(shows)
 
 
+@app.route("/api/search")
+def search_api():
+    """Full-text search over shows and episodes (FTS5 index of the catalog).
+
+    Query parameters: ``q`` (all words must match, the last one as a prefix), ``limit``
+    (default 20, max 100), ``offset``, ``show_id`` and ``type`` (show |
+    episode).  Results are ranked by relevance; ``snippet`` is HTML with the
+    matches in ``<mark>``.
+    """
+    q = request.args.get("q", "").strip()
+    try:
+        limit = int(request.args.get("limit", 20))
+        offset = int(request.args.get("offset", 0))
+        rows, has_more = catalog.search(
+            q,
+            limit=limit,
+            offset=offset,
+            show_id=request.args.get("show_id") or None,
+            kind=request.args.get("type") or None,
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except RuntimeError as exc:
+        return jsonify({"error": str(exc)}), 503
+    results = []
+    for r in rows:
+        snippet = str(escape(r["snippet"] or "")).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+        if r["episode_id"]:
+            url = url_for("edit_episode", show_id=r["show_id"], ep_id=r["episode_id"])
+        else:
+            url = url_for("show_page", show_id=r["show_id"])
+        results.append({
+            "type": "episode" if r["episode_id"] else "show",
+            "show_id": r["show_id"],
+            "episode_id": r["episode_id"] or None,
+            "title": r["title"],
+            "show_title": r["show_title"],
+            "snippet": snippet,
+            "url": url,
+        })
+    return jsonify({
+        "query": q,
+        "results": results,
+        "next_offset": max(0, offset) + len(rows) if has_more else None,
+    })
+
+
+@app.route("/api/changes")
+def changes_api():
+    """Change journal for incremental sync by downstream tools.
+
+    Returns the entries with ``seq > since`` (default 0) in order, at most
+    ``limit`` (default and max 1000) of them.  Consumers store ``next_since``
+    and pass it back as ``since``; ``has_more`` means another page is ready.
+    """
+    try:
+        since = int(request.args.get("since", 0))
+        limit = int(request.args.get("limit", 1000))
+        rows, has_more = catalog.changes_since(since, limit)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    changes = [{
+        "seq": r["seq"],
+        "ts": datetime.fromtimestamp(r["ts"], timezone.utc).isoformat(),
+        "show_id": r["show_id"],
+        "episode_id": r["episode_id"] or None,
+        "action": r["action"],
+        "detail": r["detail"],
+    } for r in rows]
+    return jsonify({
+        "changes": changes,
+        "next_since": changes[-1]["seq"] if changes else max(since, 0),
+        "has_more": has_more,
+        "last_seq": catalog.last_change_seq(),
+    })
+
+
 @app.route("/api/batch_upload/metadata")
 def batch_metadata_api():
     """API endpoint to get metadata from Excel file based on language"""
@@ -2110,20 +2284,19 @@ def batch_upload_episodes():
                     try:
                         show_cfg_path = SHOWS_DIR / episode['showId'] / 'config.json'
                         if show_cfg_path.exists():
-                            with show_cfg_path.open('r', encoding='utf-8') as scf:
-                                show_cfg = json.load(scf)
                             updated = False
-                            # Override placeholder as well
-                            if (not show_cfg.get('category_main')) or show_cfg.get('category_main', '').lower() == 'arts':
-                                show_cfg['category_main'] = cat_main; updated = True
-                            if cat_sub and (not show_cfg.get('category_sub')):
-                                show_cfg['category_sub'] = cat_sub; updated = True
-                            # Override default placeholder category
-                            if (not show_cfg.get('category')) or show_cfg.get('category', '').lower() == 'arts':
-                                show_cfg['category'] = cat_main; updated = True
+                            # Записывается только при изменениях (см. update_json)
+                            with update_json(show_cfg_path) as show_cfg:
+                                # Override placeholder as well
+                                if (not show_cfg.get('category_main')) or show_cfg.get('category_main', '').lower() == 'arts':
+                                    show_cfg['category_main'] = cat_main; updated = True
+                                if cat_sub and (not show_cfg.get('category_sub')):
+                                    show_cfg['category_sub'] = cat_sub; updated = True
+                                # Override default placeholder category
+                                if (not show_cfg.get('category')) or show_cfg.get('category', '').lower() == 'arts':
+                                    show_cfg['category'] = cat_main; updated = True
                             if updated:
-                                with show_cfg_path.open('w', encoding='utf-8') as scf:
-                                    json.dump(show_cfg, scf, ensure_ascii=False, indent=2)
+                                show_changed(episode['showId'])
                     except Exception as exc:
                         app.logger.warning(f"Genre mapping update failed for show {episode['showId']}: {exc}")
             show_id = episode['showId']
@@ -2187,8 +2360,7 @@ def batch_upload_episodes():
                 episode_config.setdefault("category_sub", "")
 
             # Сохранение конфигурации
-            with open(episode_dir / "config.json", "w", encoding="utf-8") as f:
-                json.dump(episode_config, f, ensure_ascii=False, indent=2)
+            write_json(episode_dir / "config.json", episode_config)
                 
             # --- Обработка медиафайлов и обновление метаданных ---
             audio_temp = episode.get('audioFile') or episode.get('tempFile')
@@ -2218,6 +2390,7 @@ def batch_upload_episodes():
                 meta.setdefault("category_sub", "")
 
             # === AUDIO ===
+            bg_audio_path = None
             if audio_temp:
                 audio_src = (BASE_DIR / audio_temp.lstrip('/')).resolve()
                 if audio_src.exists():
@@ -2232,14 +2405,15 @@ def batch_upload_episodes():
                     try:
                         if audio_src.parent.parent == UPLOADS_DIR:
                             shutil.rmtree(audio_src.parent, ignore_errors=True)
+                            remove_lock_file(audio_src.parent / "metadata.json")
                     except Exception:
                         pass
                     audio_url = f"/shows/{show_id}/episodes/{episode_id}/{audio_filename}"
                     episode_config["audio"] = audio_url
                     meta["audio"] = audio_url
                     meta["conversion_status"] = "processing"
-                    # стартуем фоновую обработку (транскодирование, теги и т.д.)
-                    threading.Thread(target=process_audio_background, args=(str(dest_audio_path), show_id, episode_id)).start()
+                    # фоновую обработку стартуем после записи metadata.json (ниже)
+                    bg_audio_path = dest_audio_path
                 else:
                     app.logger.error(f"[batch] Audio temp file not found: {audio_temp}")
 
@@ -2267,17 +2441,19 @@ def batch_upload_episodes():
 
             # Сохраняем обновлённый config.json
             try:
-                with open(episode_dir / "config.json", "w", encoding="utf-8") as f:
-                    json.dump(episode_config, f, ensure_ascii=False, indent=2)
+                write_json(episode_dir / "config.json", episode_config)
             except Exception as exc:
                 app.logger.error(f"[batch] Failed to write config.json for {episode_id}: {exc}")
 
             # Сохраняем metadata.json (используется процессом обработки и фронтом)
             try:
-                with open(episode_dir / "metadata.json", "w", encoding="utf-8") as mf:
-                    json.dump(meta, mf, ensure_ascii=False, indent=2)
+                write_episode_meta(episode_dir, meta)
             except Exception as exc:
                 app.logger.error(f"[batch] Failed to write metadata.json for {episode_id}: {exc}")
+            if bg_audio_path is not None:
+                # стартуем фоновую обработку (транскодирование, теги и т.д.)
+                threading.Thread(target=process_audio_background, args=(str(bg_audio_path), show_id, episode_id)).start()
+            show_changed(show_id, episode_id, "create")
             
             results.append({
                 'number': number,
@@ -2329,8 +2505,7 @@ def create_episode_id(title):
                     current_settings["chunked_upload_default"] = bool(new_settings["chunked_upload_default"])
                 
                 # Save settings
-                with open(SETTINGS_FILE, 'w') as f:
-                    json.dump(current_settings, f, indent=2)
+                write_json(SETTINGS_FILE, current_settings)
                 
                 return jsonify({"success": True})
             except Exception as e:
@@ -2406,4 +2581,11 @@ except ImportError as e:
         app.logger.warning("Please install pandas: pip install pandas")
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Podcast Publisher web app")
+    parser.add_argument("--enable-analytics", action="store_true", help="Record episode downloads (same as ENABLE_ANALYTICS=1)")
+    if parser.parse_args().enable_analytics:
+        ENABLE_ANALYTICS = True
+        download_recorder = start_recorder()
     app.run(host="0.0.0.0", port=5050)
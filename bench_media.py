@@ -0,0 +1,153 @@
+"""Benchmark media downloads: Flask ``send_file`` vs. ``media_send.file_response``.
+
+Creates a throw-away media file, starts one Werkzeug server process per
+serving path (the same server ``python app.py`` runs) and downloads from it
+over loopback:
+
+* full — whole-file GET requests (a podcast client downloading an episode);
+* range — GET requests for ``--range-mb`` byte ranges at random offsets
+  (players seeking and streaming), as many as add up to the file size.
+
+For every case it prints the throughput seen by the client and the CPU time
+the server process spent per GB sent (user + system, read from the server
+before and after the case), which is what decides how many concurrent
+downloads one worker can sustain.
+
+The file is read once before the runs, so both paths are served from the
+OS page cache and disk speed does not enter the comparison.
+
+Usage:
+    python bench_media.py                       # 256 MB file, 3 runs
+    python bench_media.py --size-mb 1024 --repeat 5 --range-mb 1
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+MODES = ("send_file", "sendfile")
+READ_SIZE = 1024 * 1024
+
+
+def serve(mode: str, path: Path) -> None:
+    """Server process: print the port, then serve *path* until killed."""
+    import logging
+
+    from flask import Flask, request, send_file
+    from werkzeug.serving import make_server
+
+    from media_send import file_response
+
+    app = Flask(__name__)
+
+    @app.route("/media")
+    def media():
+        if mode == "sendfile":
+            return file_response(request.environ, path, "audio/mpeg")
+        return send_file(path, mimetype="audio/mpeg", conditional=True)
+
+    @app.route("/cpu")
+    def cpu():
+        t = os.times()
+        return f"{t.user + t.system!r}"
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def server_cpu(conn: http.client.HTTPConnection) -> float:
+    conn.request("GET", "/cpu")
+    return float(conn.getresponse().read())
+
+
+def download(conn: http.client.HTTPConnection, headers: dict, buf: bytearray) -> int:
+    conn.request("GET", "/media", headers=headers)
+    response = conn.getresponse()
+    if response.status not in (200, 206):
+        raise RuntimeError(f"unexpected status {response.status}")
+    view, total = memoryview(buf), 0
+    while True:
+        n = response.readinto(view)
+        if not n:
+            break
+        total += n
+    return total
+
+
+def bench_mode(mode: str, path: Path, size: int, repeat: int, range_size: int) -> dict:
+    proc = subprocess.Popen([sys.executable, __file__, "--serve", mode, str(path)],
+                            stdout=subprocess.PIPE, text=True, cwd=Path(__file__).resolve().parent)
+    try:
+        port = int(proc.stdout.readline())
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        buf = bytearray(READ_SIZE)
+        rng = random.Random(42)
+        ranges = []
+        for _ in range(max(1, size // range_size)):
+            start = rng.randrange(0, max(1, size - range_size))
+            ranges.append({"Range": f"bytes={start}-{start + range_size - 1}"})
+        cases = {
+            "full": [{}] * repeat,
+            "range": ranges * repeat,
+        }
+        download(conn, {}, buf)  # warm up the server and the page cache
+        results = {}
+        for case, requests in cases.items():
+            cpu_before = server_cpu(conn)
+            start = time.perf_counter()
+            sent = sum(download(conn, headers, buf) for headers in requests)
+            elapsed = time.perf_counter() - start
+            cpu = server_cpu(conn) - cpu_before
+            results[case] = (sent, elapsed, cpu, len(requests))
+        return results
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def report(mode: str, results: dict) -> None:
+    for case, (sent, elapsed, cpu, count) in results.items():
+        gb = sent / 1e9
+        print(f"{mode:10} {case:6} {count:5} req  {sent / 1e6 / elapsed:9.1f} MB/s   "
+              f"server CPU {cpu / gb:7.3f} s/GB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--range-mb", type=float, default=4)
+    parser.add_argument("--serve", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], Path(args.serve[1]))
+        return
+
+    root = Path(tempfile.mkdtemp(prefix="bench-media-"))
+    try:
+        path = root / "episode.mp3"
+        with open(path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        size = path.stat().st_size
+        range_size = max(1, int(args.range_mb * 1024 * 1024))
+        print(f"{args.size_mb} MB file, {args.repeat} full downloads, {args.range_mb:g} MB ranges")
+        for mode in MODES:
+            report(mode, bench_mode(mode, path, size, args.repeat, range_size))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark episode metadata listing: per-episode metadata.json vs. compact episodes.jsonl.
+
+Creates a throw-away show with N episodes, then times
+:func:`metadata_store.list_episode_meta` in both layouts:
+
+* cold — fresh process-level caches (JSON cache and compact stores cleared),
+  i.e. the first listing after a worker starts;
+* warm — repeated listings with the caches populated, i.e. every later page
+  load or feed rebuild;
+* write — one metadata update followed by a listing (what the next request
+  after an edit pays).
+
+The OS page cache is not dropped, so "cold" measures parsing and file opens,
+not disk reads.
+
+Usage:
+    python bench_metadata.py                      # 2000 episodes
+    python bench_metadata.py --episodes 10000 --repeat 20
+"""
+from __future__ import annotations
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import metadata_store
+from json_cache import get_json_cache
+from metadata_store import (
+    list_episode_meta,
+    migrate_to_compact,
+    update_episode_meta,
+    write_json,
+)
+
+
+def make_show(root: Path, episodes: int) -> Path:
+    show_dir = root / "bench-show"
+    (show_dir / "episodes").mkdir(parents=True)
+    write_json(show_dir / "config.json", {"title": "Benchmark show", "language": "en"})
+    for i in range(episodes):
+        ep_dir = show_dir / "episodes" / f"ep{i:05d}"
+        ep_dir.mkdir()
+        write_json(ep_dir / "metadata.json", {
+            "title": f"Episode {i}",
+            "description": "<p>" + "Lorem ipsum dolor sit amet. " * 20 + "</p>",
+            "summary": "<p>Short summary</p>",
+            "pubdate": f"2024-01-01T00:{i % 60:02d}:00",
+            "filename": "audio.mp3",
+            "audio": f"/shows/bench-show/episodes/ep{i:05d}/audio.mp3",
+            "duration": "00:42:00",
+            "size_bytes": 40_000_000 + i,
+            "explicit": "no",
+            "conversion_status": "success",
+        })
+    return show_dir
+
+
+def reset_caches() -> None:
+    get_json_cache().clear()
+    metadata_store._stores.clear()
+
+
+def timed(fn, repeat: int) -> list:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def bench_layout(show_dir: Path, repeat: int) -> dict:
+    expected = len(list_episode_meta(show_dir))
+
+    def cold():
+        reset_caches()
+        assert len(list_episode_meta(show_dir)) == expected
+
+    def warm():
+        assert len(list_episode_meta(show_dir)) == expected
+
+    counter = iter(range(10 ** 9))
+    ep_dir = show_dir / "episodes" / "ep00000"
+
+    def write_then_list():
+        with update_episode_meta(ep_dir) as meta:
+            meta["title"] = f"Edited {next(counter)}"
+        assert len(list_episode_meta(show_dir)) == expected
+
+    list_episode_meta(show_dir)  # populate caches before the warm runs
+    return {
+        "cold": timed(cold, repeat),
+        "warm": timed(warm, repeat),
+        "write": timed(write_then_list, repeat),
+    }
+
+
+def report(name: str, results: dict) -> None:
+    for kind, times in results.items():
+        print(f"{name:8} {kind:6} median {statistics.median(times) * 1000:9.2f} ms   min {min(times) * 1000:9.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--episodes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="bench-metadata-"))
+    # Lock files of the throw-away show stay inside the temp directory
+    metadata_store.LOCK_DIR = root / "locks"
+    try:
+        show_dir = make_show(root, args.episodes)
+        print(f"{args.episodes} episodes, {args.repeat} runs each")
+        report("dirs", bench_layout(show_dir, args.repeat))
+        reset_caches()
+        migrate_to_compact(show_dir)
+        report("compact", bench_layout(show_dir, args.repeat))
+        print(f"compact file: {(show_dir / metadata_store.COMPACT_FILE).stat().st_size / 1024:.0f} KiB")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,762 @@
+"""SQLite catalog of shows, episodes and their files.
+
+The catalog is an index of what is stored under ``shows/``; the files on disk
+stay the source of truth.  Every write path in ``app.py`` and ``episode.py``
+re-syncs the show or episode it touched, and ``python publisher.py
+rebuild-catalog`` reconstructs the whole catalog from disk (e.g. after files
+were copied in by hand).  Pages and APIs that list shows and episodes read
+the catalog instead of walking directories and decoding every JSON file.
+"""
+from __future__ import annotations
+
+import base64
+import datetime
+import functools
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from json_cache import JSON_CACHE_SIZE, load_json
+from metadata_store import COMPACT_FILE, read_episode_meta
+from scanner import AUDIO_EXTS, COVER_EXTS, DirScan, scan_dir, scan_subdirs
+from utils import html_to_plain_text
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_DB_PATH = Path(os.getenv("CATALOG_DB", BASE_DIR / "data" / "catalog.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shows (
+    id           TEXT PRIMARY KEY,
+    title        TEXT NOT NULL,
+    language     TEXT NOT NULL DEFAULT '',
+    config       TEXT NOT NULL,          -- config.json as stored on disk
+    cover        TEXT,                   -- first cover image file name
+    cover_mtime  INTEGER,
+    dir_mtime_ns INTEGER NOT NULL,
+    synced_at    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    show_id      TEXT NOT NULL,
+    id           TEXT NOT NULL,
+    title        TEXT NOT NULL,
+    metadata     TEXT,                   -- metadata.json, NULL if the episode has none
+    pub_ts       REAL NOT NULL,          -- pubdate, falls back to the dir mtime
+    dir_mtime_ns INTEGER NOT NULL,
+    audio        TEXT,                   -- first audio file name
+    audio_size   INTEGER,
+    image        TEXT,                   -- first cover image file name
+    image_mtime  INTEGER,
+    synced_at    REAL NOT NULL,
+    PRIMARY KEY (show_id, id)
+);
+-- (sort key, id) indexes serve both ORDER BY and keyset pagination cursors
+CREATE INDEX IF NOT EXISTS episodes_by_mtime_id ON episodes (show_id, dir_mtime_ns, id);
+CREATE INDEX IF NOT EXISTS episodes_by_pubdate_id ON episodes (show_id, pub_ts, id);
+CREATE INDEX IF NOT EXISTS episodes_by_title_id ON episodes (show_id, title COLLATE NOCASE, id);
+CREATE TABLE IF NOT EXISTS files (
+    show_id    TEXT NOT NULL,
+    episode_id TEXT NOT NULL DEFAULT '',  -- '' for show-level files
+    name       TEXT NOT NULL,
+    kind       TEXT NOT NULL,             -- audio | image | metadata | other
+    size       INTEGER NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    PRIMARY KEY (show_id, episode_id, name)
+);
+CREATE INDEX IF NOT EXISTS files_by_kind ON files (show_id, episode_id, kind);
+-- keep the per-show aggregates of show_summaries index-only
+CREATE INDEX IF NOT EXISTS files_by_mtime ON files (show_id, mtime_ns);
+CREATE INDEX IF NOT EXISTS episodes_listed ON episodes (show_id) WHERE metadata IS NOT NULL;
+-- one narrow row per show for the show list, the sidebar and /api/shows;
+-- recomputed for a single show whenever that show is synced
+CREATE TABLE IF NOT EXISTS show_summaries (
+    id            TEXT PRIMARY KEY,
+    title         TEXT NOT NULL,
+    language      TEXT NOT NULL DEFAULT '',
+    description   TEXT NOT NULL DEFAULT '',
+    image         TEXT,                  -- "image" from config.json, if any
+    cover         TEXT,
+    cover_mtime   INTEGER,
+    episode_count INTEGER NOT NULL DEFAULT 0,  -- episodes with metadata
+    updated_ns    INTEGER NOT NULL DEFAULT 0   -- newest file of the show or its episodes
+);
+-- append-only journal of changes for downstream consumers (/api/changes);
+-- AUTOINCREMENT keeps seq strictly increasing across processes and is
+-- never reused, and rebuild() leaves the journal alone
+CREATE TABLE IF NOT EXISTS changes (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts         REAL NOT NULL,
+    show_id    TEXT NOT NULL,
+    episode_id TEXT NOT NULL DEFAULT '',  -- '' for show-level changes
+    action     TEXT NOT NULL,             -- see CHANGE_ACTIONS
+    detail     TEXT
+);
+-- content fingerprints of media files (fingerprint.py), keyed by the path
+-- inside shows/ and valid while the file's size and mtime are unchanged
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest   TEXT NOT NULL
+);
+"""
+# create/update/delete of a show or episode; "media" = audio or cover replaced
+# or (re)processed
+CHANGE_ACTIONS = ("create", "update", "delete", "media")
+MAX_CHANGES_PAGE = 1000
+
+# Full-text search over shows and episodes.  Kept out of SCHEMA because FTS5
+# is an optional SQLite module: without it the catalog works, search does not.
+# search_docs maps (show_id, episode_id) to the FTS rowid so a document can be
+# replaced or deleted by key without scanning the index.
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    docid      INTEGER PRIMARY KEY,
+    show_id    TEXT NOT NULL,
+    episode_id TEXT NOT NULL DEFAULT '',  -- '' for the show itself
+    UNIQUE (show_id, episode_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    title, summary, description, genres,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+# bm25() weights of title, summary, description, genres
+SEARCH_WEIGHTS = (10.0, 4.0, 1.0, 2.0)
+MAX_SEARCH_RESULTS = 100
+# Highlight markers in snippets; callers escape the text and then replace them
+SNIPPET_START, SNIPPET_END = "\x02", "\x03"
+
+_SUMMARY_SQL = """
+INSERT OR REPLACE INTO show_summaries
+    (id, title, language, description, image, cover, cover_mtime, episode_count, updated_ns)
+SELECT id, title, language,
+       COALESCE(json_extract(config, '$.description'), ''),
+       json_extract(config, '$.image'),
+       cover, cover_mtime,
+       (SELECT COUNT(*) FROM episodes WHERE show_id = shows.id AND metadata IS NOT NULL),
+       MAX(dir_mtime_ns, COALESCE((SELECT MAX(mtime_ns) FROM files WHERE show_id = shows.id), 0))
+FROM shows
+"""
+
+EPISODE_ORDERS = {
+    "mtime": "dir_mtime_ns DESC, id DESC",
+    "pubdate": "pub_ts DESC, id DESC",
+}
+# Sort keys of page_episodes(); every one is backed by an (show_id, key, id) index
+EPISODE_SORT_KEYS = {
+    "mtime": "dir_mtime_ns",
+    "pubdate": "pub_ts",
+    "title": "title COLLATE NOCASE",
+}
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(key, ep_id: str) -> str:
+    """Opaque pagination cursor for the row with sort value *key* and id *ep_id*."""
+    raw = json.dumps([key, ep_id], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of :func:`encode_cursor`; ``ValueError`` for a malformed cursor."""
+    try:
+        key, ep_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"invalid cursor {cursor!r}") from exc
+    if not isinstance(ep_id, str):
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return key, ep_id
+
+
+def search_fields(info: dict) -> tuple:
+    """(title, summary, description, genres) of a config.json/metadata.json as plain text."""
+    genres = info.get("genres") or []
+    if isinstance(genres, str):
+        genres = [genres]
+    genres = list(genres) + [info.get(k) for k in ("category", "category_main", "category_sub")]
+    return (
+        str(info.get("title") or ""),
+        html_to_plain_text(str(info.get("summary") or "")),
+        html_to_plain_text(str(info.get("description") or "")),
+        " ".join(str(g) for g in genres if g),
+    )
+
+
+def fts_query(text: str) -> str:
+    """Turn free user input into an FTS5 query: every word must match, the
+    last one as a prefix (it may still be being typed).
+
+    Words are quoted, so FTS5 operators and punctuation in *text* are inert.
+    Only the last word is a prefix query because a short prefix expands to
+    many terms and ranking cost grows with the number of matching documents.
+    """
+    words = [f'"{w}"' for w in re.findall(r"\w+", text)]
+    if words:
+        words[-1] += "*"
+    return " ".join(words)
+
+
+def _file_kind(name: str, suffix: str) -> str:
+    if name in ("metadata.json", "config.json", COMPACT_FILE):
+        return "metadata"
+    if suffix in AUDIO_EXTS:
+        return "audio"
+    if suffix in COVER_EXTS:
+        return "image"
+    return "other"
+
+
+def _pub_ts(meta: dict, fallback: float) -> float:
+    """Same interpretation of ``pubdate`` as the feed renderer (naive = UTC)."""
+    try:
+        dt = datetime.datetime.fromisoformat(meta.get("pubdate"))
+        return (dt if dt.tzinfo else dt.replace(tzinfo=datetime.timezone.utc)).timestamp()
+    except (ValueError, TypeError, AttributeError):
+        return fallback
+
+
+# Rows are re-read on every page load; parse each distinct JSON text only once.
+# The parsed objects are shared, callers must not modify them.
+_parse_json = functools.lru_cache(maxsize=JSON_CACHE_SIZE)(json.loads)
+
+
+def _read_json(path: Path) -> Optional[dict]:
+    try:
+        data = load_json(path)
+        return data if isinstance(data, dict) else None
+    except (OSError, ValueError) as exc:
+        logger.warning("Catalog: cannot read %s: %s", path, exc)
+        return None
+
+
+class Catalog:
+    """Thread-safe handle on the catalog database (one connection per thread)."""
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH, shows_dir: Path = BASE_DIR / "shows"):
+        self.db_path = Path(db_path)
+        self.shows_dir = Path(shows_dir)
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self.search_enabled = True
+
+    # -- connection ---------------------------------------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    try:
+                        conn.executescript(SEARCH_SCHEMA)
+                    except sqlite3.OperationalError as exc:
+                        logger.warning("Catalog: full-text search disabled (%s)", exc)
+                        self.search_enabled = False
+                    self._schema_ready = True
+        return conn
+
+    def _write(self):
+        """Context manager for one write transaction."""
+        return _Transaction(self._conn())
+
+    def ensure_ready(self) -> None:
+        """Create the schema and build the catalog if it is empty but shows exist."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM shows LIMIT 1").fetchone() is None and self.shows_dir.exists():
+            logger.info("Catalog %s is empty, building it from %s", self.db_path, self.shows_dir)
+            self.rebuild()
+            return
+        if conn.execute("SELECT 1 FROM show_summaries LIMIT 1").fetchone() is None:
+            # Catalog created before show_summaries existed
+            with self._write() as conn:
+                self._refresh_summaries(conn)
+        if self.search_enabled and conn.execute("SELECT 1 FROM search_docs LIMIT 1").fetchone() is None:
+            # ... or before the search index existed
+            with self._write() as conn:
+                self._reindex_search(conn)
+
+    # -- sync (called after writes) -----------------------------------
+    def sync_show(self, show_id: str) -> bool:
+        """Refresh the show row and show-level files; ``False`` if the show is gone."""
+        show_dir = self.shows_dir / show_id
+        try:
+            scan = scan_dir(show_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            self.delete_show(show_id)
+            return False
+        cfg = _read_json(show_dir / "config.json") if scan.has("config.json") else None
+        if cfg is None:
+            self.delete_show(show_id)
+            return False
+        with self._write() as conn:
+            self._upsert_show(conn, show_id, scan, cfg)
+            self._refresh_summaries(conn, show_id)
+        return True
+
+    def sync_episode(self, show_id: str, ep_id: str) -> bool:
+        """Refresh one episode row and its files; ``False`` if the episode is gone."""
+        ep_dir = self.shows_dir / show_id / "episodes" / ep_id
+        try:
+            scan = scan_dir(ep_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            self.delete_episode(show_id, ep_id)
+            return False
+        with self._write() as conn:
+            self._upsert_episode(conn, show_id, scan)
+            self._refresh_summaries(conn, show_id)
+        return True
+
+    def sync_show_tree(self, show_id: str) -> bool:
+        """Refresh a show and all of its episodes, dropping episodes no longer on disk."""
+        show_dir = self.shows_dir / show_id
+        try:
+            scan = scan_dir(show_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            self.delete_show(show_id)
+            return False
+        cfg = _read_json(show_dir / "config.json") if scan.has("config.json") else None
+        if cfg is None:
+            self.delete_show(show_id)
+            return False
+        with self._write() as conn:
+            self._sync_tree(conn, show_id, scan, cfg)
+            self._refresh_summaries(conn, show_id)
+        return True
+
+    def delete_show(self, show_id: str) -> None:
+        with self._write() as conn:
+            conn.execute("DELETE FROM shows WHERE id = ?", (show_id,))
+            conn.execute("DELETE FROM episodes WHERE show_id = ?", (show_id,))
+            conn.execute("DELETE FROM files WHERE show_id = ?", (show_id,))
+            conn.execute("DELETE FROM show_summaries WHERE id = ?", (show_id,))
+            self._unindex(conn, show_id)
+            self._drop_fingerprints(conn, f"{show_id}/")
+
+    def delete_episode(self, show_id: str, ep_id: str) -> None:
+        with self._write() as conn:
+            conn.execute("DELETE FROM episodes WHERE show_id = ? AND id = ?", (show_id, ep_id))
+            conn.execute("DELETE FROM files WHERE show_id = ? AND episode_id = ?", (show_id, ep_id))
+            self._unindex(conn, show_id, ep_id)
+            self._drop_fingerprints(conn, f"{show_id}/episodes/{ep_id}/")
+            self._refresh_summaries(conn, show_id)
+
+    def rebuild(self) -> Dict[str, int]:
+        """Reconstruct the whole catalog from disk in one transaction."""
+        counts = {"shows": 0, "episodes": 0}
+        started = time.monotonic()
+        shows_scan = scan_dir(self.shows_dir) if self.shows_dir.exists() else None
+        with self._write() as conn:
+            conn.execute("DELETE FROM shows")
+            conn.execute("DELETE FROM episodes")
+            conn.execute("DELETE FROM files")
+            conn.execute("DELETE FROM show_summaries")
+            if self.search_enabled:
+                conn.execute("DELETE FROM search_index")
+                conn.execute("DELETE FROM search_docs")
+            for scan in (scan_subdirs(shows_scan) if shows_scan else ()):
+                cfg = _read_json(scan.path / "config.json") if scan.has("config.json") else None
+                if cfg is None:
+                    continue
+                counts["shows"] += 1
+                counts["episodes"] += self._sync_tree(conn, scan.name, scan, cfg)
+            self._refresh_summaries(conn)
+        logger.info(
+            "Catalog rebuilt: %d shows, %d episodes in %.2fs",
+            counts["shows"], counts["episodes"], time.monotonic() - started,
+        )
+        return counts
+
+    # -- change journal -----------------------------------------------
+    def record_change(self, show_id: str, ep_id: Optional[str] = None, action: str = "update", detail: Optional[str] = None) -> int:
+        """Append one entry to the change journal and return its sequence number."""
+        if action not in CHANGE_ACTIONS:
+            raise ValueError(f"unknown change action {action!r}")
+        with self._write() as conn:
+            return conn.execute(
+                "INSERT INTO changes (ts, show_id, episode_id, action, detail) VALUES (?, ?, ?, ?, ?)",
+                (time.time(), show_id, ep_id or "", action, detail),
+            ).lastrowid
+
+    def changes_since(self, since: int = 0, limit: int = MAX_CHANGES_PAGE) -> tuple:
+        """Journal entries with ``seq > since`` in order, as ``(changes, has_more)``."""
+        limit = max(1, min(int(limit), MAX_CHANGES_PAGE))
+        rows = self._conn().execute(
+            "SELECT * FROM changes WHERE seq > ? ORDER BY seq LIMIT ?", (int(since), limit + 1)
+        ).fetchall()
+        return [dict(r) for r in rows[:limit]], len(rows) > limit
+
+    def last_change_seq(self) -> int:
+        row = self._conn().execute("SELECT MAX(seq) FROM changes").fetchone()
+        return row[0] or 0
+
+    # -- media fingerprints -------------------------------------------
+    def get_fingerprint(self, path: Path, size: int, mtime_ns: int) -> Optional[str]:
+        """Stored fingerprint of *path* if it was computed for this size and mtime."""
+        key = self._fingerprint_key(path)
+        if key is None:
+            return None
+        row = self._conn().execute(
+            "SELECT digest FROM fingerprints WHERE path = ? AND size = ? AND mtime_ns = ?", (key, size, mtime_ns)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_fingerprint(self, path: Path, size: int, mtime_ns: int, digest: str) -> None:
+        key = self._fingerprint_key(path)
+        if key is None:
+            return
+        with self._write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                (key, size, mtime_ns, digest),
+            )
+
+    def _fingerprint_key(self, path: Path) -> Optional[str]:
+        """*path* relative to the shows directory, ``None`` for files outside it."""
+        try:
+            return Path(path).resolve().relative_to(self.shows_dir.resolve()).as_posix()
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _drop_fingerprints(conn: sqlite3.Connection, prefix: str) -> None:
+        # Range scan over the primary key: every path that starts with prefix
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        conn.execute("DELETE FROM fingerprints WHERE path >= ? AND path < ?", (prefix, upper))
+
+    # -- queries ------------------------------------------------------
+    def list_shows(self) -> List[dict]:
+        rows = self._conn().execute("SELECT * FROM shows ORDER BY id").fetchall()
+        return [self._show_dict(r) for r in rows]
+
+    def list_show_summaries(self) -> List[dict]:
+        """One summary per show (title, language, description, cover, episode
+        count, last update), without decoding any config JSON."""
+        rows = self._conn().execute("SELECT * FROM show_summaries ORDER BY id").fetchall()
+        return [dict(r) for r in rows]
+
+    def get_show(self, show_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT * FROM shows WHERE id = ?", (show_id,)).fetchone()
+        return self._show_dict(row) if row else None
+
+    def list_episodes(self, show_id: str, order: str = "mtime", with_metadata: bool = False) -> List[dict]:
+        """Episodes of a show, newest first by dir mtime (``order="mtime"``) or pubdate."""
+        sql = "SELECT * FROM episodes WHERE show_id = ?"
+        if with_metadata:
+            sql += " AND metadata IS NOT NULL"
+        sql += f" ORDER BY {EPISODE_ORDERS[order]}"
+        return [self._episode_dict(r) for r in self._conn().execute(sql, (show_id,)).fetchall()]
+
+    def page_episodes(
+        self,
+        show_id: str,
+        sort: str = "mtime",
+        descending: bool = True,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        query: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> tuple:
+        """One page of a show's episodes (with metadata) using keyset pagination.
+
+        Returns ``(episodes, next_cursor)``; *next_cursor* is ``None`` on the
+        last page.  Each page is a single index range scan, so its cost does
+        not depend on how many episodes come before it.  *query* matches the
+        title (case-insensitive for ASCII), *status* the ``conversion_status``
+        stored in metadata.json.  Raises ``ValueError`` for an unknown *sort*
+        or a malformed *cursor*.
+        """
+        if sort not in EPISODE_SORT_KEYS:
+            raise ValueError(f"unknown sort {sort!r}")
+        key_sql = EPISODE_SORT_KEYS[sort]
+        cmp, direction = ("<", "DESC") if descending else (">", "ASC")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        sql = f"SELECT *, {key_sql} AS sort_key FROM episodes WHERE show_id = ? AND metadata IS NOT NULL"
+        args: list = [show_id]
+        if cursor:
+            key, ep_id = decode_cursor(cursor)
+            sql += f" AND ({key_sql} {cmp} ? OR ({key_sql} = ? AND id {cmp} ?))"
+            args += [key, key, ep_id]
+        if query:
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            sql += " AND title LIKE ? ESCAPE '\\'"
+            args.append(f"%{escaped}%")
+        if status:
+            sql += " AND json_extract(metadata, '$.conversion_status') = ?"
+            args.append(status)
+        sql += f" ORDER BY {key_sql} {direction}, id {direction} LIMIT ?"
+        args.append(limit + 1)  # one extra row tells whether there is a next page
+
+        rows = self._conn().execute(sql, args).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last["sort_key"], last["id"])
+        episodes = []
+        for r in rows:
+            d = self._episode_dict(r)
+            del d["sort_key"]
+            episodes.append(d)
+        return episodes, next_cursor
+
+    def search(
+        self,
+        text: str,
+        limit: int = 20,
+        offset: int = 0,
+        show_id: Optional[str] = None,
+        kind: Optional[str] = None,
+    ) -> tuple:
+        """Ranked full-text search over show and episode titles, summaries,
+        descriptions and genres.
+
+        Every word of *text* must match, the last one as a prefix (see
+        :func:`fts_query`).  *show_id* restricts the
+        search to one show, *kind* (``"show"``/``"episode"``) to one type of
+        document.  Returns ``(results, has_more)``; each result carries
+        ``show_id``, ``episode_id`` (``""`` for a show), ``title``,
+        ``show_title`` and a ``snippet`` with matches wrapped in
+        SNIPPET_START/SNIPPET_END.  Raises ``RuntimeError`` when SQLite has
+        no FTS5.
+        """
+        conn = self._conn()
+        if not self.search_enabled:
+            raise RuntimeError("full-text search is not available (SQLite without FTS5)")
+        match = fts_query(text)
+        if not match:
+            return [], False
+        limit = max(1, min(int(limit), MAX_SEARCH_RESULTS))
+        offset = max(0, int(offset))
+        weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+        sql = (
+            "SELECT d.show_id, d.episode_id, search_index.title AS title,"
+            f" snippet(search_index, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 16) AS snippet,"
+            f" bm25(search_index, {weights}) AS score, s.title AS show_title"
+            " FROM search_index JOIN search_docs d ON d.docid = search_index.rowid"
+            " LEFT JOIN show_summaries s ON s.id = d.show_id"
+            " WHERE search_index MATCH ?"
+        )
+        args: list = [match]
+        if show_id:
+            sql += " AND d.show_id = ?"
+            args.append(show_id)
+        if kind == "show":
+            sql += " AND d.episode_id = ''"
+        elif kind == "episode":
+            sql += " AND d.episode_id != ''"
+        elif kind:
+            raise ValueError(f"unknown kind {kind!r}")
+        sql += " ORDER BY score, d.docid LIMIT ? OFFSET ?"
+        args += [limit + 1, offset]
+        rows = [dict(r) for r in conn.execute(sql, args).fetchall()]
+        return rows[:limit], len(rows) > limit
+
+    def iter_episodes_by_pubdate(self, show_id: str) -> Iterator[tuple]:
+        """Lazily yield ``(pub_ts, id)`` of a show's episodes with metadata, newest first.
+
+        Rows are stepped through the (show_id, pub_ts, id) index as they are
+        consumed, so a reader that stops early never reads the rest.
+        """
+        yield from self._conn().execute(
+            "SELECT pub_ts, id FROM episodes WHERE show_id = ? AND metadata IS NOT NULL"
+            " ORDER BY pub_ts DESC, id DESC",
+            (show_id,),
+        )
+
+    def get_episode(self, show_id: str, ep_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT * FROM episodes WHERE show_id = ? AND id = ?", (show_id, ep_id)
+        ).fetchone()
+        return self._episode_dict(row) if row else None
+
+    def list_files(self, show_id: str, ep_id: str = "", kind: Optional[str] = None) -> List[dict]:
+        sql = "SELECT name, kind, size, mtime_ns FROM files WHERE show_id = ? AND episode_id = ?"
+        args = [show_id, ep_id]
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        return [dict(r) for r in self._conn().execute(sql + " ORDER BY name", args).fetchall()]
+
+    # -- internals ----------------------------------------------------
+    @staticmethod
+    def _show_dict(row: sqlite3.Row) -> dict:
+        d = dict(row)
+        d["config"] = _parse_json(d["config"])
+        return d
+
+    @staticmethod
+    def _episode_dict(row: sqlite3.Row) -> dict:
+        d = dict(row)
+        d["metadata"] = _parse_json(d["metadata"]) if d["metadata"] is not None else None
+        return d
+
+    @staticmethod
+    def _refresh_summaries(conn: sqlite3.Connection, show_id: Optional[str] = None) -> None:
+        """Recompute the show_summaries row of *show_id* (of every show if ``None``)."""
+        if show_id is None:
+            conn.execute(_SUMMARY_SQL)
+        else:
+            conn.execute(_SUMMARY_SQL + " WHERE id = ?", (show_id,))
+
+    def _index(self, conn: sqlite3.Connection, show_id: str, ep_id: str, info: Optional[dict]) -> None:
+        """Put (or with *info* ``None``, drop) one document of the search index."""
+        if not self.search_enabled:
+            return
+        row = conn.execute(
+            "SELECT docid FROM search_docs WHERE show_id = ? AND episode_id = ?", (show_id, ep_id)
+        ).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM search_index WHERE rowid = ?", (row[0],))
+            if info is None:
+                conn.execute("DELETE FROM search_docs WHERE docid = ?", (row[0],))
+                return
+            docid = row[0]
+        elif info is None:
+            return
+        else:
+            docid = conn.execute(
+                "INSERT INTO search_docs (show_id, episode_id) VALUES (?, ?)", (show_id, ep_id)
+            ).lastrowid
+        conn.execute(
+            "INSERT INTO search_index (rowid, title, summary, description, genres) VALUES (?, ?, ?, ?, ?)",
+            (docid, *search_fields(info)),
+        )
+
+    def _unindex(self, conn: sqlite3.Connection, show_id: str, ep_id: Optional[str] = None) -> None:
+        """Drop episode *ep_id* (or the show and all of its episodes) from the search index."""
+        if not self.search_enabled:
+            return
+        if ep_id is not None:
+            self._index(conn, show_id, ep_id, None)
+            return
+        conn.execute(
+            "DELETE FROM search_index WHERE rowid IN (SELECT docid FROM search_docs WHERE show_id = ?)",
+            (show_id,),
+        )
+        conn.execute("DELETE FROM search_docs WHERE show_id = ?", (show_id,))
+
+    def _reindex_search(self, conn: sqlite3.Connection) -> None:
+        """Rebuild the search index from the catalog rows (no disk access)."""
+        conn.execute("DELETE FROM search_index")
+        conn.execute("DELETE FROM search_docs")
+        for r in conn.execute("SELECT id, config FROM shows").fetchall():
+            self._index(conn, r["id"], "", json.loads(r["config"]))
+        for r in conn.execute("SELECT show_id, id, metadata FROM episodes WHERE metadata IS NOT NULL").fetchall():
+            meta = json.loads(r["metadata"])
+            self._index(conn, r["show_id"], r["id"], meta if isinstance(meta, dict) else None)
+
+    def _sync_tree(self, conn: sqlite3.Connection, show_id: str, scan: DirScan, cfg: dict) -> int:
+        self._upsert_show(conn, show_id, scan, cfg)
+        on_disk = []
+        if "episodes" in scan.dirs:
+            episodes_scan = scan_dir(scan.path / "episodes", scan.dirs["episodes"])
+            for ep_scan in scan_subdirs(episodes_scan):
+                self._upsert_episode(conn, show_id, ep_scan)
+                on_disk.append(ep_scan.name)
+        known = {r[0] for r in conn.execute("SELECT id FROM episodes WHERE show_id = ?", (show_id,))}
+        for ep_id in known.difference(on_disk):
+            conn.execute("DELETE FROM episodes WHERE show_id = ? AND id = ?", (show_id, ep_id))
+            conn.execute("DELETE FROM files WHERE show_id = ? AND episode_id = ?", (show_id, ep_id))
+            self._unindex(conn, show_id, ep_id)
+            self._drop_fingerprints(conn, f"{show_id}/episodes/{ep_id}/")
+        return len(on_disk)
+
+    def _replace_files(self, conn: sqlite3.Connection, show_id: str, ep_id: str, scan: DirScan) -> None:
+        conn.execute("DELETE FROM files WHERE show_id = ? AND episode_id = ?", (show_id, ep_id))
+        conn.executemany(
+            "INSERT INTO files (show_id, episode_id, name, kind, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)",
+            [(show_id, ep_id, f.name, _file_kind(f.name, f.suffix), f.size, f.mtime_ns) for f in scan.files.values()],
+        )
+
+    def _upsert_show(self, conn: sqlite3.Connection, show_id: str, scan: DirScan, cfg: dict) -> None:
+        cover = scan.first_image(COVER_EXTS, skip_hidden=True)
+        conn.execute(
+            "INSERT OR REPLACE INTO shows (id, title, language, config, cover, cover_mtime, dir_mtime_ns, synced_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                show_id,
+                str(cfg.get("title") or show_id),
+                str(cfg.get("language") or ""),
+                json.dumps(cfg, ensure_ascii=False),
+                cover.name if cover else None,
+                int(cover.mtime) if cover else None,
+                scan.mtime_ns,
+                time.time(),
+            ),
+        )
+        self._replace_files(conn, show_id, "", scan)
+        self._index(conn, show_id, "", cfg)
+
+    def _upsert_episode(self, conn: sqlite3.Connection, show_id: str, scan: DirScan) -> None:
+        try:
+            meta = read_episode_meta(scan.path)
+        except (OSError, ValueError) as exc:
+            logger.warning("Catalog: cannot read metadata of %s: %s", scan.path, exc)
+            meta = None
+        meta = meta if isinstance(meta, dict) else None
+        # Episodes created by episode.py only have config.json until media is added
+        info = meta or (_read_json(scan.path / "config.json") if scan.has("config.json") else None) or {}
+        audio = scan.first_audio()
+        image = scan.first_image(COVER_EXTS)
+        conn.execute(
+            "INSERT OR REPLACE INTO episodes (show_id, id, title, metadata, pub_ts, dir_mtime_ns,"
+            " audio, audio_size, image, image_mtime, synced_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                show_id,
+                scan.name,
+                str(info.get("title") or scan.name),
+                json.dumps(meta, ensure_ascii=False) if meta is not None else None,
+                _pub_ts(info, scan.mtime),
+                scan.mtime_ns,
+                audio.name if audio else None,
+                audio.size if audio else None,
+                image.name if image else None,
+                int(image.mtime) if image else None,
+                time.time(),
+            ),
+        )
+        self._replace_files(conn, show_id, scan.name, scan)
+        # Only episodes with metadata are listed, so only those are searchable
+        self._index(conn, show_id, scan.name, meta)
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+_default: Optional[Catalog] = None
+_default_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """Process-wide catalog for the default database (``CATALOG_DB``)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Catalog()
+        return _default
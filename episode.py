@@ -4,15 +4,31 @@ Provides functions for creating, updating, and deleting podcast episodes.
 """
 
 import os
-import json
 import time
 import logging
 import shutil
 from pathlib import Path
 
+from json_cache import load_json
+from metadata_store import update_json, write_json
+
 # Setup logger
 logger = logging.getLogger(__name__)
 
+
+def _sync_catalog(show_id, episode_id, action="update"):
+    """Keep the SQLite catalog (catalog.py) and its change journal in step with the episode directory."""
+    try:
+        from catalog import get_catalog
+        catalog = get_catalog()
+        if action == "delete":
+            catalog.delete_episode(show_id, episode_id)
+        else:
+            catalog.sync_episode(show_id, episode_id)
+        catalog.record_change(show_id, episode_id, action)
+    except Exception as e:
+        logger.error(f"Catalog sync failed for {show_id}/{episode_id}: {str(e)}")
+
 def create_episode(episode_data):
     """
     Creates a new episode based on the provided data.
@@ -79,9 +95,9 @@ def create_episode(episode_data):
         }
         
         # Save episode config
-        with open(episode_dir / "config.json", "w", encoding="utf-8") as f:
-            json.dump(episode_config, f, ensure_ascii=False, indent=2)
+        write_json(episode_dir / "config.json", episode_config)
         
+        _sync_catalog(show_id, episode_id, "create")
         logger.info(f"Created episode {episode_id} for show {show_id}")
         return episode_id
         
@@ -126,30 +142,25 @@ def update_episode(show_id, episode_id, episode_data):
             logger.error(f"Episode directory not found: {episode_dir}")
             return False
         
-        # Load existing config
-        with open(episode_dir / "config.json", "r", encoding="utf-8") as f:
-            config = json.load(f)
-        
-        # Update fields
-        if 'title' in episode_data:
-            config['title'] = episode_data['title']
+        # Load existing config and update it under the file lock
+        with update_json(episode_dir / "config.json") as config:
+            # Update fields
+            if 'title' in episode_data:
+                config['title'] = episode_data['title']
         
-        if 'description' in episode_data:
-            config['summary'] = episode_data['description']
+            if 'description' in episode_data:
+                config['summary'] = episode_data['description']
             
-        if 'about' in episode_data:
-            config['description'] = episode_data['about']
+            if 'about' in episode_data:
+                config['description'] = episode_data['about']
             
-        if 'number' in episode_data:
-            config['number'] = episode_data['number']
+            if 'number' in episode_data:
+                config['number'] = episode_data['number']
             
-        if 'tags' in episode_data:
-            config['genres'] = episode_data['tags']
-        
-        # Save updated config
-        with open(episode_dir / "config.json", "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+            if 'tags' in episode_data:
+                config['genres'] = episode_data['tags']
             
+        _sync_catalog(show_id, episode_id)
         logger.info(f"Updated episode {episode_id} for show {show_id}")
         return True
         
@@ -180,6 +191,7 @@ def delete_episode(show_id, episode_id):
         
         # Delete directory and all contents
         shutil.rmtree(episode_dir)
+        _sync_catalog(show_id, episode_id, "delete")
         
         logger.info(f"Deleted episode {episode_id} from show {show_id}")
         return True
@@ -210,8 +222,7 @@ def get_episode(show_id, episode_id):
             return None
         
         # Load config
-        with open(episode_dir / "config.json", "r", encoding="utf-8") as f:
-            config = json.load(f)
+        config = load_json(episode_dir / "config.json", copy=True)
             
         # Add episode ID to data
         config['id'] = episode_id
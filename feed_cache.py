@@ -0,0 +1,448 @@
+"""In-process cache for rendered RSS feeds.
+
+Each entry holds the rendered bytes of one feed together with the fingerprint
+of the inputs it was built from.  Lookups follow a stale-while-revalidate
+policy:
+
+* a missing entry is built in the calling thread; concurrent callers for the
+  same key wait for that single build instead of rendering in parallel;
+* an entry older than *ttl* seconds (or explicitly invalidated) is still
+  returned immediately while one background thread re-checks the fingerprint
+  and rebuilds the feed only if the inputs actually changed.
+
+Every entry is compressed once, at build time, into gzip and (when the
+optional ``brotli`` package is installed) brotli variants, so responses never
+compress per request.  Builders may return the document as an iterable of
+chunks; chunks are then encoded and compressed as they arrive instead of
+after the whole document has been joined.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterable, Iterator, Optional, Union
+
+from scanner import scan_dir, scan_episodes
+
+try:
+    import brotli
+except ImportError:  # optional dependency, gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Content-codings every cached feed is stored in, in server preference order
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+BROTLI_QUALITY = 9
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """Cheap, stat-only summary of everything a feed is rendered from."""
+
+    digest: str
+    last_modified: float
+    episodes: int = 0  # number of episode directories seen
+
+
+@dataclass
+class FeedEntry:
+    body: bytes
+    fingerprint: Fingerprint
+    etag: str  # unquoted entity tag, derived from the fingerprint only
+    checked_at: float
+    variants: Dict[str, bytes] = field(default_factory=dict)  # content-coding → body
+
+
+def variant_etag(etag: str, encoding: Optional[str]) -> str:
+    """Entity tag of the *encoding* variant; each coding needs its own strong tag."""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    """Return the pre-compressed variants of *body* for every entry in ENCODINGS."""
+    # mtime=0 keeps the gzip stream byte-identical for identical input
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return variants
+
+
+def _compressor(encoding: str):
+    """Return ``(compress, flush)`` callables for a streaming *encoding* compressor."""
+    if encoding == "br":
+        c = brotli.Compressor(quality=BROTLI_QUALITY)
+        return c.process, c.finish
+    # wbits=31 writes a gzip container; its header carries mtime=0, so the
+    # stream is deterministic just like gzip.compress(..., mtime=0)
+    c = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return c.compress, c.flush
+
+
+def _encode_all(chunks: Iterable[Union[str, bytes]]) -> Iterator[tuple]:
+    """Yield ``(raw, {coding: compressed})`` per chunk, compressing incrementally.
+
+    The last pair carries an empty *raw* chunk and the compressors' flush output.
+    """
+    compressors = {enc: _compressor(enc) for enc in ENCODINGS}
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        yield chunk, {enc: compress(chunk) for enc, (compress, _flush) in compressors.items()}
+    yield b"", {enc: flush() for enc, (_compress, flush) in compressors.items()}
+
+
+def encode_feed(chunks: Iterable[Union[str, bytes]]) -> tuple:
+    """Encode *chunks* to UTF-8 and compress them incrementally.
+
+    Returns ``(body, variants)`` like ``(body, compress_variants(body))`` but
+    without ever holding the unjoined chunks and the joined document at once.
+    """
+    body = bytearray()
+    parts = {enc: [] for enc in ENCODINGS}
+    for raw, pieces in _encode_all(chunks):
+        body += raw
+        for enc, piece in pieces.items():
+            parts[enc].append(piece)
+    return bytes(body), {enc: b"".join(p) for enc, p in parts.items()}
+
+
+def iter_encoded(chunks: Iterable[Union[str, bytes]], encoding: Optional[str] = None) -> Iterator[bytes]:
+    """Yield *chunks* as UTF-8 bytes, compressed on the fly when *encoding* is set."""
+    compress = flush = None
+    if encoding:
+        compress, flush = _compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if compress is not None:
+            chunk = compress(chunk)
+        if chunk:
+            yield chunk
+    if flush is not None:
+        yield flush()
+
+
+def file_fingerprint(path: Path) -> Fingerprint:
+    """Fingerprint a single pre-generated file such as the legacy feed.xml."""
+    st = path.stat()
+    return Fingerprint(f"{st.st_mtime_ns}-{st.st_size}", st.st_mtime)
+
+
+def show_fingerprint(show_dir: Path) -> Fingerprint:
+    """Fingerprint config.json, show covers and every episode file of a show.
+
+    Only directory listings and ``stat`` calls are used, no file is opened.
+    """
+    h = hashlib.sha1()
+    newest = 0
+
+    def _add(files, prefix: str) -> None:
+        nonlocal newest
+        for f in files.values():
+            h.update(f"{prefix}{f.name}\0{f.mtime_ns}\0{f.size}\n".encode("utf-8", "surrogateescape"))
+            newest = max(newest, f.mtime_ns)
+
+    top = scan_dir(show_dir)
+    _add(top.files, "")
+    episodes = 0
+    for ep in scan_episodes(show_dir, top):
+        episodes += 1
+        h.update(f"ep\0{ep.name}\n".encode("utf-8", "surrogateescape"))
+        _add(ep.files, f"{ep.name}/")
+
+    return Fingerprint(h.hexdigest(), newest / 1e9, episodes)
+
+
+def summaries_fingerprint(summaries: Iterable[dict]) -> Fingerprint:
+    """Fingerprint built from catalog show summaries (see ``Catalog.list_show_summaries``).
+
+    Used for documents spanning all shows, where stat-ing every file would
+    cost as much as rebuilding them.
+    """
+    h = hashlib.sha1()
+    newest = 0
+    episodes = 0
+    for s in summaries:
+        h.update(f"{s['id']}\0{s['updated_ns']}\0{s['episode_count']}\n".encode("utf-8", "surrogateescape"))
+        newest = max(newest, s["updated_ns"])
+        episodes += s["episode_count"]
+    return Fingerprint(h.hexdigest(), newest / 1e9, episodes)
+
+
+# First key element of cached documents built from every show (network feed);
+# invalidating or discarding any show marks them stale as well
+ALL_SHOWS = "*"
+
+
+class FeedCache:
+    """Thread-safe stale-while-revalidate cache of rendered feeds.
+
+    Keys are tuples whose first element is the show id (or ALL_SHOWS), so that
+    :meth:`invalidate` can drop every variant (e.g. per host) of one show.
+    """
+
+    def __init__(self, ttl: float = 30.0, version: str = ""):
+        self.ttl = ttl
+        # Mixed into every ETag so a new renderer invalidates client caches
+        self.version = version
+        self._entries: Dict[Hashable, FeedEntry] = {}
+        self._inflight: Dict[Hashable, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        key: tuple,
+        fingerprint: Callable[[], Fingerprint],
+        build: Callable[[Fingerprint], Union[bytes, Iterable[str]]],
+    ) -> FeedEntry:
+        """Return the entry for *key*, building or revalidating it as needed.
+
+        *build* returns the document either as bytes or as an iterable of
+        chunks (see :func:`feed_render.iter_show_feed`).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return self._build_single_flight(key, fingerprint, build)
+        if time.monotonic() - entry.checked_at > self.ttl:
+            self._revalidate_async(key, entry, fingerprint, build)
+        return entry
+
+    def stream(
+        self,
+        key: tuple,
+        fp: Fingerprint,
+        chunks: Iterable[Union[str, bytes]],
+        encoding: Optional[str] = None,
+    ) -> Iterator[bytes]:
+        """Yield the *encoding* variant of *chunks* while caching all variants.
+
+        Used for the cold build of very large feeds: the response starts with
+        the first chunk, and once the document is complete it is stored under
+        *key* exactly as :meth:`get` would have stored it.  Only one stream per
+        key fills the cache; concurrent ones just encode for their client.
+        """
+        with self._lock:
+            leader = key not in self._inflight and key not in self._entries
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            yield from iter_encoded(chunks, encoding)
+            return
+        try:
+            body = bytearray()
+            parts = {enc: [] for enc in ENCODINGS}
+            for raw, pieces in _encode_all(chunks):
+                body += raw
+                for enc, piece in pieces.items():
+                    parts[enc].append(piece)
+                out = pieces[encoding] if encoding else raw
+                if out:
+                    yield out
+            # Reached only when the whole document was rendered and sent
+            self._put(key, fp, bytes(body), {enc: b"".join(p) for enc, p in parts.items()})
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def etag_for(self, key: tuple, fp: Fingerprint) -> str:
+        """Return the entity tag of the feed *key* rendered from inputs *fp*.
+
+        Rendering is deterministic, so the tag can be computed from the
+        fingerprint alone, before (or instead of) rendering the document.
+        """
+        raw = f"{self.version}\0{key!r}\0{fp.digest}".encode("utf-8", "surrogateescape")
+        return hashlib.sha1(raw).hexdigest()[:20]
+
+    def peek(self, key: tuple) -> Optional[FeedEntry]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def invalidate(self, show_id: str) -> None:
+        """Mark every cached feed of *show_id* stale.
+
+        Stale entries keep being served until the background rebuild finishes.
+        """
+        with self._lock:
+            for key, entry in self._entries.items():
+                if key[0] in (show_id, ALL_SHOWS):
+                    entry.checked_at = float("-inf")
+
+    def discard(self, show_id: str) -> None:
+        """Drop every cached feed of *show_id* (used when the show is deleted)."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key[0] == show_id:
+                    del self._entries[key]
+                elif key[0] == ALL_SHOWS:
+                    entry.checked_at = float("-inf")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # ------------------------------------------------------------------
+    def _store(self, key, fp: Fingerprint, body) -> FeedEntry:
+        if isinstance(body, bytes):
+            variants = compress_variants(body)
+        else:
+            body, variants = encode_feed(body)
+        return self._put(key, fp, body, variants)
+
+    def _put(self, key, fp: Fingerprint, body: bytes, variants: Dict[str, bytes]) -> FeedEntry:
+        entry = FeedEntry(
+            body=body,
+            fingerprint=fp,
+            etag=self.etag_for(key, fp),
+            checked_at=time.monotonic(),
+            variants=variants,
+        )
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def _build_single_flight(self, key, fingerprint, build) -> FeedEntry:
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            event.wait()
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+            # The leader failed; fall through and try ourselves
+            return self._build_single_flight(key, fingerprint, build)
+        try:
+            fp = fingerprint()
+            return self._store(key, fp, build(fp))
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _revalidate_async(self, key, entry: FeedEntry, fingerprint, build) -> None:
+        with self._lock:
+            if key in self._inflight:
+                return
+            event = self._inflight[key] = threading.Event()
+
+        def _run():
+            try:
+                fp = fingerprint()
+                if fp == entry.fingerprint:
+                    entry.checked_at = time.monotonic()
+                else:
+                    self._store(key, fp, build(fp))
+                    logger.info("Rebuilt feed cache entry %s", key)
+            except LookupError:
+                # The document no longer exists (e.g. an archive page past the end)
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+            except Exception as exc:
+                # Keep serving the old copy and retry after the next ttl window
+                entry.checked_at = time.monotonic()
+                logger.error("Background feed rebuild failed for %s: %s", key, exc, exc_info=True)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+        threading.Thread(target=_run, name=f"feed-rebuild-{key[0]}", daemon=True).start()
+
+
+class FragmentCache:
+    """Bounded LRU of rendered per-episode ``<item>`` fragments.
+
+    Every fragment is stored with the signature (file stats) it was rendered
+    from; a lookup with a different signature is a miss, so changed episodes
+    are re-rendered while unchanged ones are reused as-is.
+    """
+
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, signature: Hashable):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or hit[0] != signature:
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key: tuple, signature: Hashable, fragment) -> None:
+        with self._lock:
+            self._data[key] = (signature, fragment)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, show_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k[0] == show_id]:
+                del self._data[key]
+
+
+class ArchivePageIndex:
+    """Fingerprints of the archive pages of paged show feeds, per show and host.
+
+    Which episodes fall on which page is worked out once per version of the
+    show's files (:func:`show_fingerprint`) for all pages together, not once
+    per page: a lookup is a dict hit while the show is unchanged, and the
+    show is re-stat'ed at most once per *ttl* or after :meth:`invalidate`.
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        # key → (show fingerprint, checked_at, {page: Fingerprint})
+        self._tables: Dict[Hashable, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        key: tuple,
+        page: int,
+        fingerprint: Callable[[], Fingerprint],
+        build: Callable[[], Dict[int, Fingerprint]],
+    ) -> Optional[Fingerprint]:
+        """Fingerprint of archive *page* of the feed *key*, ``None`` if there is no such page.
+
+        *fingerprint* returns the show's fingerprint; *build* returns the
+        fingerprints of all archive pages and runs only when it changed.
+        """
+        with self._lock:
+            table = self._tables.get(key)
+        now = time.monotonic()
+        if table is None or now - table[1] > self.ttl:
+            fp = fingerprint()
+            pages = table[2] if table is not None and table[0] == fp else build()
+            table = (fp, now, pages)
+            with self._lock:
+                self._tables[key] = table
+        return table[2].get(page)
+
+    def invalidate(self, show_id: str) -> None:
+        """Re-check the show's files on the next lookup."""
+        with self._lock:
+            for key, table in self._tables.items():
+                if key[0] == show_id:
+                    self._tables[key] = (table[0], float("-inf"), table[2])
+
+    def discard(self, show_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._tables if k[0] == show_id]:
+                del self._tables[key]
@@ -0,0 +1,602 @@
+"""RSS renderer for shows stored under ``shows/<show_id>/``.
+
+The renderer does not depend on a Flask request context so it can be called
+from request handlers, background rebuild threads and CLI tools alike.  URLs
+are built the same way ``url_for`` builds them for the corresponding routes in
+``app.py``.
+"""
+from __future__ import annotations
+
+import datetime
+import hashlib
+import heapq
+import html
+import itertools
+import json
+import mimetypes
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
+from urllib.parse import quote
+
+from fingerprint import media_fingerprint
+from json_cache import load_json
+from metadata_store import episode_meta_mtime, episode_signature, read_episode_meta, update_json
+from scanner import DirScan, FileEntry, scan_dir, scan_episodes
+from utils import feed_html, sanitize_html_for_rss_cached
+
+if TYPE_CHECKING:
+    from feed_cache import FragmentCache
+
+
+# Bump whenever the XML layout changes so cached validators (ETags) change too
+FEED_FORMAT_VERSION = "4"
+
+# Paged feeds (opt-in per show via config.json "paged_feed": true)
+DEFAULT_FEED_PAGE_SIZE = 100
+FH_NAMESPACE = "http://purl.org/syndication/history/1.0"  # RFC 5005
+
+
+def _quote(value: str) -> str:
+    # Same safe set as werkzeug's URL converters, so URLs match url_for output
+    return quote(str(value), safe="!$&'()*+,/:;=@")
+
+
+def show_file_url(show_id: str, filename: str) -> str:
+    """Path of the ``show_file`` route for *filename* inside the show directory."""
+    return f"/shows/{_quote(show_id)}/{_quote(filename)}"
+
+
+def media_file_url(show_id: str, filename: str, fingerprint: str) -> str:
+    """Path of the ``media_file`` route: *filename* inside the show directory
+    under its content fingerprint, so the URL can be cached as immutable."""
+    return f"/media/{_quote(fingerprint)}/{_quote(show_id)}/{_quote(filename)}"
+
+
+def _media_url(show_id: str, filename: str, entry: FileEntry) -> str:
+    try:
+        return media_file_url(show_id, filename, media_fingerprint(entry.path, entry.size, entry.mtime_ns))
+    except OSError:
+        # Vanished since the directory scan; the plain URL answers 404 as well
+        return show_file_url(show_id, filename)
+
+
+def show_page_url(show_id: str) -> str:
+    return f"/shows/{_quote(show_id)}/"
+
+
+def show_feed_url(show_id: str) -> str:
+    return f"/shows/{_quote(show_id)}/feed.xml"
+
+
+def edit_episode_url(show_id: str, ep_id: str) -> str:
+    return f"/shows/{_quote(show_id)}/episodes/{_quote(ep_id)}/edit"
+
+
+def show_feed_page_url(show_id: str, page: int) -> str:
+    return f"/shows/{_quote(show_id)}/feed/page/{int(page)}.xml"
+
+
+# Route of the merged feed of all shows (see iter_network_feed)
+NETWORK_FEED_PATH = "/network/feed.xml"
+
+
+class FeedPageNotFound(LookupError):
+    """Requested archive page does not exist (feed not paged or out of range)."""
+
+
+def paged_feed_enabled(cfg: dict) -> bool:
+    """Whether *cfg* opts into paged feeds (``"yes"``, ``true``, ``1``, ``"on"``)."""
+    return str(cfg.get("paged_feed", "")).strip().lower() in ("1", "true", "yes", "on")
+
+
+def feed_page_size(cfg: dict) -> int | None:
+    """Return the page size if *cfg* enables paged feeds, else ``None``."""
+    if not paged_feed_enabled(cfg):
+        return None
+    try:
+        return max(1, int(cfg.get("feed_page_size") or DEFAULT_FEED_PAGE_SIZE))
+    except (ValueError, TypeError):
+        return DEFAULT_FEED_PAGE_SIZE
+
+
+def archive_page_count(total: int, page_size: int) -> int:
+    """Number of archive pages for *total* items.
+
+    Pages are numbered from the oldest episode and hold exactly *page_size*
+    items each, so a page never changes once written; the newest items that do
+    not fill a whole page are only carried by the head feed.
+    """
+    return max(0, (total - 1) // page_size)
+
+
+def _archive_items(items: list, page_size: int, page: int) -> list:
+    """Items of archive *page* (1 = oldest) out of *items* sorted newest first."""
+    chronological = items[::-1]
+    return chronological[(page - 1) * page_size:page * page_size][::-1]
+
+
+def normalize_explicit(val) -> str:
+    """Return iTunes-valid explicit flag.
+    Apple accepts: "explicit", "clean" or legacy "yes"/"no".
+    PSP-1 prefers "explicit" / "clean". We map truthy values → "explicit", else → "clean".
+    """
+    v = str(val).strip().lower()
+    if v in ("yes", "true", "explicit", "да", "y", "1"):
+        return "true"
+    return "false"
+
+
+def cdata_or_escape(text) -> str:
+    if not text:
+        return ''
+    if any(x in text for x in ['&', '<', '>']):
+        return f'<![CDATA[{text}]]>'
+    return html.escape(text)
+
+
+def format_rfc822(ts: float) -> str:
+    """Format a POSIX timestamp as an RFC 822 date in GMT."""
+    return datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+
+def render_item(show_id: str, ep_dir: Path, cfg: dict, base_url: str, show_cover_url: str | None, scan: DirScan | None = None) -> tuple[str, float] | None:
+    """Render one episode as ``(<item> fragment, pubDate timestamp)``.
+
+    *scan* is the episode directory's :func:`scanner.scan_dir` result if the
+    caller already has it.  Returns ``None`` if the episode has no metadata or
+    audio file.
+    """
+    scan = scan or scan_dir(ep_dir)
+    meta_mtime = episode_meta_mtime(ep_dir, scan)
+    if meta_mtime is None:
+        return None
+
+    meta = read_episode_meta(ep_dir)
+    if meta is None:
+        return None
+
+    # Use audio file from metadata if available
+    audio_filename = meta.get("filename")
+    if not audio_filename:
+        return None # Skip if no audio file is listed in metadata
+
+    audio_entry = scan.get(audio_filename)
+    if audio_entry is None:
+        return None # Skip if audio file from metadata doesn't exist
+    audio_file = audio_entry.path
+
+    # Prepare item fields, prioritizing metadata
+    title = meta.get("title", ep_dir.name)
+    # Sanitized when the metadata was written (see utils.add_feed_html)
+    description, ep_summary = feed_html(meta, cfg.get('description', ''))
+    pubdate_str = meta.get("pubdate")
+    try:
+        dt_obj = datetime.datetime.fromisoformat(pubdate_str)
+        pubdate = dt_obj.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        # pubDate is emitted as GMT, so naive values are UTC for sorting as well
+        pub_ts = (dt_obj if dt_obj.tzinfo else dt_obj.replace(tzinfo=datetime.timezone.utc)).timestamp()
+    except (ValueError, TypeError, AttributeError):
+        pub_ts = scan.mtime
+        pubdate = datetime.datetime.fromtimestamp(pub_ts).strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+    duration_str = meta.get('duration', '')
+    enclosure_length = meta.get('size_bytes', 0)
+    # Fingerprinted URL: changes exactly when the audio bytes change
+    audio_url = f"{base_url}{_media_url(show_id, f'episodes/{ep_dir.name}/{audio_file.name}', audio_entry)}"
+    episode_link = f"{base_url}{edit_episode_url(show_id, ep_dir.name)}"
+
+    ep_image_url = None
+    if meta.get("episode_image"):
+        img_name = Path(meta["episode_image"]).name
+        if scan.has(img_name):
+            ep_image_url = f"{base_url}{_media_url(show_id, f'episodes/{ep_dir.name}/{img_name}', scan.get(img_name))}"
+    # If metadata stale or missing, auto-discover any image file in episode dir
+    if not ep_image_url:
+        f = scan.first_image()
+        if f is not None:
+            ep_image_url = f"{base_url}{_media_url(show_id, f'episodes/{ep_dir.name}/{f.name}', f)}"
+    # Fallback to show-level cover if episode image still not found
+    if not ep_image_url:
+        ep_image_url = show_cover_url
+
+    # Transcript URL (recommended PSP-1 element)
+    transcript_url = meta.get("transcript")
+    if not transcript_url:
+        # Fallback to the public episode page if no dedicated transcript is available
+        transcript_url = episode_link
+    transcript_type = "text/html"
+    mime, _ = mimetypes.guess_type(str(audio_file))
+    guid_val = f"{show_id}_{ep_dir.name}"
+
+    # Item XML
+    return f'''
+        <item>
+            <title>{cdata_or_escape(title)}</title>
+            <link>{episode_link}</link>
+            <description>{cdata_or_escape(description)}</description>
+            <enclosure url=\"{audio_url}\" type=\"{mime or 'audio/mpeg'}\" length=\"{enclosure_length or 0}\"/>
+            <guid isPermaLink=\"false\">{guid_val}</guid>
+            <pubDate>{pubdate}</pubDate>
+            {f'<itunes:image href="{ep_image_url}" />' if ep_image_url else ''}
+            {f'<itunes:summary>{cdata_or_escape(ep_summary)}</itunes:summary>' if ep_summary else ''}
+            {f'<podcast:transcript url="{html.escape(transcript_url)}" type="{transcript_type}" />' if transcript_url else ''}
+            {f'<itunes:duration>{duration_str}</itunes:duration>' if duration_str else ''}
+            <itunes:explicit>{normalize_explicit(meta.get("explicit"))}</itunes:explicit>
+        </item>''', pub_ts
+
+
+def render_show_feed(
+    show_id: str,
+    show_dir: Path,
+    base_url: str,
+    last_modified: float | None = None,
+    fragments: FragmentCache | None = None,
+    page: int | None = None,
+) -> str:
+    """Render the complete RSS document as one string (see :func:`iter_show_feed`)."""
+    return ''.join(iter_show_feed(show_id, show_dir, base_url, last_modified, fragments, page))
+
+
+def iter_show_feed(
+    show_id: str,
+    show_dir: Path,
+    base_url: str,
+    last_modified: float | None = None,
+    fragments: FragmentCache | None = None,
+    page: int | None = None,
+) -> Iterator[str]:
+    """Render the RSS document for the show in *show_dir* as a stream of chunks.
+
+    The channel header, every ``<item>`` and the footer are yielded one by one,
+    so the whole document never has to exist as a single string; items are the
+    (cached) fragment strings themselves, not copies.  Everything that can fail
+    (reading config.json, :class:`FeedPageNotFound`) happens when this function
+    is called, before the first chunk is produced.
+
+    *base_url* is the scheme + host prefix for every absolute URL in the feed,
+    e.g. ``https://podcast.example.com``.  *last_modified* is the timestamp of
+    the newest input file and becomes ``<lastBuildDate>``; the output therefore
+    only depends on the show's files, never on the time of rendering.
+
+    When a :class:`~feed_cache.FragmentCache` is given, only episodes whose
+    files changed since the previous render are re-read and re-sanitized.
+
+    Items are ordered by pubDate, newest first.  If the show enables paged
+    feeds, the head document (``page=None``) carries only the newest
+    ``feed_page_size`` items plus RFC 5005 ``first``/``next``/``last`` links,
+    and ``page=N`` renders archive page N (1 = oldest).  Raises
+    :class:`FeedPageNotFound` for a page that does not exist.
+    """
+    if last_modified is None:
+        from feed_cache import show_fingerprint
+        last_modified = show_fingerprint(show_dir).last_modified
+
+    cfg = load_json(show_dir / "config.json")
+
+    show_scan = scan_dir(show_dir)
+    items = _collect_items(show_id, show_scan, base_url, cfg, fragments)
+    return _render_document(show_id, show_scan, base_url, cfg, items, last_modified, page)
+
+
+def iter_feed_documents(
+    show_id: str,
+    show_dir: Path,
+    base_url: str,
+    last_modified: float | None = None,
+    fragments: FragmentCache | None = None,
+) -> Iterator[tuple[int | None, float, Iterator[str]]]:
+    """Yield ``(page, last_modified, chunks)`` for the head feed and every archive page.
+
+    ``page`` is ``None`` for the subscription feed.  An archive page's
+    *last_modified* is that of its own episodes (its ``<lastBuildDate>``), not
+    of the whole show.  Episodes are scanned once for all documents, which is
+    what static export of paged feeds needs.
+    """
+    if last_modified is None:
+        from feed_cache import show_fingerprint
+        last_modified = show_fingerprint(show_dir).last_modified
+
+    cfg = load_json(show_dir / "config.json")
+
+    show_scan = scan_dir(show_dir)
+    items = _collect_items(show_id, show_scan, base_url, cfg, fragments)
+    page_size = feed_page_size(cfg)
+    pages = archive_page_count(len(items), page_size) if page_size else 0
+    for page in (None, *range(1, pages + 1)):
+        page_modified = last_modified if page is None else max(item[3] for item in _archive_items(items, page_size, page))
+        yield page, page_modified, _render_document(show_id, show_scan, base_url, cfg, items, last_modified, page)
+
+
+def archive_page_fingerprints(
+    show_id: str,
+    show_dir: Path,
+    base_url: str,
+    fragments: FragmentCache | None = None,
+) -> dict:
+    """``{page: feed_cache.Fingerprint}`` of every archive page, from one scan of the show.
+
+    A page's fingerprint covers the channel settings, the page's own items
+    and whether a newer archive page links from it, but not the show's other
+    episodes: publishing a new episode leaves the validators of existing
+    archive pages unchanged.  ``last_modified`` is the newest file of the
+    page's episodes, which is also the page's ``<lastBuildDate>``.  Empty if
+    the show does not use paged feeds.
+    """
+    from feed_cache import Fingerprint
+
+    cfg = load_json(show_dir / "config.json")
+    page_size = feed_page_size(cfg)
+    if not page_size:
+        return {}
+    show_scan = scan_dir(show_dir)
+    items = _collect_items(show_id, show_scan, base_url, cfg, fragments)
+    pages = archive_page_count(len(items), page_size)
+    show_cover_url = _item_context(show_id, show_scan, base_url, cfg)[0]
+    channel = f"{json.dumps(cfg, sort_keys=True, default=str)}\0{show_cover_url}\0".encode("utf-8", "surrogateescape")
+
+    result = {}
+    for page in range(1, pages + 1):
+        page_items = _archive_items(items, page_size, page)
+        h = hashlib.sha1(channel)
+        h.update(f"{page < pages}\n".encode())
+        for _, ep_name, xml, _ in page_items:
+            h.update(f"{ep_name}\0{xml}\n".encode("utf-8", "surrogateescape"))
+        result[page] = Fingerprint(h.hexdigest(), max(item[3] for item in page_items), len(page_items))
+    return result
+
+
+def _item_context(show_id: str, show_scan: DirScan, base_url: str, cfg: dict) -> tuple:
+    """Return ``(show_cover_url, context)`` for rendering the items of a show.
+
+    *context* captures the show-level values an item falls back to and is part
+    of every fragment signature.
+    """
+    # Determine show-level cover image URL (used as fallback for episode images)
+    show_cover_url = None
+    img_candidate = cfg.get('image')
+    if img_candidate and show_scan.has(img_candidate):
+        show_cover_url = f"{base_url}{_media_url(show_id, img_candidate, show_scan.get(img_candidate))}"
+    if not show_cover_url:
+        f = show_scan.first_image()
+        if f is not None:
+            show_cover_url = f"{base_url}{_media_url(show_id, f.name, f)}"
+
+    return show_cover_url, (show_cover_url, hashlib.sha1(str(cfg.get('description', '')).encode('utf-8')).hexdigest())
+
+
+def _cached_item(
+    show_id: str,
+    ep_scan: DirScan,
+    cfg: dict,
+    base_url: str,
+    context: tuple,
+    fragments: FragmentCache | None,
+) -> tuple | None:
+    """:func:`render_item` through the fragment cache; falsy if the episode has no item."""
+    show_cover_url, item_context = context
+    if fragments is None:
+        return render_item(show_id, ep_scan.path, cfg, base_url, show_cover_url, ep_scan)
+    # Reuse the fragment rendered last time unless one of the episode's
+    # files (metadata, audio, covers) or the show-level fallbacks changed
+    key = (show_id, base_url, ep_scan.name)
+    signature = (item_context, episode_signature(ep_scan))
+    rendered = fragments.get(key, signature)
+    if rendered is None:
+        # () marks "no item" so skipped episodes are cached too
+        rendered = render_item(show_id, ep_scan.path, cfg, base_url, show_cover_url, ep_scan) or ()
+        fragments.put(key, signature, rendered)
+    return rendered
+
+
+def _collect_items(show_id: str, show_scan: DirScan, base_url: str, cfg: dict, fragments: FragmentCache | None) -> list:
+    """Render (or fetch cached) items of every episode, newest pubDate first."""
+    items = []  # (pub_ts, ep_id, xml, newest file mtime)
+    context = _item_context(show_id, show_scan, base_url, cfg)
+    for ep_scan in scan_episodes(show_scan.path, show_scan):
+        rendered = _cached_item(show_id, ep_scan, cfg, base_url, context, fragments)
+        if rendered:
+            items.append((rendered[1], ep_scan.name, rendered[0], ep_scan.newest_mtime()))
+
+    # Newest first; directory name breaks ties so the order is stable
+    items.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return items
+
+
+def _render_document(
+    show_id: str,
+    show_scan: DirScan,
+    base_url: str,
+    cfg: dict,
+    items: list,
+    last_modified: float,
+    page: int | None,
+) -> Iterator[str]:
+    """Assemble one feed document (head or archive *page*) from collected *items*."""
+    # Paging (RFC 5005): archive pages are numbered from the oldest episode
+    atom_url = f"{base_url}{show_feed_url(show_id)}"
+    self_url = atom_url
+    paging_links = ''
+    page_size = feed_page_size(cfg)
+    pages = archive_page_count(len(items), page_size) if page_size else 0
+    if page is not None and not 1 <= page <= pages:
+        raise FeedPageNotFound(f"{show_id}: no archive page {page}")
+    if pages:
+        def page_link(rel: str, n: int | None) -> str:
+            href = atom_url if n is None else f"{base_url}{show_feed_page_url(show_id, n)}"
+            return f'<atom:link href="{html.escape(href)}" rel="{rel}" type="application/rss+xml"/>'
+
+        links = [page_link("first", None), page_link("last", 1)]
+        if page is None:
+            # Head (subscription) document: newest items, next = newest archive page
+            items = items[:page_size]
+            links += [page_link("next", pages), page_link("prev-archive", pages)]
+        else:
+            items = _archive_items(items, page_size, page)
+            self_url = f"{base_url}{show_feed_page_url(show_id, page)}"
+            links += [page_link("current", None), page_link("previous", page + 1 if page < pages else None)]
+            if page < pages:
+                links.append(page_link("next-archive", page + 1))
+            if page > 1:
+                links += [page_link("next", page - 1), page_link("prev-archive", page - 1)]
+            links.append('<fh:archive/>')
+            # An archive page only changes when its own episodes change
+            last_modified = max(item[3] for item in items)
+        paging_links = ''.join(f'\n    {link}' for link in links)
+
+    # Find show cover – first look at explicit config, otherwise discover automatically
+    cover_url = None
+    img_name = cfg.get('image')
+
+    if img_name:
+        if not show_scan.has(img_name):
+            img_name = None  # fall back to auto-discovery
+
+    # Auto-discover any image file in the show directory if not defined
+    if not img_name:
+        f = show_scan.first_image()
+        img_name = f.name if f is not None else None
+        # Persist discovery so we do not have to search again next time
+        if img_name:
+            try:
+                with update_json(show_scan.path / 'config.json') as auto_cfg:
+                    auto_cfg['image'] = img_name
+            except Exception:
+                pass  # not critical
+
+    if img_name:
+        cover_url = f"{base_url}{_media_url(show_id, img_name, show_scan.get(img_name))}"
+
+    # Assemble channel-level info
+    channel_link = f"{base_url}{show_page_url(show_id)}"
+    # Sanitize show-level description separately
+    show_description = sanitize_html_for_rss_cached(cfg.get('description', ''))
+    itunes_author = cfg.get('author')
+    itunes_explicit = normalize_explicit(cfg.get('explicit'))
+    itunes_owner_name = cfg.get('owner_name')
+    itunes_owner_email = cfg.get('owner_email')
+    itunes_summary = sanitize_html_for_rss_cached(cfg.get('summary', cfg.get('description', '')))
+    itunes_owner = f'<itunes:owner><itunes:name>{cdata_or_escape(itunes_owner_name)}</itunes:name><itunes:email>{itunes_owner_email}</itunes:email></itunes:owner>' if itunes_owner_name and itunes_owner_email else ''
+    last_build_gmt = format_rfc822(last_modified)
+    copyright_val = cfg.get('copyright', f" 2025 {itunes_author or cfg.get('title')}")
+
+    # PSP-1 requires at least one element from the "podcast" namespace; we include <podcast:locked>
+    podcast_locked = ''
+    if itunes_owner_email:
+        podcast_locked = f'<podcast:locked owner="{html.escape(itunes_owner_email)}">no</podcast:locked>'
+
+    # Categories
+    cat_main = cfg.get('category_main', '')
+    cat_sub = cfg.get('category_sub', '')
+    itunes_cat = ''
+    if cat_main:
+        itunes_cat = f'<itunes:category text="{html.escape(cat_main)}">'
+        if cat_sub:
+            itunes_cat += f'<itunes:category text="{html.escape(cat_sub)}"/>'
+        itunes_cat += '</itunes:category>'
+
+    # Image block
+    image_block = ''
+    if cover_url:
+        image_block = f"<image>\n      <url>{html.escape(cover_url)}</url>\n      <title>{html.escape(cfg.get('title'))}</title>\n      <link>{html.escape(base_url + show_page_url(show_id))}</link>\n    </image>\n    <itunes:image href=\"{html.escape(cover_url)}\" />"
+
+    # Recommended PSP-1 channel-level GUID
+    podcast_guid_tag = f"<podcast:guid>{html.escape(cfg.get('guid', show_id))}</podcast:guid>"
+
+    # Final RSS assembly
+    header = f'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:podcast="https://podcastindex.org/namespace/1.0"{f' xmlns:fh="{FH_NAMESPACE}"' if pages else ''}>
+<channel>
+    <title>{cdata_or_escape(cfg.get('title', show_id))}</title>
+    <link>{channel_link}</link>
+    <atom:link href="{self_url}" rel="self" type="application/rss+xml"/>{paging_links}
+    <description>{cdata_or_escape(show_description)}</description>
+    <language>{cfg.get('language', 'en-US')}</language>
+    <copyright>{cdata_or_escape(copyright_val)}</copyright>
+    <lastBuildDate>{last_build_gmt}</lastBuildDate>
+    <itunes:author>{cdata_or_escape(itunes_author)}</itunes:author>
+    <itunes:summary>{cdata_or_escape(itunes_summary)}</itunes:summary>
+    {itunes_owner}
+    <itunes:explicit>{itunes_explicit}</itunes:explicit>
+    {itunes_cat}
+    {image_block}
+    {podcast_guid_tag}
+    '''
+    footer = f'''
+    {podcast_locked}
+</channel>
+</rss>'''
+
+    def _chunks() -> Iterator[str]:
+        yield header
+        for item in items:
+            yield item[2]
+        yield footer
+
+    return _chunks()
+
+
+def iter_network_feed(
+    episode_index,
+    shows_dir: Path,
+    base_url: str,
+    last_modified: float,
+    limit: int,
+    title: str,
+    description: str = "",
+    fragments: FragmentCache | None = None,
+) -> Iterator[str]:
+    """Render one RSS feed with the newest *limit* episodes of all shows.
+
+    *episode_index* is the catalog (anything with ``list_show_summaries()``
+    and ``iter_episodes_by_pubdate(show_id)``): every show contributes its
+    episodes lazily in pubdate order and the streams are k-way merged with a
+    heap, so only about *limit* episodes are ever read and rendered, however
+    large the catalog is.  Items are the same fragments as in the per-show
+    feeds (shared through *fragments*).
+    """
+    def stream(show_id: str) -> Iterable[tuple]:
+        for pub_ts, ep_id in episode_index.iter_episodes_by_pubdate(show_id):
+            yield pub_ts, ep_id, show_id
+
+    shows = [s["id"] for s in episode_index.list_show_summaries()]
+    merged = heapq.merge(*(stream(show_id) for show_id in shows), reverse=True)
+
+    contexts: dict = {}  # show_id -> (cfg, item context), built on first use
+    items = []
+    for _pub_ts, ep_id, show_id in merged:
+        if show_id not in contexts:
+            show_dir = shows_dir / show_id
+            try:
+                cfg = load_json(show_dir / "config.json")
+                show_scan = scan_dir(show_dir)
+            except (OSError, ValueError):
+                contexts[show_id] = None
+            else:
+                contexts[show_id] = (cfg, _item_context(show_id, show_scan, base_url, cfg))
+        if contexts[show_id] is None:
+            continue
+        cfg, context = contexts[show_id]
+        try:
+            ep_scan = scan_dir(shows_dir / show_id / "episodes" / ep_id)
+        except (FileNotFoundError, NotADirectoryError):
+            continue  # deleted since the catalog was read
+        rendered = _cached_item(show_id, ep_scan, cfg, base_url, context, fragments)
+        if rendered:
+            items.append(rendered[0])
+            if len(items) >= limit:
+                break
+
+    self_url = f"{base_url}{NETWORK_FEED_PATH}"
+    header = f'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:podcast="https://podcastindex.org/namespace/1.0">
+<channel>
+    <title>{cdata_or_escape(title)}</title>
+    <link>{base_url}/</link>
+    <atom:link href="{self_url}" rel="self" type="application/rss+xml"/>
+    <description>{cdata_or_escape(description or title)}</description>
+    <lastBuildDate>{format_rfc822(last_modified)}</lastBuildDate>
+    '''
+    footer = '''
+</channel>
+</rss>'''
+    return itertools.chain((header,), items, (footer,))
@@ -0,0 +1,104 @@
+"""Content fingerprints for immutable media and cover URLs.
+
+Audio files and covers are linked as ``/media/<fingerprint>/<show_id>/<path>``
+(see ``feed_render.media_file_url``), where the fingerprint is a short hash of
+the file's bytes.  A URL therefore always names the same content and can be
+cached for a year with ``immutable``; replacing the file produces a new URL.
+
+Hashing a large episode takes a while, so a fingerprint is computed once per
+file version: it is remembered in-process and in the catalog database, both
+validated by ``(size, mtime_ns)`` like :mod:`json_cache` validates parsed
+JSON, and is only recomputed after the file changed.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+from catalog import get_catalog
+
+logger = logging.getLogger(__name__)
+
+# Hex digits of SHA-256 kept in URLs (48 bits)
+FINGERPRINT_LEN = 12
+FINGERPRINT_CACHE_SIZE = int(os.getenv("FINGERPRINT_CACHE_SIZE", "50000"))
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def content_digest(path: Union[str, Path]) -> str:
+    """Fingerprint of the bytes of *path* (first FINGERPRINT_LEN hex digits of SHA-256)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            h.update(block)
+    return h.hexdigest()[:FINGERPRINT_LEN]
+
+
+class FingerprintCache:
+    """Thread-safe LRU of content fingerprints, validated by size and mtime."""
+
+    def __init__(self, max_entries: int = FINGERPRINT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Union[str, Path], size: Optional[int] = None, mtime_ns: Optional[int] = None) -> str:
+        """Fingerprint of *path*; pass *size*/*mtime_ns* when the caller already
+        has them from a directory scan, otherwise the file is stat'ed.
+
+        Raises ``OSError`` if the file cannot be read.
+        """
+        key = os.fspath(path)
+        if size is None or mtime_ns is None:
+            st = os.stat(key)
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        version = (size, mtime_ns)
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None and hit[0] == version:
+                self._data.move_to_end(key)
+                return hit[1]
+
+        digest = _stored_digest(key, size, mtime_ns)
+        if digest is None:
+            digest = content_digest(key)
+            _store_digest(key, size, mtime_ns, digest)
+        with self._lock:
+            self._data[key] = (version, digest)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return digest
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def _stored_digest(path: str, size: int, mtime_ns: int) -> Optional[str]:
+    try:
+        return get_catalog().get_fingerprint(Path(path), size, mtime_ns)
+    except sqlite3.Error as exc:
+        logger.warning("Cannot read stored fingerprint of %s: %s", path, exc)
+        return None
+
+
+def _store_digest(path: str, size: int, mtime_ns: int, digest: str) -> None:
+    try:
+        get_catalog().put_fingerprint(Path(path), size, mtime_ns, digest)
+    except sqlite3.Error as exc:
+        logger.warning("Cannot store fingerprint of %s: %s", path, exc)
+
+
+_cache = FingerprintCache()
+
+
+def media_fingerprint(path: Union[str, Path], size: Optional[int] = None, mtime_ns: Optional[int] = None) -> str:
+    """Content fingerprint of *path* from the shared cache (see :class:`FingerprintCache`)."""
+    return _cache.get(path, size, mtime_ns)
@@ -0,0 +1,95 @@
+"""Shared in-process cache of parsed JSON files.
+
+config.json and metadata.json are read on almost every request (show page
+sidebar, episode pages, feeds, background jobs), but change rarely.  Every
+read goes through :func:`load_json`, which stats the file and returns the
+object parsed last time if ``(mtime_ns, size, inode)`` is unchanged, so
+repeated page loads cost one ``stat`` per file instead of an open + parse.
+
+Files replaced atomically (temp file + ``os.replace``) get a new inode, files
+rewritten in place get a new mtime, so edits made by other processes
+(publisher.py, a second worker, a text editor) are picked up on the next read
+without any explicit invalidation.
+
+Cached objects are shared between threads: callers that modify the result
+must ask for ``copy=True``.
+"""
+from __future__ import annotations
+
+import copy as _copy
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, Union
+
+JSON_CACHE_SIZE = int(os.getenv("JSON_CACHE_SIZE", "20000"))
+
+
+def _stat_key(st: os.stat_result) -> Hashable:
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class JSONCache:
+    """Thread-safe LRU of parsed JSON documents, validated by ``stat``."""
+
+    def __init__(self, max_entries: int = JSON_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path: Union[str, Path], copy: bool = False) -> Any:
+        """Return the parsed contents of *path*.
+
+        Raises ``OSError``/``ValueError`` exactly like ``json.load`` on an
+        opened file would; failed reads are never cached.
+        """
+        key = os.fspath(path)
+        st = os.stat(key)
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None and hit[0] == _stat_key(st):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return _copy.deepcopy(hit[1]) if copy else hit[1]
+            self.misses += 1
+
+        with open(key, "r", encoding="utf-8") as f:
+            # Validate against the stat of the file we actually read; if it is
+            # replaced while we parse, the next lookup just misses again
+            st = os.fstat(f.fileno())
+            data = json.load(f)
+        with self._lock:
+            self._data[key] = (_stat_key(st), data)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return _copy.deepcopy(data) if copy else data
+
+    def invalidate(self, path: Union[str, Path]) -> None:
+        with self._lock:
+            self._data.pop(os.fspath(path), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_cache = JSONCache()
+
+
+def load_json(path: Union[str, Path], copy: bool = False) -> Any:
+    """Parsed contents of *path* from the shared cache (``copy=True`` to modify it)."""
+    return _cache.load(path, copy=copy)
+
+
+def invalidate_json(path: Union[str, Path]) -> None:
+    """Forget the cached copy of *path* (after writing it with coarse-mtime filesystems)."""
+    _cache.invalidate(path)
+
+
+def get_json_cache() -> JSONCache:
+    return _cache
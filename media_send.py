@@ -0,0 +1,174 @@
+"""Full and byte-range file responses whose body is sent with ``os.sendfile``.
+
+Werkzeug's ``send_file(..., conditional=True)`` answers Range requests by
+reading the file in Python and writing every block through the WSGI server.
+:func:`file_response` computes the status and headers itself (200, 206,
+304 and 416 with ``Content-Range``/``Accept-Ranges``, ``If-Range``,
+``ETag``/``Last-Modified``) and returns a :class:`SendfileWrapper` body that
+hands the bytes to the kernel:
+
+* under Werkzeug's server (``python app.py``) the wrapper lets the server
+  flush the headers, then calls ``os.sendfile`` on the client socket
+  (``environ["werkzeug.socket"]``) for exactly the requested range;
+* under servers that provide ``wsgi.file_wrapper`` (gunicorn, waitress) the
+  file is positioned at the start of the range and passed to that wrapper,
+  which sends ``Content-Length`` bytes from there (gunicorn uses sendfile);
+* otherwise, or for TLS sockets, the range is read and yielded in blocks.
+
+Multi-range requests are answered with the whole file (200), which RFC 9110
+allows.  See ``bench_media.py`` for a comparison with ``send_file``.
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+import selectors
+import socket
+import ssl
+import unicodedata
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import quote
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date, is_resource_modified, parse_range_header, quote_etag
+from werkzeug.wrappers import Response
+
+BLOCK_SIZE = 256 * 1024
+# Upper bound of a single sendfile() call; large ranges are sent in a loop
+SENDFILE_CHUNK = 8 * 1024 * 1024
+
+
+class SendfileWrapper:
+    """WSGI body that sends *length* bytes of *file* starting at *offset*.
+
+    With a plain (non-TLS) *sock* the first item is ``b""`` so the server
+    writes the status line and headers; the range is then written straight
+    to the socket with ``os.sendfile`` and nothing else is yielded.
+    """
+
+    def __init__(self, file, offset: int, length: int, sock: Optional[socket.socket] = None,
+                 block_size: int = BLOCK_SIZE):
+        self.file = file
+        self.offset = offset
+        self.length = length
+        self.sock = sock
+        self.block_size = block_size
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.sock is not None and hasattr(os, "sendfile"):
+            yield b""  # headers go out before the first sendfile()
+            self._sendfile()
+            return
+        yield from self._read()
+
+    def _sendfile(self) -> None:
+        out, in_fd = self.sock.fileno(), self.file.fileno()
+        offset, remaining = self.offset, self.length
+        while remaining > 0:
+            try:
+                sent = os.sendfile(out, in_fd, offset, min(remaining, SENDFILE_CHUNK))
+            except BlockingIOError:
+                # Socket with a timeout (non-blocking underneath) and a slow
+                # client: sleep until it drains instead of spinning
+                self._wait_writable()
+                continue
+            if sent == 0:
+                break  # file truncated while sending; the client sees a short body
+            offset += sent
+            remaining -= sent
+
+    def _wait_writable(self) -> None:
+        """Block until the socket accepts more data, within the socket's timeout."""
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.sock, selectors.EVENT_WRITE)
+            if not selector.select(self.sock.gettimeout() or None):
+                raise TimeoutError("timed out sending the file to a client that stopped reading")
+
+    def _read(self) -> Iterator[bytes]:
+        self.file.seek(self.offset)
+        remaining = self.length
+        while remaining > 0:
+            block = self.file.read(min(self.block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _content_disposition(name: str) -> dict:
+    """Parameters of ``Content-Disposition: inline`` the way ``send_file`` builds them."""
+    try:
+        name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+        return {"filename": simple, "filename*": f"UTF-8''{quote(name, safe='!#$&+^`|~')}"}
+    return {"filename": name}
+
+
+def _body_for(environ: dict, file, offset: int, length: int):
+    sock = environ.get("werkzeug.socket")
+    if sock is not None and not isinstance(sock, ssl.SSLSocket):
+        return SendfileWrapper(file, offset, length, sock)
+    server_wrapper = environ.get("wsgi.file_wrapper")
+    if server_wrapper is not None:
+        # PEP 3333: the server sends from the current position, at most
+        # Content-Length bytes
+        file.seek(offset)
+        return server_wrapper(file, BLOCK_SIZE)
+    return SendfileWrapper(file, offset, length)
+
+
+def file_response(environ: dict, path: Path, mimetype: Optional[str] = None) -> Response:
+    """Conditional, range-aware response for the regular file *path*."""
+    file = open(path, "rb")
+    try:
+        st = os.fstat(file.fileno())
+        size = st.st_size
+        etag = file_etag(st)
+        last_modified = http_date(st.st_mtime)
+        headers = Headers()
+        headers["Accept-Ranges"] = "bytes"
+        headers["ETag"] = quote_etag(etag)
+        headers["Last-Modified"] = last_modified
+        headers["Cache-Control"] = "no-cache"
+        headers.set("Content-Disposition", "inline", **_content_disposition(path.name))
+
+        if not is_resource_modified(environ, etag, last_modified=last_modified):
+            file.close()
+            return Response(status=304, headers=headers)
+
+        start, length, status = 0, size, 200
+        rng = parse_range_header(environ.get("HTTP_RANGE"))
+        if rng is not None and rng.units == "bytes" and len(rng.ranges) == 1:
+            # If-Range with a stale validator means "send the whole new file"
+            if "HTTP_IF_RANGE" not in environ or not is_resource_modified(
+                environ, etag, last_modified=last_modified, ignore_if_range=False
+            ):
+                span = rng.range_for_length(size)
+                if span is None:
+                    file.close()
+                    headers["Content-Range"] = f"bytes */{size}"
+                    return Response(status=416, headers=headers)
+                start, stop = span
+                length, status = stop - start, 206
+                headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        headers["Content-Length"] = str(length)
+
+        body = () if environ.get("REQUEST_METHOD") == "HEAD" else _body_for(environ, file, start, length)
+        response = Response(body, status=status, headers=headers,
+                            mimetype=mimetype or mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+                            direct_passthrough=True)
+        if body == ():
+            file.close()
+        return response
+    except BaseException:
+        file.close()
+        raise
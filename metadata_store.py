@@ -0,0 +1,505 @@
+"""Locked, atomic reads and writes of config.json / metadata.json.
+
+Request handlers, background processing threads, batch uploads and
+publisher.py all update the same JSON files.  To keep those updates from
+overwriting each other, possibly across several gunicorn workers:
+
+* every write replaces the file atomically (temp file + ``os.replace`` via
+  :func:`utils.atomic_write_bytes`), so readers never see a half-written file;
+  the directory keeps its mtime, which for episodes is the fallback pubDate;
+* read-modify-write cycles hold an exclusive advisory lock (``flock``) on a
+  per-file lock file under ``METADATA_LOCK_DIR``, so concurrent updates are
+  serialised instead of lost.  Lock files are kept for the life of the file;
+  short-lived files (chunked uploads) drop theirs with :func:`remove_lock_file`.
+
+Lock files live outside ``shows/`` so they never appear in directory scans,
+feed fingerprints or the catalog.  Typical use::
+
+    with update_json(meta_path) as meta:
+        meta["title"] = title
+
+Reads that do not write back should keep using :func:`json_cache.load_json`.
+
+Episode metadata is accessed through :func:`read_episode_meta`,
+:func:`update_episode_meta` and friends, which also support shows migrated to
+the compact single-file layout (:class:`CompactMetadataStore`).
+"""
+from __future__ import annotations
+
+import copy as _copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+from json_cache import invalidate_json, load_json
+from utils import add_feed_html, atomic_write_bytes
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only protect threads of one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+LOCK_DIR = Path(os.getenv("METADATA_LOCK_DIR", BASE_DIR / "data" / "locks"))
+
+_thread_locks: dict = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _lock_path(path: Path) -> Path:
+    digest = hashlib.sha1(os.fsencode(os.path.abspath(path))).hexdigest()
+    return LOCK_DIR / f"{digest[:24]}.lock"
+
+
+@contextmanager
+def file_lock(path: Union[str, Path]) -> Iterator[None]:
+    """Hold the exclusive advisory lock of *path* (which need not exist yet)."""
+    path = Path(path)
+    if fcntl is None:
+        key = os.path.abspath(path)
+        with _thread_locks_guard:
+            lock = _thread_locks.setdefault(key, threading.Lock())
+        with lock:
+            yield
+        return
+    LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    # flock() locks belong to the open file description, so threads of one
+    # process exclude each other as well as other processes
+    fd = os.open(_lock_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # also releases the lock
+
+
+def remove_lock_file(path: Union[str, Path]) -> None:
+    """Delete the lock file of *path*, e.g. when a temporary upload is removed.
+
+    Only call this once nothing locks *path* anymore: a process already
+    waiting on the old lock file would no longer exclude one that creates a
+    new lock file.
+    """
+    if fcntl is None:
+        with _thread_locks_guard:
+            _thread_locks.pop(os.path.abspath(path), None)
+        return
+    try:
+        _lock_path(Path(path)).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def dump_json(data: Any) -> bytes:
+    """Serialise *data* the way every JSON file in shows/ is formatted."""
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def write_json(path: Union[str, Path], data: Any) -> None:
+    """Atomically replace *path* with *data*, under the file's lock."""
+    with file_lock(path):
+        _write_unlocked(Path(path), data)
+
+
+def _write_unlocked(path: Path, data: Any, create_dirs: bool = True) -> None:
+    # Rewriting metadata.json must not re-date its episode (see atomic_write_bytes)
+    atomic_write_bytes(path, dump_json(data), keep_dir_mtime=True, create_dirs=create_dirs)
+    invalidate_json(path)
+
+
+@contextmanager
+def update_json(path: Union[str, Path], default: Optional[Any] = None) -> Iterator[Any]:
+    """Read-modify-write *path* while holding its lock.
+
+    Yields the current contents (a private copy, re-read from disk under the
+    lock); the object is written back when the block exits normally and it
+    was actually changed.  A missing file starts from *default* if one is
+    given; otherwise, and for a file that cannot be parsed (which must not be
+    overwritten with just this update), the error propagates.
+
+    The parent directory is never created: if it disappeared (the show or
+    episode was deleted meanwhile) the write raises ``FileNotFoundError``.
+    """
+    path = Path(path)
+    with file_lock(path):
+        invalidate_json(path)  # always start from what is on disk now
+        try:
+            data = load_json(path, copy=True)
+        except FileNotFoundError:
+            if default is None:
+                raise
+            data = _copy.deepcopy(default)
+            original = None
+        else:
+            original = _copy.deepcopy(data)
+        yield data
+        if data != original:
+            _write_unlocked(path, data, create_dirs=False)
+
+
+# ----------------------------------------------------------------------
+# Episode metadata: per-episode metadata.json or one compact file per show
+# ----------------------------------------------------------------------
+# A show whose directory contains COMPACT_FILE keeps the metadata of all its
+# episodes there instead of in episodes/<id>/metadata.json (see
+# ``python publisher.py migrate-metadata``).  The episode directories still
+# hold the media files.  Code that reads or writes episode metadata uses the
+# *_episode_meta helpers below and does not care which layout a show uses.
+
+COMPACT_FILE = "episodes.jsonl"
+# Rewrite the file once it holds this many superseded records (and at least
+# as many as live ones)
+COMPACT_MIN_GARBAGE = int(os.getenv("COMPACT_MIN_GARBAGE", "256"))
+
+
+class CompactMetadataStore:
+    """Episode metadata of one show as an append-only JSON Lines file.
+
+    Every write appends one record, ``{"id": ..., "mtime": ..., "metadata":
+    {...}}`` or a ``{"id": ..., "deleted": true}`` tombstone; the last record
+    of an episode wins.  The parsed records are kept in memory and refreshed
+    from the file with a ``stat``: if the file only grew, just the appended
+    tail is read and parsed, so other processes' writes cost as much as they
+    wrote.  Superseded records are dropped by :meth:`compact`, which runs in
+    a background thread once enough of them accumulated.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._lock = threading.RLock()  # in-memory state; file_lock() guards the file
+        self._records: dict = {}  # episode id → (metadata, mtime, offset)
+        self._ino = None
+        self._offset = 0  # bytes of the file consumed so far
+        self._dead = 0  # superseded / deleted / unreadable records in the file
+        self._compacting = False
+
+    # -- reads --------------------------------------------------------
+    def get(self, ep_id: str, copy: bool = False) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            rec = self._records.get(ep_id)
+        if rec is None:
+            return None
+        return _copy.deepcopy(rec[0]) if copy else rec[0]
+
+    def mtime(self, ep_id: str) -> Optional[float]:
+        """Time the episode's metadata was last written (its metadata.json mtime)."""
+        with self._lock:
+            self._refresh()
+            rec = self._records.get(ep_id)
+        return rec[1] if rec is not None else None
+
+    def items(self) -> list:
+        """``[(episode id, metadata), ...]`` sorted by id; the dicts are shared."""
+        with self._lock:
+            self._refresh()
+            return sorted((ep_id, rec[0]) for ep_id, rec in self._records.items())
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._records)
+
+    def _refresh(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset(None)
+            return
+        if st.st_ino != self._ino or st.st_size < self._offset:
+            self._reset(st.st_ino)  # replaced (compacted) or truncated: reload
+        if st.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_ino != self._ino:
+                self._reset(os.fstat(f.fileno()).st_ino)
+            f.seek(self._offset)
+            data = f.read()
+        # A writer in another process may be in the middle of a line
+        data = data[: data.rfind(b"\n") + 1]
+        pos = self._offset
+        for line in data.splitlines(keepends=True):
+            self._apply(line, pos)
+            pos += len(line)
+        self._offset = pos
+
+    def _reset(self, ino) -> None:
+        self._records = {}
+        self._ino = ino
+        self._offset = 0
+        self._dead = 0
+
+    def _apply(self, line: bytes, offset: int) -> None:
+        try:
+            rec = json.loads(line)
+            ep_id = rec["id"]
+        except (ValueError, KeyError, TypeError):
+            if line.strip():
+                logger.warning("Skipping unreadable record at %s:%d", self.path, offset)
+                self._dead += 1
+            return
+        if ep_id in self._records:
+            self._dead += 1
+        if rec.get("deleted"):
+            self._records.pop(ep_id, None)
+            self._dead += 1
+        else:
+            self._records[ep_id] = (rec.get("metadata") or {}, rec.get("mtime", 0.0), offset)
+
+    # -- writes -------------------------------------------------------
+    def put(self, ep_id: str, metadata: dict) -> None:
+        with file_lock(self.path):
+            self._append({"id": ep_id, "mtime": time.time(), "metadata": metadata})
+
+    def delete(self, ep_id: str) -> None:
+        with file_lock(self.path):
+            with self._lock:
+                self._refresh()
+                if ep_id not in self._records:
+                    return
+            self._append({"id": ep_id, "deleted": True})
+
+    @contextmanager
+    def update(self, ep_id: str, default: Optional[Any] = None) -> Iterator[dict]:
+        """Read-modify-write one episode under the file lock (see :func:`update_json`)."""
+        with file_lock(self.path):
+            current = self.get(ep_id, copy=True)
+            if current is None:
+                if default is None:
+                    raise FileNotFoundError(f"{self.path}: no metadata for episode {ep_id!r}")
+                current = _copy.deepcopy(default)
+                original = None
+            else:
+                original = _copy.deepcopy(current)
+            yield current
+            if current != original:
+                self._append({"id": ep_id, "mtime": time.time(), "metadata": current})
+
+    def _append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with open(self.path, "ab") as f:
+            f.write(line.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self._refresh()
+            wants_compaction = self._dead >= max(COMPACT_MIN_GARBAGE, len(self._records))
+        if wants_compaction:
+            self._compact_async()
+
+    def compact(self) -> int:
+        """Rewrite the file with only the live records; returns how many were dropped."""
+        with file_lock(self.path):
+            with self._lock:
+                self._refresh()
+                dropped = self._dead
+                if not dropped:
+                    return 0
+                records = sorted(self._records.items(), key=lambda kv: kv[1][2])
+                body = "".join(
+                    json.dumps({"id": ep_id, "mtime": mtime, "metadata": meta}, ensure_ascii=False, separators=(",", ":")) + "\n"
+                    for ep_id, (meta, mtime, _offset) in records
+                )
+                atomic_write_bytes(self.path, body.encode("utf-8"))
+                self._refresh()
+        logger.info("Compacted %s: dropped %d stale records", self.path, dropped)
+        return dropped
+
+    def _compact_async(self) -> None:
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def _run():
+            try:
+                self.compact()
+            except Exception as exc:
+                logger.error("Background compaction of %s failed: %s", self.path, exc, exc_info=True)
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        threading.Thread(target=_run, name=f"compact-{self.path.parent.name}", daemon=True).start()
+
+
+_stores: dict = {}
+_stores_guard = threading.Lock()
+
+
+def compact_store(show_dir: Union[str, Path]) -> Optional[CompactMetadataStore]:
+    """The show's :class:`CompactMetadataStore`, or ``None`` for the per-episode layout."""
+    path = Path(show_dir) / COMPACT_FILE
+    if not path.exists():
+        return None
+    key = os.path.abspath(path)
+    with _stores_guard:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = CompactMetadataStore(path)
+    return store
+
+
+def _show_dir(ep_dir: Path) -> Path:
+    return Path(ep_dir).parent.parent  # shows/<show_id>/episodes/<ep_id>
+
+
+def read_episode_meta(ep_dir: Union[str, Path], copy: bool = False) -> Optional[dict]:
+    """Metadata of the episode in *ep_dir*, ``None`` if it has none."""
+    ep_dir = Path(ep_dir)
+    store = compact_store(_show_dir(ep_dir))
+    if store is not None:
+        return store.get(ep_dir.name, copy=copy)
+    try:
+        return load_json(ep_dir / "metadata.json", copy=copy)
+    except FileNotFoundError:
+        return None
+
+
+def list_episode_meta(show_dir: Union[str, Path]) -> list:
+    """``[(episode id, metadata), ...]`` of every episode of a show, sorted by id.
+
+    The returned dicts are shared cache objects and must not be modified.
+    """
+    show_dir = Path(show_dir)
+    store = compact_store(show_dir)
+    if store is not None:
+        return store.items()
+    try:
+        with os.scandir(show_dir / "episodes") as it:
+            ep_ids = sorted(e.name for e in it if e.is_dir())
+    except FileNotFoundError:
+        return []
+    result = []
+    for ep_id in ep_ids:
+        try:
+            result.append((ep_id, load_json(show_dir / "episodes" / ep_id / "metadata.json")))
+        except FileNotFoundError:
+            continue
+    return result
+
+
+def has_episode_meta(ep_dir: Union[str, Path]) -> bool:
+    ep_dir = Path(ep_dir)
+    store = compact_store(_show_dir(ep_dir))
+    if store is not None:
+        return store.get(ep_dir.name) is not None
+    return (ep_dir / "metadata.json").exists()
+
+
+def episode_meta_mtime(ep_dir: Union[str, Path], scan=None) -> Optional[float]:
+    """When the episode's metadata was last written; *scan* saves a ``stat``."""
+    ep_dir = Path(ep_dir)
+    store = compact_store(_show_dir(ep_dir))
+    if store is not None:
+        return store.mtime(ep_dir.name)
+    if scan is not None:
+        entry = scan.get("metadata.json")
+        return entry.mtime if entry is not None else None
+    try:
+        return os.stat(ep_dir / "metadata.json").st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def episode_signature(scan) -> tuple:
+    """``scan.signature()`` extended by the compact record, for fragment/manifest caches."""
+    store = compact_store(_show_dir(scan.path))
+    if store is None:
+        return scan.signature()
+    return scan.signature() + (store.mtime(scan.name),)
+
+
+def write_episode_meta(ep_dir: Union[str, Path], metadata: dict) -> None:
+    ep_dir = Path(ep_dir)
+    add_feed_html(metadata)
+    store = compact_store(_show_dir(ep_dir))
+    if store is not None:
+        store.put(ep_dir.name, metadata)
+    else:
+        write_json(ep_dir / "metadata.json", metadata)
+
+
+@contextmanager
+def update_episode_meta(ep_dir: Union[str, Path], default: Optional[Any] = None) -> Iterator[Any]:
+    """:func:`update_json` for episode metadata, in whichever layout the show uses."""
+    ep_dir = Path(ep_dir)
+    store = compact_store(_show_dir(ep_dir))
+    if store is not None:
+        cm = store.update(ep_dir.name, default=default)
+    else:
+        cm = update_json(ep_dir / "metadata.json", default=default)
+    with cm as meta:
+        yield meta
+        if isinstance(meta, dict):
+            add_feed_html(meta)
+
+
+def delete_episode_meta(ep_dir: Union[str, Path]) -> None:
+    """Forget the metadata of a deleted episode (the directory itself is removed by the caller)."""
+    ep_dir = Path(ep_dir)
+    store = compact_store(_show_dir(ep_dir))
+    if store is not None:
+        store.delete(ep_dir.name)
+
+
+# -- migration between the two layouts ----------------------------------
+def migrate_to_compact(show_dir: Union[str, Path]) -> int:
+    """Move every episodes/<id>/metadata.json of a show into COMPACT_FILE.
+
+    Returns the number of migrated episodes.  Run it while the app is stopped
+    (or the show is not being edited): writes to metadata.json files that
+    happen during the migration are not picked up.
+    """
+    from scanner import scan_episodes
+
+    show_dir = Path(show_dir)
+    path = show_dir / COMPACT_FILE
+    if path.exists():
+        raise FileExistsError(f"{path} already exists")
+    lines, migrated = [], []
+    for ep_scan in scan_episodes(show_dir):
+        entry = ep_scan.get("metadata.json")
+        if entry is None:
+            continue
+        meta = load_json(entry.path)
+        record = {"id": ep_scan.name, "mtime": entry.mtime, "metadata": meta}
+        lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        migrated.append(entry.path)
+    with file_lock(path):
+        atomic_write_bytes(path, "".join(lines).encode("utf-8"))
+    for meta_path in migrated:
+        meta_path.unlink()
+        invalidate_json(meta_path)
+    return len(migrated)
+
+
+def migrate_to_dirs(show_dir: Union[str, Path]) -> int:
+    """Write COMPACT_FILE back out as per-episode metadata.json files and remove it."""
+    show_dir = Path(show_dir)
+    path = show_dir / COMPACT_FILE
+    store = CompactMetadataStore(path)
+    with file_lock(path):
+        items = store.items()
+        written = 0
+        for ep_id, meta in items:
+            ep_dir = show_dir / "episodes" / ep_id
+            if not ep_dir.is_dir():
+                continue  # episode directory removed by hand
+            mtime = store.mtime(ep_id)
+            write_json(ep_dir / "metadata.json", meta)
+            if mtime:
+                os.utime(ep_dir / "metadata.json", (mtime, mtime))
+            written += 1
+        path.unlink()
+    with _stores_guard:
+        _stores.pop(os.path.abspath(path), None)
+    return written
@@ -5,28 +5,51 @@ Usage examples:
     python publisher.py --log-level INFO           # обычная генерация RSS
     python publisher.py --dry-run                  # вывести RSS в stdout
     python publisher.py --force                    # принудительное транскодирование WAV → MP3
+    python publisher.py --force --jobs 16          # то же, 16 транскодирований параллельно
+    python publisher.py --no-cache                 # перечитать все эпизоды, игнорируя манифест сборки
     python publisher.py --check-domain             # убедиться, что feed_url доступен (200 OK)
+    python publisher.py export --base-url https://podcast.example.com --jobs 4
+                                                   # статический экспорт RSS-лент всех шоу (для nginx)
+    python publisher.py rebuild-catalog            # пересобрать SQLite-каталог шоу/эпизодов с диска
+    python publisher.py migrate-metadata --to compact alpha
+                                                   # метаданные эпизодов шоу alpha → один файл episodes.jsonl
 
 """
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import logging
 import os
 import sys
-from datetime import datetime
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 import requests
 from feedgen.feed import FeedGenerator
 
-from utils import load_env, generate_guid, transcode_wav_to_mp3, send_email
+from feed_cache import ENCODINGS as FEED_ENCODINGS, encode_feed, show_fingerprint
+from feed_render import FEED_FORMAT_VERSION, iter_feed_documents
+from json_cache import load_json
+from metadata_store import episode_signature, read_episode_meta
+from scanner import scan_dir, scan_subdirs
+from utils import load_env, generate_guid, transcode_audio_to_mp3, send_email, atomic_write_bytes
 
 BASE_DIR = Path(__file__).resolve().parent
 EPISODES_DIR = BASE_DIR / "episodes"
 CONFIG_FILE = BASE_DIR / "feedgen_config.json"
+FEED_FILE = BASE_DIR / "feed.xml"
+# Input stats, parsed episodes and assigned GUIDs of the previous run
+MANIFEST_FILE = BASE_DIR / ".publisher-manifest.json"
+MANIFEST_FORMAT = 1
+SHOWS_DIR = BASE_DIR / "shows"
+DEFAULT_EXPORT_DIR = BASE_DIR / "public"
+EXPORT_STATE_FILE = ".feed-export.json"
+# File suffixes nginx gzip_static / brotli_static look for
+VARIANT_SUFFIXES = {"gzip": ".gz", "br": ".br"}
 
 logger = logging.getLogger(__name__)
 
@@ -34,9 +57,24 @@ def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Generate or update podcast RSS feed.")
     parser.add_argument("--force", action="store_true", help="Transcode audio to MP3 (192 kbps)")
     parser.add_argument("--dry-run", action="store_true", help="Print RSS to stdout without writing feed.xml")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the build manifest and re-read every episode")
+    parser.add_argument("--jobs", type=int, help="Parallel transcodes with --force (default: 1, serial); also the default of export --jobs")
     parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
     parser.add_argument("--check-domain", action="store_true", help="Verify that feed_url is reachable (HTTP 200)")
-    parser.add_argument("--enable-analytics", action="store_true", help="(Reserved) Enable Spotipy analytics integration")
+    parser.add_argument("--enable-analytics", action="store_true", help="(Reserved) Enable Spotipy analytics integration; download analytics are recorded by app.py --enable-analytics")
+
+    subparsers = parser.add_subparsers(dest="command")
+    export = subparsers.add_parser("export", help="Render every show under shows/ into static feed files")
+    export.add_argument("--out", type=Path, help=f"Output directory (env FEED_EXPORT_DIR, default: {DEFAULT_EXPORT_DIR})")
+    export.add_argument("--base-url", help="Public scheme+host used in feed URLs, e.g. https://podcast.example.com (env PUBLIC_BASE_URL)")
+    # Own dest: a subparser default would overwrite `publisher.py --jobs N export`
+    export.add_argument("--jobs", dest="export_jobs", type=int, help="Number of worker processes (default: top-level --jobs, else the CPU count)")
+    export.add_argument("--full", action="store_true", help="Re-render every show even if its inputs are unchanged")
+    export.add_argument("shows", nargs="*", help="Only export these show ids (default: all)")
+    subparsers.add_parser("rebuild-catalog", help="Rebuild the SQLite catalog (CATALOG_DB) from shows/ on disk")
+    migrate = subparsers.add_parser("migrate-metadata", help="Convert shows between per-episode metadata.json files and one compact episodes.jsonl")
+    migrate.add_argument("--to", required=True, choices=["compact", "dirs"], help="Target layout")
+    migrate.add_argument("shows", nargs="*", help="Only migrate these show ids (default: all)")
     return parser.parse_args()
 
 
@@ -52,8 +90,7 @@ def load_config() -> dict:
     if not CONFIG_FILE.exists():
         logger.error("Config file %s not found. Create it based on feedgen_config.example.json", CONFIG_FILE)
         sys.exit(1)
-    with CONFIG_FILE.open("r", encoding="utf-8") as fp:
-        return json.load(fp)
+    return load_json(CONFIG_FILE, copy=True)
 
 
 def verify_domain(feed_url: str) -> None:
@@ -67,83 +104,193 @@ def verify_domain(feed_url: str) -> None:
         logger.error("Domain check error: %s", exc)
 
 
-def scan_episodes(force_transcode: bool, feed_url_base: str, options: dict) -> List[dict]:
-    """Return sorted list of episode dicts ready for feedgen."""
+def load_manifest() -> dict:
+    """Load the build manifest of the previous run (empty if missing or unreadable)."""
+    empty = {"format": MANIFEST_FORMAT, "episodes": {}, "feed": {}}
+    if not MANIFEST_FILE.exists():
+        return empty
+    try:
+        manifest = json.loads(MANIFEST_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        logger.warning("Ignoring unreadable build manifest %s: %s", MANIFEST_FILE, exc)
+        return empty
+    if manifest.get("format") != MANIFEST_FORMAT:
+        return empty
+    return manifest
+
+
+def save_manifest(manifest: dict) -> None:
+    data = json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True)
+    atomic_write_bytes(MANIFEST_FILE, data.encode("utf-8"))
+
+
+def _signature_json(signature: tuple) -> list:
+    """Episode dir signature in the shape it has after a JSON round trip."""
+    return [signature[0], [list(f) for f in signature[1]]]
+
+
+# Картинки эпизода, в порядке предпочтения
+EPISODE_IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+MIME_MAP = {
+    '.mp3': 'audio/mpeg',
+    '.wav': 'audio/wav',
+    '.aac': 'audio/aac',
+    '.m4a': 'audio/mp4',
+    '.ogg': 'audio/ogg',
+    '.oga': 'audio/ogg',
+    '.flac': 'audio/flac',
+    '.opus': 'audio/opus',
+}
+
+
+def scan_episodes(
+    force_transcode: bool,
+    feed_url_base: str,
+    options: dict,
+    manifest: Optional[dict] = None,
+    jobs: int = 1,
+) -> List[dict]:
+    """Return sorted list of episode dicts ready for feedgen.
+
+    With a build *manifest* (see :func:`load_manifest`) episodes whose files
+    are unchanged since the previous run are taken from it instead of being
+    re-read, and every episode keeps the GUID it was first published with.
+    The manifest is updated in place.
+
+    With *force_transcode* and ``jobs > 1`` transcodes are handed to a process
+    pool while the scan continues; results are applied in episode order.  A
+    failed transcode is logged and the episode keeps its original audio.
+    """
     episodes: List[dict] = []
     if not EPISODES_DIR.exists():
         logger.warning("Episodes directory %s does not exist", EPISODES_DIR)
         return episodes
 
-    AUDIO_EXTS = ('.mp3', '.wav', '.aac', '.m4a', '.ogg', '.oga', '.flac', '.opus')
-    IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
-    MIME_MAP = {
-        '.mp3': 'audio/mpeg',
-        '.wav': 'audio/wav',
-        '.aac': 'audio/aac',
-        '.m4a': 'audio/mp4',
-        '.ogg': 'audio/ogg',
-        '.oga': 'audio/ogg',
-        '.flac': 'audio/flac',
-        '.opus': 'audio/opus',
-    }
+    known = manifest.get("episodes", {}) if manifest is not None else {}
+    seen = {}
+    pending = []  # (ep_scan, meta, audio_entry, manifest entry, signature, transcode)
+    failures = []
+    pool: Optional[ProcessPoolExecutor] = None
 
-    for ep_dir in sorted(EPISODES_DIR.iterdir()):
-        if not ep_dir.is_dir():
-            continue
-        meta_file = ep_dir / "metadata.json"
-        if not meta_file.exists():
-            logger.warning("metadata.json missing in %s", ep_dir)
-            continue
-        with meta_file.open("r", encoding="utf-8") as fp:
-            meta = json.load(fp)
-
-        # Найти первый аудиофайл любого поддерживаемого формата
-        audio_path = None
-        for ext in AUDIO_EXTS:
-            found = list(ep_dir.glob(f'*{ext}'))
-            if found:
-                audio_path = found[0]
-                break
-        if not audio_path:
-            logger.warning("Audio file not found in %s", ep_dir)
-            continue
-
-        # MIME-тип для enclosure
-        enclosure_type = MIME_MAP.get(audio_path.suffix.lower(), 'audio/mpeg')
-
-        # Транскодирование если нужно
-        if force_transcode and audio_path.suffix.lower() != '.mp3':
-            audio_path = transcode_wav_to_mp3(audio_path)
-            enclosure_type = 'audio/mpeg'
-
-        file_size = audio_path.stat().st_size
-        ep_id = ep_dir.name
-        media_url = f"{feed_url_base}/episodes/{ep_id}/{audio_path.name}"
-
-        # Найти первую картинку любого формата
-        episode_image = None
-        for ext in IMAGE_EXTS:
-            found = list(ep_dir.glob(f'*{ext}'))
-            if found:
-                episode_image = found[0].name
-                break
-
-        meta.update({
-            "id": ep_id,
-            "audio_path": audio_path,
-            "file_size": file_size,
-            "media_url": media_url,
-            "enclosure_type": enclosure_type,
-            "episode_image": episode_image,
-        })
-        episodes.append(meta)
+    try:
+        # Один проход os.scandir на каталог эпизода вместо glob() на каждое расширение
+        for ep_scan in scan_subdirs(scan_dir(EPISODES_DIR)):
+            ep_dir = ep_scan.path
+            ep_id = ep_dir.name
+            signature = _signature_json(episode_signature(ep_scan))
+            cached = known.get(ep_id) or {}
+            cached_ep = cached.get("episode")
+            if cached_ep and cached.get("signature") == signature and cached.get("base") == feed_url_base \
+                    and not (force_transcode and cached_ep["enclosure_type"] != "audio/mpeg"):
+                # Файлы эпизода не менялись с прошлого запуска
+                episodes.append(dict(cached_ep, audio_path=Path(cached_ep["audio_path"])))
+                seen[ep_id] = cached
+                continue
+
+            meta = read_episode_meta(ep_dir, copy=True)
+            if meta is None:
+                logger.warning("metadata.json missing in %s", ep_dir)
+                continue
+
+            # Найти первый аудиофайл любого поддерживаемого формата
+            audio_entry = ep_scan.first_audio()
+            if not audio_entry:
+                logger.warning("Audio file not found in %s", ep_dir)
+                continue
+
+            # Транскодирование если нужно: в пуле процессов, пока сканирование идёт дальше
+            transcode = None
+            if force_transcode and audio_entry.suffix != '.mp3':
+                if jobs > 1:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(max_workers=jobs)
+                    transcode = pool.submit(transcode_audio_to_mp3, audio_entry.path)
+                else:
+                    transcode = _transcode_now(audio_entry.path)
+            pending.append((ep_scan, meta, audio_entry, cached, signature, transcode))
+
+        # Результаты применяются в порядке эпизодов, а не в порядке завершения
+        for ep_scan, meta, audio_entry, cached, signature, transcode in pending:
+            audio_path = audio_entry.path
+            enclosure_type = MIME_MAP.get(audio_entry.suffix, 'audio/mpeg')
+            if transcode is not None:
+                try:
+                    audio_path = Path(transcode.result())
+                    enclosure_type = 'audio/mpeg'
+                    logger.info("Transcoded %s → %s", audio_entry.path, audio_path.name)
+                except Exception as exc:
+                    logger.error("Transcoding failed for %s: %s", audio_entry.path, exc)
+                    failures.append(audio_entry.path)
+            _add_episode(ep_scan, meta, audio_entry, audio_path, enclosure_type, cached, signature, feed_url_base, episodes, seen)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    if failures:
+        logger.error(
+            "Transcoding failed for %d file(s), published with the original audio: %s",
+            len(failures), ", ".join(str(f) for f in failures),
+        )
+    if manifest is not None:
+        manifest["episodes"] = seen
 
     # Sort by pubDate descending
     episodes.sort(key=lambda x: x.get("pubDate", ""), reverse=True)
     return episodes
 
 
-def generate_rss(config: dict, episodes: List[dict]) -> str:
+def _transcode_now(source: Path) -> Future:
+    """Transcode *source* in this process (``--jobs 1``), wrapped in a completed Future."""
+    future: Future = Future()
+    try:
+        future.set_result(transcode_audio_to_mp3(source))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
+
+
+def _add_episode(ep_scan, meta: dict, audio_entry, audio_path: Path, enclosure_type: str, cached: dict,
+                 signature: list, feed_url_base: str, episodes: List[dict], seen: dict) -> None:
+    """Complete *meta* with enclosure/cover/GUID fields and record it in the manifest."""
+    ep_dir = ep_scan.path
+    ep_id = ep_dir.name
+    file_size = audio_path.stat().st_size if audio_path != audio_entry.path else audio_entry.size
+    media_url = f"{feed_url_base}/episodes/{ep_id}/{audio_path.name}"
+
+    # Найти первую картинку любого формата
+    episode_image = None
+    for ext in EPISODE_IMAGE_EXTS:
+        found = ep_scan.first_image((ext,))
+        if found:
+            episode_image = found.name
+            break
+
+    # GUID must never change once published, otherwise aggregators
+    # treat the item as a new episode and download it again
+    guid = meta.get("guid") or cached.get("guid") or generate_guid(seed=media_url.rsplit("/", 1)[0])
+
+    meta.update({
+        "id": ep_id,
+        "guid": guid,
+        "audio_path": audio_path,
+        "file_size": file_size,
+        "media_url": media_url,
+        "enclosure_type": enclosure_type,
+        "episode_image": episode_image,
+    })
+    episodes.append(meta)
+    if audio_path != audio_entry.path:
+        # Transcoding added a file; re-scan so the next run sees an unchanged dir
+        signature = _signature_json(scan_dir(ep_dir).signature())
+    seen[ep_id] = {
+        "signature": signature,
+        "base": feed_url_base,
+        "guid": guid,
+        "episode": dict(meta, audio_path=str(audio_path)),
+    }
+
+
+def generate_rss(config: dict, episodes: List[dict], last_build: Optional[datetime] = None) -> str:
     fg = FeedGenerator()
     fg.load_extension("podcast")  # feedgen >=0.9.0
 
@@ -176,10 +323,13 @@ def generate_rss(config: dict, episodes: List[dict]) -> str:
 
     fg.link(href=rss_cfg["feed_url"], rel="self")
     fg.ttl(rss_cfg.get("ttl", 60))
+    if last_build is not None:
+        # Одинаковые входные файлы → байт-в-байт одинаковый feed.xml
+        fg.lastBuildDate(last_build)
 
     for ep in episodes:
         fe = fg.add_entry()
-        fe.id(ep.get("guid") or generate_guid())
+        fe.id(ep.get("guid") or generate_guid(seed=ep["media_url"].rsplit("/", 1)[0]))
         fe.title(ep["title"])
         fe.description(ep["description"])
         fe.pubDate(datetime.fromisoformat(ep["pubDate"]))
@@ -195,32 +345,236 @@ def generate_rss(config: dict, episodes: List[dict]) -> str:
     return fg.rss_str(pretty=True).decode("utf-8")
 
 
+def _export_path(show_id: str, page: Optional[int]) -> str:
+    """Output path of a feed document relative to the export root.
+
+    Mirrors the app routes (``/shows/<id>/feed.xml``, ``/shows/<id>/feed/page/<n>.xml``)
+    so the export directory can be used as nginx ``root`` as-is.
+    """
+    if page is None:
+        return f"shows/{show_id}/feed.xml"
+    return f"shows/{show_id}/feed/page/{page}.xml"
+
+
+def _remove_exported(out_dir: Path, files: List[str]) -> None:
+    for rel in files:
+        path = out_dir / rel
+        path.unlink(missing_ok=True)
+        # Drop directories left empty (feed/page/, feed/, shows/<id>/)
+        for parent in path.parents:
+            if parent == out_dir or not parent.is_relative_to(out_dir):
+                break
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+
+
+def export_show(show_id: str, out_dir: Path, base_url: str, previous: Optional[dict], dry_run: bool = False) -> dict:
+    """Render one show's feed (and archive pages) into *out_dir*.
+
+    Runs in a worker process.  Returns ``{"show_id", "status", "state"}`` where
+    status is ``unchanged``, ``exported`` or ``failed`` and state is the
+    manifest entry to persist for the next run.
+    """
+    show_dir = SHOWS_DIR / show_id
+    try:
+        fp = show_fingerprint(show_dir)
+        state = {
+            "digest": fp.digest,
+            "format": FEED_FORMAT_VERSION,
+            "base_url": base_url,
+            "encodings": list(FEED_ENCODINGS),
+        }
+        if previous and all(previous.get(k) == v for k, v in state.items()) \
+                and all((out_dir / rel).exists() for rel in previous.get("files", [])):
+            return {"show_id": show_id, "status": "unchanged", "state": previous}
+        if dry_run:
+            return {"show_id": show_id, "status": "exported", "state": previous}
+
+        files: List[str] = []
+        # Archive pages get the mtime of their own episodes, so nginx's
+        # ETag/Last-Modified of a page only change when the page does
+        for page, page_modified, chunks in iter_feed_documents(show_id, show_dir, base_url, fp.last_modified):
+            rel = _export_path(show_id, page)
+            body, variants = encode_feed(chunks)
+            # Compressed variants first, so the plain file never points at stale .gz/.br
+            for encoding, data in variants.items():
+                atomic_write_bytes(out_dir / (rel + VARIANT_SUFFIXES[encoding]), data, page_modified)
+                files.append(rel + VARIANT_SUFFIXES[encoding])
+            atomic_write_bytes(out_dir / rel, body, page_modified)
+            files.append(rel)
+
+        # Archive pages or variants that no longer exist
+        if previous:
+            _remove_exported(out_dir, [rel for rel in previous.get("files", []) if rel not in files])
+        state["files"] = files
+        return {"show_id": show_id, "status": "exported", "state": state}
+    except Exception as exc:
+        logger.error("Export of show %s failed: %s", show_id, exc, exc_info=True)
+        return {"show_id": show_id, "status": "failed", "state": previous}
+
+
+def export_feeds(args: argparse.Namespace) -> int:
+    """``publisher.py export``: write static feeds for nginx; returns the exit code."""
+    # Env fallbacks are read here, after load_env() has loaded .env
+    base_url = (args.base_url or os.getenv("PUBLIC_BASE_URL") or "").rstrip("/")
+    if not base_url:
+        logger.error("--base-url (or PUBLIC_BASE_URL) is required, e.g. https://podcast.example.com")
+        return 2
+    out_dir = Path(args.out or os.getenv("FEED_EXPORT_DIR") or DEFAULT_EXPORT_DIR).resolve()
+    state_path = out_dir / EXPORT_STATE_FILE
+
+    manifest = {"shows": {}}
+    if state_path.exists():
+        try:
+            manifest = json.loads(state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            logger.warning("Ignoring unreadable export state %s: %s", state_path, exc)
+    previous = {} if args.full else manifest.get("shows", {})
+
+    show_ids = sorted(d.name for d in SHOWS_DIR.iterdir() if (d / "config.json").is_file()) if SHOWS_DIR.exists() else []
+    if args.shows:
+        unknown = sorted(set(args.shows) - set(show_ids))
+        if unknown:
+            logger.error("Unknown show(s): %s", ", ".join(unknown))
+            return 2
+        show_ids = [s for s in show_ids if s in args.shows]
+
+    jobs = max(1, min(args.export_jobs or args.jobs or os.cpu_count() or 1, len(show_ids) or 1))
+    task_args = [(sid, out_dir, base_url, previous.get(sid), args.dry_run) for sid in show_ids]
+    if jobs == 1:
+        results = [export_show(*a) for a in task_args]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(export_show, *zip(*task_args)))
+
+    shows_state = dict(manifest.get("shows", {}))
+    counts = {"exported": 0, "unchanged": 0, "failed": 0, "removed": 0}
+    for res in results:
+        counts[res["status"]] += 1
+        if res["state"]:
+            shows_state[res["show_id"]] = res["state"]
+        logger.debug("%s: %s", res["show_id"], res["status"])
+
+    # Feeds of deleted shows (only on a full-tree run)
+    if not args.shows:
+        for show_id in sorted(set(shows_state) - set(show_ids)):
+            if not args.dry_run:
+                _remove_exported(out_dir, shows_state[show_id].get("files", []))
+            del shows_state[show_id]
+            counts["removed"] += 1
+
+    if not args.dry_run:
+        atomic_write_bytes(state_path, json.dumps({"shows": shows_state}, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8"))
+    logger.info(
+        "Feed export to %s%s: %d exported, %d unchanged, %d removed, %d failed",
+        out_dir, " (dry run)" if args.dry_run else "",
+        counts["exported"], counts["unchanged"], counts["removed"], counts["failed"],
+    )
+    return 1 if counts["failed"] else 0
+
+
+def rebuild_catalog() -> int:
+    from catalog import get_catalog
+
+    catalog = get_catalog()
+    counts = catalog.rebuild()
+    logger.info("Catalog %s: %d shows, %d episodes", catalog.db_path, counts["shows"], counts["episodes"])
+    return 0
+
+
+def migrate_metadata(args: argparse.Namespace) -> int:
+    """``publisher.py migrate-metadata``: switch shows between metadata layouts."""
+    from catalog import get_catalog
+    from metadata_store import COMPACT_FILE, migrate_to_compact, migrate_to_dirs
+
+    show_ids = sorted(d.name for d in SHOWS_DIR.iterdir() if (d / "config.json").is_file()) if SHOWS_DIR.exists() else []
+    if args.shows:
+        unknown = sorted(set(args.shows) - set(show_ids))
+        if unknown:
+            logger.error("Unknown show(s): %s", ", ".join(unknown))
+            return 2
+        show_ids = [s for s in show_ids if s in args.shows]
+
+    failed = 0
+    for show_id in show_ids:
+        show_dir = SHOWS_DIR / show_id
+        is_compact = (show_dir / COMPACT_FILE).exists()
+        if is_compact == (args.to == "compact"):
+            logger.info("%s: already in the %s layout", show_id, args.to)
+            continue
+        try:
+            count = migrate_to_compact(show_dir) if args.to == "compact" else migrate_to_dirs(show_dir)
+        except Exception as exc:
+            failed += 1
+            logger.error("%s: migration failed: %s", show_id, exc)
+            continue
+        get_catalog().sync_show_tree(show_id)
+        logger.info("%s: %d episodes migrated to the %s layout", show_id, count, args.to)
+    return 1 if failed else 0
+
+
 def main() -> None:
     args = parse_args()
     setup_logging(args.log_level)
 
     load_env()
+    if args.command == "export":
+        sys.exit(export_feeds(args))
+    if args.command == "rebuild-catalog":
+        sys.exit(rebuild_catalog())
+    if args.command == "migrate-metadata":
+        sys.exit(migrate_metadata(args))
+
     config = load_config()
 
     if args.check_domain:
         verify_domain(config["rss"]["feed_url"])
 
+    manifest = load_manifest()
+    if args.no_cache:
+        manifest["episodes"] = {}
     episodes = scan_episodes(
         force_transcode=args.force or config["options"].get("force_transcode", False),
         feed_url_base=config["rss"]["feed_url"].rsplit("/", 1)[0],
         options=config["options"],
+        manifest=manifest,
+        jobs=max(1, args.jobs or 1),
     )
 
-    rss_content = generate_rss(config, episodes)
+    # Everything the feed is built from: config stat plus every episode's file stats
+    config_st = CONFIG_FILE.stat()
+    ep_states = manifest["episodes"]
+    inputs = hashlib.sha1(json.dumps(
+        [config_st.st_mtime_ns, config_st.st_size, sorted((k, v["signature"], v["guid"]) for k, v in ep_states.items())],
+    ).encode("utf-8")).hexdigest()
+    newest_ns = max([config_st.st_mtime_ns] + [f[1] for v in ep_states.values() for f in v["signature"][1]])
+
+    feed_state = manifest.get("feed", {})
+    if not args.dry_run and not args.no_cache and feed_state.get("inputs") == inputs and FEED_FILE.exists() \
+            and FEED_FILE.stat().st_size == feed_state.get("size"):
+        logger.info("Feed is up to date (%d episodes), nothing to do", len(episodes))
+        save_manifest(manifest)
+        return
+
+    rss_content = generate_rss(config, episodes, datetime.fromtimestamp(newest_ns / 1e9, tz=timezone.utc))
 
     if args.dry_run:
         print(rss_content)
         return
 
-    feed_path = BASE_DIR / "feed.xml"
-    feed_path.write_text(rss_content, encoding="utf-8")
-    logger.info("RSS written to %s", feed_path)
-    send_email("Podcast RSS updated", f"Feed updated with {len(episodes)} episodes at {datetime.utcnow()}")
+    data = rss_content.encode("utf-8")
+    changed = not FEED_FILE.exists() or FEED_FILE.read_bytes() != data
+    if changed:
+        atomic_write_bytes(FEED_FILE, data)
+        logger.info("RSS written to %s", FEED_FILE)
+    manifest["feed"] = {"inputs": inputs, "size": len(data)}
+    save_manifest(manifest)
+    if changed:
+        send_email("Podcast RSS updated", f"Feed updated with {len(episodes)} episodes at {datetime.utcnow()}")
+    else:
+        logger.info("Feed content unchanged, %s left as is", FEED_FILE)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+"""Single-pass directory scanner for show and episode directories.
+
+Every place that needs to know what is inside a show or episode directory
+(audio file, covers, metadata, file stats) goes through :func:`scan_dir`:
+one ``os.scandir`` call per directory, one ``stat`` per entry, and the result
+is classified in memory instead of re-listing the directory with ``glob`` or
+``iterdir`` for every extension we look for.  On network storage (NFS) the
+number of directory reads and ``stat`` calls is what dominates page and feed
+render times.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+# Audio formats accepted for episodes, in the order publisher.py prefers them
+AUDIO_EXTS = ('.mp3', '.wav', '.aac', '.m4a', '.ogg', '.oga', '.flac', '.opus')
+# Raster formats usable as RSS / iTunes artwork
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp')
+# Everything the web UI shows as a cover (browsers also render svg/ico)
+COVER_EXTS = IMAGE_EXTS + ('.svg', '.ico')
+
+
+@dataclass(frozen=True)
+class FileEntry:
+    name: str
+    path: Path
+    mtime_ns: int
+    size: int
+
+    @property
+    def suffix(self) -> str:
+        return os.path.splitext(self.name)[1].lower()
+
+    @property
+    def mtime(self) -> float:
+        return self.mtime_ns / 1e9
+
+
+@dataclass
+class DirScan:
+    """Contents of one directory, files and subdirectories sorted by name."""
+
+    path: Path
+    mtime_ns: int
+    files: Dict[str, FileEntry] = field(default_factory=dict)
+    dirs: Dict[str, int] = field(default_factory=dict)  # subdirectory name → mtime_ns
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def mtime(self) -> float:
+        return self.mtime_ns / 1e9
+
+    def get(self, name: str) -> Optional[FileEntry]:
+        return self.files.get(name)
+
+    def has(self, name: str) -> bool:
+        return name in self.files
+
+    def with_suffix(self, exts: Iterable[str], skip_hidden: bool = False) -> Iterator[FileEntry]:
+        """Yield files whose (lower-case) extension is in *exts*, by name."""
+        exts = tuple(exts)
+        for entry in self.files.values():
+            if skip_hidden and entry.name.startswith('.'):
+                continue
+            if entry.suffix in exts:
+                yield entry
+
+    def first_image(self, exts: Iterable[str] = IMAGE_EXTS, skip_hidden: bool = False) -> Optional[FileEntry]:
+        return next(self.with_suffix(exts, skip_hidden), None)
+
+    def first_audio(self) -> Optional[FileEntry]:
+        """First audio file, preferring extensions in :data:`AUDIO_EXTS` order."""
+        for ext in AUDIO_EXTS:
+            for entry in self.with_suffix((ext,)):
+                return entry
+        return None
+
+    def newest_mtime(self) -> float:
+        return max((f.mtime_ns for f in self.files.values()), default=self.mtime_ns) / 1e9
+
+    def signature(self) -> tuple:
+        """``(dir mtime_ns, ((name, mtime_ns, size), ...))`` — changes whenever any file does."""
+        return (self.mtime_ns, tuple((f.name, f.mtime_ns, f.size) for f in self.files.values()))
+
+
+def scan_dir(path: Path, mtime_ns: Optional[int] = None) -> DirScan:
+    """List *path* once and stat every entry.
+
+    *mtime_ns* of the directory itself can be passed in when it is already
+    known from the parent's scan, which saves one more ``stat``.
+    """
+    path = Path(path)
+    if mtime_ns is None:
+        mtime_ns = os.stat(path).st_mtime_ns
+    files = []
+    dirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    dirs.append((entry.name, entry.stat().st_mtime_ns))
+                elif entry.is_file():
+                    st = entry.stat()
+                    files.append(FileEntry(entry.name, Path(entry.path), st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                continue  # removed while we were listing
+    files.sort(key=lambda f: f.name)
+    dirs.sort()
+    return DirScan(path, mtime_ns, {f.name: f for f in files}, dict(dirs))
+
+
+def scan_subdirs(parent: DirScan, names: Optional[Iterable[str]] = None) -> Iterator[DirScan]:
+    """Scan the subdirectories of *parent* (all of them, or just *names*), by name."""
+    for name in (parent.dirs if names is None else names):
+        try:
+            yield scan_dir(parent.path / name, parent.dirs.get(name))
+        except FileNotFoundError:
+            continue
+
+
+def scan_episodes(show_dir: Path, show_scan: Optional[DirScan] = None) -> Iterator[DirScan]:
+    """Scan every episode directory of a show, sorted by episode id."""
+    show_scan = show_scan or scan_dir(show_dir)
+    if "episodes" not in show_scan.dirs:
+        return iter(())
+    return scan_subdirs(scan_dir(show_scan.path / "episodes", show_scan.dirs["episodes"]))
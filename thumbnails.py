@@ -0,0 +1,135 @@
+"""Cover thumbnails and blur placeholders for the admin pages.
+
+Covers are stored at 1400–3000 px (``utils.resize_cover_image``) for podcast
+directories, but the show list, the show page and the episode cards draw
+them at 36–180 px.  This module derives fixed-size thumbnails
+(:data:`THUMB_SIZES`) in AVIF (when Pillow has it), WebP or JPEG, picked
+from the request's ``Accept`` header, plus a ~16 px WebP (~150 bytes) used as
+an inline blur placeholder while the thumbnail loads.
+
+Derivatives are named after the content fingerprint of the source cover
+(:mod:`fingerprint`), so they never go stale: a new cover gets new files and
+new URLs.  They are written once to THUMB_DIR; the directory can be deleted
+at any time and is refilled on demand.
+"""
+from __future__ import annotations
+
+import base64
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Tuple
+
+from PIL import Image, ImageOps, features
+
+from scanner import IMAGE_EXTS
+
+BASE_DIR = Path(__file__).resolve().parent
+THUMB_DIR = Path(os.getenv("THUMB_DIR", BASE_DIR / "data" / "thumbs"))
+
+THUMB_SIZES = (150, 300, 600)
+PLACEHOLDER_SIZE = 16
+
+try:
+    AVIF_SUPPORTED = bool(features.check("avif"))
+except ValueError:  # Pillow without the "avif" feature name
+    AVIF_SUPPORTED = False
+
+# format name → (MIME type, file extension, Pillow save options)
+THUMB_FORMATS = {
+    "avif": ("image/avif", "avif", {"quality": 55}),
+    "webp": ("image/webp", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("image/jpeg", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# Preferred first; JPEG is always acceptable
+_NEGOTIATED = ("avif", "webp") if AVIF_SUPPORTED else ("webp",)
+
+# Striped locks: concurrent requests for one derivative render it once
+_locks = [threading.Lock() for _ in range(16)]
+_placeholders: "OrderedDict[str, str]" = OrderedDict()
+_placeholders_lock = threading.Lock()
+PLACEHOLDER_CACHE_SIZE = 5000
+
+
+def negotiate_format(accept: Iterable[Tuple[str, float]]) -> str:
+    """Best thumbnail format for an ``Accept`` header (werkzeug ``MIMEAccept``).
+
+    AVIF and WebP are only sent to clients that name them explicitly: a bare
+    ``*/*`` does not mean the client can decode them.
+    """
+    accepted = {value.lower() for value, quality in accept if quality > 0}
+    for fmt in _NEGOTIATED:
+        if THUMB_FORMATS[fmt][0] in accepted:
+            return fmt
+    return "jpeg"
+
+
+def _derivative_path(fingerprint: str, name: str) -> Path:
+    return THUMB_DIR / fingerprint[:2] / f"{fingerprint}-{name}"
+
+
+def _open_scaled(src: Path, size: int) -> Image.Image:
+    """Load *src* reduced to fit *size*×*size* (never enlarged), upright."""
+    with Image.open(src) as img:
+        img.draft("RGB", (size, size))  # JPEG: decode at a reduced scale
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+        img.thumbnail((size, size), Image.LANCZOS)
+        return img
+
+
+def _save(img: Image.Image, path: Path, fmt: str, **options) -> None:
+    """Write *img* to *path* atomically (readers never see a partial file)."""
+    if fmt == "jpeg" and img.mode != "RGB":
+        img = img.convert("RGB")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        img.save(tmp, format=fmt.upper(), **(options or THUMB_FORMATS[fmt][2]))
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def thumbnail(src: Path, fingerprint: str, size: int, fmt: str) -> Path:
+    """Path of the *size* px *fmt* thumbnail of cover *src*, rendering it if needed.
+
+    *fingerprint* must be the current content fingerprint of *src*.  Raises
+    ``ValueError`` for an unknown size or format and ``OSError`` if *src*
+    cannot be read as an image.
+    """
+    if size not in THUMB_SIZES or fmt not in THUMB_FORMATS:
+        raise ValueError(f"unsupported thumbnail {size} {fmt}")
+    path = _derivative_path(fingerprint, f"{size}.{THUMB_FORMATS[fmt][1]}")
+    if path.exists():
+        return path
+    with _locks[zlib.crc32(path.name.encode()) % len(_locks)]:
+        if not path.exists():
+            _save(_open_scaled(src, size), path, fmt)
+    return path
+
+
+def placeholder(src: Path, fingerprint: str) -> str:
+    """``data:`` URI of a tiny WebP of cover *src*, drawn blurred until the thumbnail loads."""
+    with _placeholders_lock:
+        uri = _placeholders.get(fingerprint)
+        if uri is not None:
+            _placeholders.move_to_end(fingerprint)
+            return uri
+    path = _derivative_path(fingerprint, "placeholder.webp")
+    if not path.exists():
+        _save(_open_scaled(src, PLACEHOLDER_SIZE), path, "webp", quality=40)
+    data = path.read_bytes()
+    uri = "data:image/webp;base64," + base64.b64encode(data).decode("ascii")
+    with _placeholders_lock:
+        _placeholders[fingerprint] = uri
+        while len(_placeholders) > PLACEHOLDER_CACHE_SIZE:
+            _placeholders.popitem(last=False)
+    return uri
+
+
+def is_thumbnailable(filename: str) -> bool:
+    """Raster covers get thumbnails; SVG/ICO covers are used as they are."""
+    return os.path.splitext(filename)[1].lower() in IMAGE_EXTS
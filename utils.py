@@ -2,9 +2,12 @@
 from __future__ import annotations
 
 import os
+import hashlib
 import logging
 import subprocess
+import threading
 import uuid
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional
 from PIL import Image
@@ -24,11 +27,61 @@ def load_env(env_path: Optional[Path] = None) -> None:
         logger.debug("No .env file found at %s", env_file)
 
 
-def generate_guid() -> str:
-    """Generate a unique GUID for an episode item."""
+def generate_guid(seed: Optional[str] = None) -> str:
+    """Generate a unique GUID for an episode item.
+
+    With *seed* (e.g. the episode URL) the GUID is derived from it (UUIDv5),
+    so the same episode always gets the same GUID.
+    """
+    if seed:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, seed))
     return str(uuid.uuid4())
 
 
+def atomic_write_bytes(path: Path, data: bytes, mtime: Optional[float] = None, keep_dir_mtime: bool = False,
+                       create_dirs: bool = True) -> None:
+    """Write *data* to *path* atomically (temp file in the same dir + ``os.replace``).
+
+    Readers (e.g. nginx serving exported feeds) see either the old or the new
+    file, never a partially written one.  If *mtime* is given it is applied to
+    the file, so ``Last-Modified`` reflects the content rather than the write.
+
+    Creating and renaming the temp file bumps the mtime of the directory.
+    With *keep_dir_mtime*, replacing an existing file restores it afterwards,
+    as an in-place rewrite would have left it: episode directories' mtimes
+    are their fallback pubDate and the admin "mtime" sort key.
+
+    Without *create_dirs* a missing parent directory raises
+    ``FileNotFoundError`` instead of being created.
+    """
+    path = Path(path)
+    if create_dirs:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    dir_st = None
+    if keep_dir_mtime and path.exists():
+        dir_st = os.stat(path.parent)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        if mtime is not None:
+            os.utime(tmp, (mtime, mtime))
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    if dir_st is not None:
+        # The directory lists the same names as before.  A file created in it
+        # by someone else during these few syscalls loses its mtime bump,
+        # but every cache signature includes per-file stats as well.
+        try:
+            os.utime(path.parent, ns=(dir_st.st_atime_ns, dir_st.st_mtime_ns))
+        except OSError:
+            pass
+
+
 MIN_PODCAST_BITRATE = 160  # kbps – minimum recommended for podcast platforms
 
 
@@ -641,6 +694,86 @@ def sanitize_html_for_rss(html: str) -> str:
     cleaned = unicodedata.normalize("NFC", cleaned).strip()
     return cleaned
 
+
+# Bump whenever sanitize_html_for_rss output changes: feed-ready fields stored
+# by an older sanitizer are then ignored and recomputed on the next write
+RSS_SANITIZER_VERSION = "1"
+# Key in metadata.json holding the feed-ready description/summary
+FEED_HTML_KEY = "feed_html"
+SANITIZE_CACHE_SIZE = int(os.getenv("SANITIZE_CACHE_SIZE", "4096"))
+
+_sanitized: "OrderedDict[bytes, str]" = OrderedDict()
+_sanitized_lock = threading.Lock()
+
+
+def sanitize_html_for_rss_cached(html) -> str:
+    """:func:`sanitize_html_for_rss` through an LRU keyed by a hash of the input.
+
+    Used for records without precomputed feed fields (legacy metadata, show
+    descriptions), so bleach runs once per distinct text, not per render.
+    """
+    if not html:
+        return ""
+    key = hashlib.sha1(f"{RSS_SANITIZER_VERSION}\0{html}".encode("utf-8", "surrogatepass")).digest()
+    with _sanitized_lock:
+        cleaned = _sanitized.get(key)
+        if cleaned is not None:
+            _sanitized.move_to_end(key)
+            return cleaned
+    cleaned = sanitize_html_for_rss(html)
+    with _sanitized_lock:
+        _sanitized[key] = cleaned
+        while len(_sanitized) > SANITIZE_CACHE_SIZE:
+            _sanitized.popitem(last=False)
+    return cleaned
+
+
+def _feed_html_source(meta: dict) -> str:
+    raw = json.dumps([meta.get("description"), meta.get("summary")], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+
+
+def add_feed_html(meta: dict) -> None:
+    """Store the feed-ready (sanitized) description and summary in *meta*.
+
+    Called on every episode metadata write; bleach only runs if the
+    description or summary changed since the stored copy was made.  Episodes
+    without their own description fall back to the show's at render time,
+    so nothing is stored for them.
+    """
+    if "description" not in meta:
+        meta.pop(FEED_HTML_KEY, None)
+        return
+    source = _feed_html_source(meta)
+    stored = meta.get(FEED_HTML_KEY)
+    if isinstance(stored, dict) and stored.get("sanitizer") == RSS_SANITIZER_VERSION and stored.get("source") == source:
+        return
+    description = sanitize_html_for_rss_cached(meta["description"])
+    meta[FEED_HTML_KEY] = {
+        "sanitizer": RSS_SANITIZER_VERSION,
+        "source": source,
+        "description": description,
+        "summary": sanitize_html_for_rss_cached(meta.get("summary", description)),
+    }
+
+
+def feed_html(meta: dict, fallback_description: str = "") -> tuple[str, str]:
+    """Return ``(description, summary)`` of an episode ready for its RSS item.
+
+    Uses the fields stored by :func:`add_feed_html` when they were made by the
+    current sanitizer from the current text, the hash-keyed LRU otherwise.
+    """
+    stored = meta.get(FEED_HTML_KEY)
+    if (
+        isinstance(stored, dict)
+        and "description" in meta
+        and stored.get("sanitizer") == RSS_SANITIZER_VERSION
+        and stored.get("source") == _feed_html_source(meta)
+    ):
+        return stored["description"], stored["summary"]
+    description = sanitize_html_for_rss_cached(meta.get("description", fallback_description))
+    return description, sanitize_html_for_rss_cached(meta.get("summary", description))
+
 def send_email(subject: str, body: str) -> None:
     """Send a notification email using SMTP credentials from environment variables."""
     import smtplib